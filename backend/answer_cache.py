@@ -0,0 +1,117 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from config import (
+    ANSWER_CACHE_TTL,
+    ANSWER_CACHE_MAX_ENTRIES,
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_SEMANTIC_PER_REPO,
+)
+
+# Two-layer cache for /query answers, scoped to a repo's index version so a
+# re-index can never serve answers built from the old code:
+#   exact:    (repo_id, version, normalized question) -> answer, checked before
+#             any embedding/search/generation work
+#   semantic: per-repo matrix of question embeddings; a new question whose
+#             cosine similarity to a cached one is >= the threshold reuses
+#             its answer, skipping vector search and generation; one row
+#             per normalized question, so asking again replaces it
+
+
+def normalize_question(question: str) -> str:
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+class _SemanticEntries:
+    def __init__(self, version, dim):
+        self.version = version
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.entries = []  # (answer, expires_at), row-aligned with vectors
+        self.questions = []  # normalized, row-aligned with vectors
+
+
+class AnswerCache:
+    def __init__(
+        self,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        threshold: float = ANSWER_CACHE_SIMILARITY,
+        semantic_per_repo: int = ANSWER_CACHE_SEMANTIC_PER_REPO,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.semantic_per_repo = semantic_per_repo
+        self.exact = OrderedDict()
+        self.semantic = {}
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        self.lock = threading.Lock()
+
+    def get_exact(self, repo_id, version, question):
+        key = (repo_id, version, normalize_question(question))
+        with self.lock:
+            hit = self.exact.get(key)
+            if hit and hit[1] > time.monotonic():
+                self.exact.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return hit[0]
+            if hit:
+                del self.exact[key]
+            return None
+
+    def get_similar(self, repo_id, version, embedding):
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self.lock:
+            bucket = self.semantic.get(repo_id)
+            if bucket is None or bucket.version != version or not bucket.entries:
+                self.stats["misses"] += 1
+                return None
+            scores = bucket.vectors @ query
+            now = time.monotonic()
+            for row in np.argsort(-scores):
+                if scores[row] < self.threshold:
+                    break
+                answer, expires = bucket.entries[row]
+                if expires > now:
+                    self.stats["semantic_hits"] += 1
+                    return answer
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, repo_id, version, question, embedding, answer):
+        expires = time.monotonic() + self.ttl
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector = vector / (np.linalg.norm(vector) or 1.0)
+        question = normalize_question(question)
+        with self.lock:
+            key = (repo_id, version, question)
+            self.exact[key] = (answer, expires)
+            self.exact.move_to_end(key)
+            while len(self.exact) > self.max_entries:
+                self.exact.popitem(last=False)
+
+            bucket = self.semantic.get(repo_id)
+            if bucket is None or bucket.version != version or bucket.vectors.shape[1] != vector.shape[0]:
+                bucket = self.semantic[repo_id] = _SemanticEntries(version, vector.shape[0])
+            if question in bucket.questions:
+                # Replace the old row; the new one goes last, as the most recent
+                row = bucket.questions.index(question)
+                bucket.vectors = np.delete(bucket.vectors, row, axis=0)
+                del bucket.entries[row], bucket.questions[row]
+            bucket.vectors = np.vstack([bucket.vectors, vector])[-self.semantic_per_repo:]
+            bucket.entries = (bucket.entries + [(answer, expires)])[-self.semantic_per_repo:]
+            bucket.questions = (bucket.questions + [question])[-self.semantic_per_repo:]
+
+    def invalidate(self, repo_id):
+        with self.lock:
+            self.semantic.pop(repo_id, None)
+            for key in [key for key in self.exact if key[0] == repo_id]:
+                del self.exact[key]
+
+
+answer_cache = AnswerCache()
@@ -1,18 +1,25 @@
-import os
+import json
 import time
-import certifi
+import asyncio
 import logging
-import tiktoken
-from google import genai
-from main import process_repo
+from tokenizer import count_tokens
+from jobs import submit_index_job, DONE, FAILED, PROGRESS_FIELDS
+from answer_cache import answer_cache, normalize_question
+from context_builder import build_context
+from summaries import route_question, summary_answer, PATH
+from coalesce import flights, repo_status_cache, MISSING
+from lifecycle import touch_repo
+from resources import Resources, get_resources, lifespan
+from metrics import Counter, Histogram, stage, record_stage, collect_timings, server_timing, render
+from config import GENERATION_MODEL, TIMING_HEADERS, BATCH_MAX_QUESTIONS, BATCH_GENERATION_CONCURRENCY
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from pymongo import MongoClient
 from urllib.parse import urlparse
-from embedding import get_question_embedding
-from fastapi.responses import JSONResponse
+from embedding import aget_question_embedding, aget_question_embeddings
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Query
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Query, Depends
 
 
 load_dotenv()
@@ -21,15 +28,8 @@ load_dotenv()
 logger = logging.getLogger("uvicorn")
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-# MongoDB setup
-client = MongoClient(os.getenv("MONGODB_URI"), tlsCAFile=certifi.where())
-collection = client["unrepo"]["code_chunks"]
-
-# Gemini setup
-genai_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-
 # FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -42,11 +42,45 @@ allow_origins=[
     allow_headers=["*"],
 )
 
+REQUEST_SECONDS = Histogram("unrepo_http_request_seconds", "API request latency", ("method", "route", "status"))
+QUERIES = Counter("unrepo_queries_total", "Questions handled, by endpoint and result", ("endpoint", "result"))
+ANSWER_CACHE_LOOKUPS = Counter(
+    "unrepo_answer_cache_lookups_total", "Answer cache lookups", ("result",),
+    fn=lambda: {(result,): count for result, count in answer_cache.stats.items()},
+)
+
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    """
+    Records request latency and, with TIMING_HEADERS, returns the per-stage
+    breakdown as a Server-Timing header. Streaming responses only include the
+    stages that ran before the first byte.
+    """
+    timings = collect_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        elapsed, method=request.method, route=route.path if route else "unmatched", status=response.status_code
+    )
+    if TIMING_HEADERS:
+        response.headers["Server-Timing"] = server_timing({**timings, "total": elapsed})
+    return response
+
 
 class QueryRequest(BaseModel):
     question: str
     repo_url: str
 
+class BatchQueryRequest(BaseModel):
+    questions: list[str]
+    repo_url: str
+
+class RefreshRequest(BaseModel):
+    repo_url: str
+
 def get_repo_id(repo_url: str) -> str:
     parts = urlparse(repo_url).path.strip("/").split("/")
     if len(parts) != 2:
@@ -66,131 +100,501 @@ def is_valid_github_repo_url(url: str) -> bool:
         return len(parts) == 2
     except Exception:
         return False
+
+async def is_repo_indexed(res: Resources, repo_id: str) -> bool:
+    """
+    A repo is queryable once it has an index, even while a refresh job runs.
+    Repos indexed before index metadata existed have no record, so fall back
+    to the job record and finally to probing the chunks.
+    """
+    if await res.repo_indexes.find_one({"_id": repo_id}, {"_id": 1}) is not None:
+        return True
+    job = await res.index_jobs.find_one({"_id": repo_id}, {"status": 1})
+    if job is not None:
+        return job["status"] == DONE
+    return await res.chunks.find_one({"repo_id": repo_id}, {"_id": 1}) is not None
+
+def job_progress(job: dict) -> dict:
+    return {
+        "status": job["status"],
+        "error": job.get("error"),
+        **{field: job.get(field, 0) for field in PROGRESS_FIELDS},
+    }
     
 
 @app.get("/ping")
 def ping():
     return {"message": "pong"}
 
-@app.post("/query")
-def query_codebase(request: QueryRequest):
-    # Basic field validation
-    if not request.question.strip():
-        raise HTTPException(status_code=400, detail="Question cannot be empty.")
-    if not request.repo_url.strip():
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def validate_query(request: QueryRequest) -> str:
+    """
+    Rejects malformed questions and repo URLs; returns the repo id.
+    """
+    validate_question(request.question)
+    return validate_repo_url(request.repo_url)
+
+def validate_repo_url(repo_url: str) -> str:
+    if not repo_url.strip():
         raise HTTPException(status_code=400, detail="Repo URL cannot be empty.")
 
     # GitHub URL format check
-    if not is_valid_github_repo_url(request.repo_url):
+    if not is_valid_github_repo_url(repo_url):
         raise HTTPException(
             status_code=400,
             detail="Invalid GitHub repo URL. Must be of the form https://github.com/owner/repo",
         )
+    return get_repo_id(repo_url)
+
+def validate_question(question: str):
+    # Basic field validation
+    if not question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty.")
 
     # ✅ Token and length checks BEFORE any indexing
     MAX_QUESTION_CHARS = 1000
     MAX_EMBEDDING_TOKENS = 2048
-    encoding = tiktoken.get_encoding("cl100k_base")
-
-    def count_tokens(text: str) -> int:
-        return len(encoding.encode(text))
-
-    if len(request.question) > MAX_QUESTION_CHARS:
+    if len(question) > MAX_QUESTION_CHARS:
         raise HTTPException(
             status_code=400,
             detail=f"Question too long. Limit is {MAX_QUESTION_CHARS} characters.",
         )
-    if count_tokens(request.question) > MAX_EMBEDDING_TOKENS:
+    if count_tokens(question) > MAX_EMBEDDING_TOKENS:
         raise HTTPException(
             status_code=400,
             detail=f"Your question is too long. Please shorten it to stay under {MAX_EMBEDDING_TOKENS} tokens.",
         )
 
-    # Then proceed to indexing
-    repo_id = get_repo_id(request.repo_url)
-    repo_exists = collection.find_one({"repo_id": repo_id})
-
-    if not repo_exists:
-        try:
-            logger.info(f"🔍 Indexing repo: {request.repo_url}")
-            process_repo(request.repo_url)
-            # wait a short time to see if it's quickly indexed
-            time.sleep(3)
-            repo_exists = collection.find_one({"repo_id": repo_id})
-            if not repo_exists:
-                # Still not found after processing → tell frontend to wait/retry
-                return JSONResponse(
-                    status_code=202,
-                    content={
-                        "status": "indexing",
-                        "message": "Repository is being indexed. Please try again shortly.",
-                    },
-                )
+def start_indexing(request: QueryRequest, repo_id: str) -> dict:
+    try:
+        job = submit_index_job(repo_id, request.repo_url)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Failed to index repo: {str(e)}"
+        )
+    logger.info(f"🔍 Indexing repo: {request.repo_url} ({job['status']})")
+    return job
+
+def indexing_response(job: dict) -> JSONResponse:
+    # Indexing runs on the worker pool → tell frontend to wait/retry
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": "indexing",
+            "message": "Repository is being indexed. Please try again shortly.",
+            "job": job_progress(job),
+        },
+    )
 
-        except Exception as e:
-            raise HTTPException(
-                status_code=500, detail=f"Failed to index repo: {str(e)}"
-            )
-    else:
-        logger.info(f"✅ Repo already indexed: {request.repo_url}")
+async def retrieve(res: Resources, request: QueryRequest, repo_id: str, version, index_version=None):
+    """
+    Answer cache lookups, question embedding and vector search. `version` is
+    the indexed commit, `index_version` the live index build to search.
 
-    # Step 1: Get embedding for the user's question
-    embedding = get_question_embedding(request.question)
+    Returns (cached, embedding, top_chunks): `cached` is (answer, "exact",
+    "semantic" or "summary") on a cache hit or for a question answered from
+    the summary index, in which case nothing else was fetched.
+    """
+    with stage("query", "cache"):
+        cached = answer_cache.get_exact(repo_id, version, request.question)
+    if cached is not None:
+        return (cached, "exact"), None, None
+
+    # Overview and layout questions are answered from the summary index
+    route = route_question(request.question)
+    if route is not None:
+        with stage("query", "summary"):
+            answer = await find_summary(res, repo_id, version, *route)
+        if answer is not None:
+            return (answer, "summary"), None, None
+
+    # Step 1: Get embedding for the user's question (shared with identical
+    # questions in flight, for any repo)
+    question = normalize_question(request.question)
+    with stage("query", "embed"):
+        embedding = await flights.do(
+            ("embed", question), lambda: aget_question_embedding(res.models, request.question)
+        )
 
+    with stage("query", "cache"):
+        cached = answer_cache.get_similar(repo_id, version, embedding)
+    if cached is not None:
+        return (cached, "semantic"), embedding, None
 
     # Step 2: Perform vector search
-    results = collection.aggregate(
-        [
-            {
-                "$vectorSearch": {
-                    "index": "default",
-                    "path": "embedding",
-                    "queryVector": embedding,
-                    "filter": {"repo_id": repo_id},
-                    "numCandidates": 100,
-                    "limit": 5,
-                }
-            }
-        ]
-    )
-    top_chunks = list(results)
+    with stage("query", "search"):
+        top_chunks = await flights.do(
+            ("search", repo_id, index_version, question),
+            lambda: res.retriever.asearch(
+                repo_id, embedding, limit=5, num_candidates=100, text=request.question, version=index_version
+            ),
+        )
 
     if not top_chunks:
         raise HTTPException(status_code=404, detail="No relevant chunks found.")
+    return None, embedding, top_chunks
 
-    # Step 3: Combine retrieved chunks
-    context = "\n\n".join(
-        [f"{chunk['content']} (from {chunk['filepath']})" for chunk in top_chunks]
-    )
+async def find_summary(res: Resources, repo_id: str, version, route: str, path=None):
+    """
+    Answer for a routed question from the summary index of the indexed
+    commit, or None if there's no summary for it (yet).
+    """
+    node_id = f"{repo_id}/{path}" if route == PATH else repo_id
+    node = await res.summaries.find_one({"_id": node_id})
+    if node is None or node.get("commit") != version:
+        return None
+    return summary_answer(route, node)
 
-    # Step 4: Ask Gemini to summarize/answer using the context
-    prompt = f"""You are a codebase expert. Based on the following code snippets, answer the question:
+def build_prompt(question: str, context: str) -> str:
+    return f"""You are a codebase expert. Based on the following code snippets, answer the question:
 
 Context:
 {context}
 
 Question:
-{request.question}
+{question}
 
 Answer:"""
 
-    response = genai_client._models.generate_content(
-        model="gemini-2.0-flash", contents=prompt
+async def lookup_index(res: Resources, repo_id: str):
+    """
+    Index metadata of a queryable repo ({} for repos indexed before metadata
+    existed), or None. Concurrent lookups for a repo share one round trip and
+    the result is cached for REPO_STATUS_CACHE_TTL.
+    """
+    key = ("index", repo_id)
+    index = repo_status_cache.get(key, MISSING)
+    if index is not MISSING:
+        return index
+
+    async def load():
+        index = await res.repo_indexes.find_one({"_id": repo_id})
+        if index is None and await is_repo_indexed(res, repo_id):
+            index = {}
+        repo_status_cache.put(key, index)
+        return index
+
+    return await flights.do(key, load)
+
+async def find_index(res: Resources, request: QueryRequest, repo_id: str):
+    """
+    Returns (index metadata, None) for a queryable repo, or (None, the 202
+    response) after queueing an index job for it.
+    """
+    with stage("query", "find_index"):
+        index = await lookup_index(res, repo_id)
+    if index is None:
+        # Job submission does blocking Mongo writes
+        job = await flights.do(("start", repo_id), lambda: run_in_threadpool(start_indexing, request, repo_id))
+        return None, indexing_response(job)
+    if index:
+        # For least-recently-used eviction (lifecycle.py)
+        await touch_repo(res.repo_indexes, repo_id)
+    return index, None
+
+@app.post("/query")
+async def query_codebase(request: QueryRequest, res: Resources = Depends(get_resources)):
+    repo_id = validate_query(request)
+    index, indexing = await find_index(res, request, repo_id)
+
+    if indexing is not None:
+        QUERIES.inc(endpoint="query", result="indexing")
+        return indexing
+    else:
+        logger.info(f"✅ Repo already indexed: {request.repo_url}")
+
+    # Cached answers are only valid for the commit they were generated from;
+    # identical questions in flight share one answer
+    version = index.get("commit")
+    answer, kind = await flights.do(
+        ("answer", repo_id, version, normalize_question(request.question)),
+        lambda: answer_question(res, request, repo_id, version, index.get("version")),
     )
-    return {
+    if kind is not None:
+        QUERIES.inc(endpoint="query", result="summary" if kind == "summary" else "cached")
+        return {**answer, "cached": kind}
+    QUERIES.inc(endpoint="query", result="answered")
+    return answer
+
+async def answer_question(res: Resources, request: QueryRequest, repo_id: str, version, index_version=None):
+    """
+    Returns (answer, "exact"/"semantic"/"summary" for a cached answer or None).
+    """
+    cached, embedding, top_chunks = await retrieve(res, request, repo_id, version, index_version)
+    if cached is not None:
+        return cached
+
+    # Step 3: Merge the retrieved chunks into a token-budgeted context
+    with stage("query", "context"):
+        context = build_context(top_chunks)
+
+    # Step 4: Ask Gemini to summarize/answer using the context
+    with stage("query", "generate"):
+        response = await res.models.generate_content(
+            model=GENERATION_MODEL, contents=build_prompt(request.question, context["text"])
+        )
+    answer = {
         "answer": response.text,
-        "citations": list(set(
-            chunk["filepath"].replace("__", "/") for chunk in top_chunks
-        )),
+        "citations": context["citations"],
     }
+    answer_cache.put(repo_id, version, request.question, embedding, answer)
+    return answer, None
+
+
+def elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+@app.post("/query/batch")
+async def query_codebase_batch(request: BatchQueryRequest, res: Resources = Depends(get_resources)):
+    """
+    Answers several questions about one repo. The questions are embedded in
+    one call and retrieved in one search round trip, then answered with up to
+    BATCH_GENERATION_CONCURRENCY generations at a time. Each result carries
+    its own `error` instead of failing the whole batch; `timings` has the
+    shared stages and each result its generation time.
+    """
+    start = time.perf_counter()
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Questions cannot be empty.")
+    if len(request.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many questions. Limit is {BATCH_MAX_QUESTIONS} per batch.",
+        )
+    for question in request.questions:
+        validate_question(question)
+    repo_id = validate_repo_url(request.repo_url)
+
+    index, indexing = await find_index(res, request, repo_id)
+    if indexing is not None:
+        QUERIES.inc(len(request.questions), endpoint="batch", result="indexing")
+        return indexing
+
+    version = index.get("commit")
+    results = [
+        {"question": question, "answer": None, "citations": [], "cached": None, "error": None, "timings": {}}
+        for question in request.questions
+    ]
+    # Repeated questions are answered once and copied
+    first = {}
+    for i, question in enumerate(request.questions):
+        first.setdefault(normalize_question(question), i)
+    unique = sorted(first.values())
+    timings = {}
+
+    pending, routed = [], {}
+    for i in unique:
+        cached = answer_cache.get_exact(repo_id, version, request.questions[i])
+        if cached is not None:
+            results[i].update(cached, cached="exact")
+            continue
+        route = route_question(request.questions[i])
+        if route is not None:
+            routed[i] = route
+        else:
+            pending.append(i)
+    if routed:
+        # Summary lookups for every routed question at once
+        summaries = await asyncio.gather(*(find_summary(res, repo_id, version, *route) for route in routed.values()))
+        for i, summary in zip(routed, summaries):
+            if summary is not None:
+                results[i].update(summary, cached="summary")
+            else:
+                pending.append(i)
+        pending.sort()
+
+    if pending:
+        # Step 1: One embedding call for every uncached question
+        stage_start = time.perf_counter()
+        embeddings = await aget_question_embeddings(res.models, [request.questions[i] for i in pending])
+        record_stage("query", "embed", time.perf_counter() - stage_start)
+        timings["embed_ms"] = elapsed_ms(stage_start)
+        embedded = dict(zip(pending, embeddings))
+
+        to_search = []
+        for i in pending:
+            cached = answer_cache.get_similar(repo_id, version, embedded[i])
+            if cached is not None:
+                results[i].update(cached, cached="semantic")
+            else:
+                to_search.append(i)
+
+        if to_search:
+            # Step 2: One search round trip for all of them
+            stage_start = time.perf_counter()
+            found = await res.retriever.asearch_many(
+                repo_id, [embedded[i] for i in to_search], limit=5, num_candidates=100,
+                texts=[request.questions[i] for i in to_search], version=index.get("version"),
+            )
+            record_stage("query", "search", time.perf_counter() - stage_start)
+            timings["search_ms"] = elapsed_ms(stage_start)
+
+            # Steps 3-4: Bounded concurrent generations
+            semaphore = asyncio.Semaphore(BATCH_GENERATION_CONCURRENCY)
+
+            async def answer(i, top_chunks):
+                question = request.questions[i]
+                if not top_chunks:
+                    results[i]["error"] = "No relevant chunks found."
+                    return
+                context = build_context(top_chunks)
+                async with semaphore:
+                    generate_start = time.perf_counter()
+                    try:
+                        response = await res.models.generate_content(
+                            model=GENERATION_MODEL, contents=build_prompt(question, context["text"])
+                        )
+                    except Exception as e:
+                        logger.error(f"❌ Generation failed for a batched question on {repo_id}: {e}")
+                        results[i]["error"] = "Answer generation failed."
+                        return
+                    record_stage("query", "generate", time.perf_counter() - generate_start)
+                results[i]["timings"]["generate_ms"] = elapsed_ms(generate_start)
+                answered = {"answer": response.text, "citations": context["citations"]}
+                answer_cache.put(repo_id, version, question, embedded[i], answered)
+                results[i].update(answered)
+
+            await asyncio.gather(*(answer(i, top_chunks) for i, top_chunks in zip(to_search, found)))
+
+    for i, question in enumerate(request.questions):
+        source = first[normalize_question(question)]
+        if source != i:
+            results[i].update({**results[source], "question": question})
+        cached = results[i]["cached"]
+        outcome = "error" if results[i]["error"] else "summary" if cached == "summary" else "cached" if cached else "answered"
+        QUERIES.inc(endpoint="batch", result=outcome)
+
+    timings["total_ms"] = elapsed_ms(start)
+    return {"results": results, "timings": timings}
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def query_codebase_stream(request: QueryRequest, http_request: Request, res: Resources = Depends(get_resources)):
+    """
+    Same as /query, but answers as server-sent events: `citations` as soon as
+    retrieval is done, then `token` events while Gemini generates, then `done`
+    (or `error`). Generation stops when the client disconnects.
+    """
+    repo_id = validate_query(request)
+    index, indexing = await find_index(res, request, repo_id)
+    if indexing is not None:
+        QUERIES.inc(endpoint="stream", result="indexing")
+        return indexing
+
+    version = index.get("commit")
+    cached, embedding, top_chunks = await retrieve(res, request, repo_id, version, index.get("version"))
+    if cached is None:
+        with stage("query", "context"):
+            context = build_context(top_chunks)
+
+    async def events():
+        if cached is not None:
+            answer, kind = cached
+            QUERIES.inc(endpoint="stream", result="summary" if kind == "summary" else "cached")
+            yield sse("citations", {"citations": answer["citations"]})
+            yield sse("token", {"text": answer["answer"]})
+            yield sse("done", {"cached": kind})
+            return
+
+        citations = context["citations"]
+        yield sse("citations", {"citations": citations})
+        start = time.perf_counter()
+        stream = None
+        pieces = []
+        try:
+            # Opening the stream fails on 429s, auth and bad requests too
+            stream = await res.models.generate_content_stream(
+                model=GENERATION_MODEL, contents=build_prompt(request.question, context["text"])
+            )
+            async for chunk in stream:
+                if await http_request.is_disconnected():
+                    logger.info(f"🛑 Client went away, stopping generation for {repo_id}")
+                    QUERIES.inc(endpoint="stream", result="disconnected")
+                    return
+                if chunk.text:
+                    if not pieces:
+                        record_stage("query", "first_token", time.perf_counter() - start)
+                    pieces.append(chunk.text)
+                    yield sse("token", {"text": chunk.text})
+        except Exception as e:
+            logger.error(f"❌ Streaming generation failed for {repo_id}: {e}")
+            QUERIES.inc(endpoint="stream", result="error")
+            yield sse("error", {"detail": "Answer generation failed."})
+            return
+        finally:
+            # Also runs when the response task is cancelled on disconnect;
+            # closing the generator closes the HTTP stream to Gemini
+            if stream is not None:
+                await stream.aclose()
+
+        record_stage("query", "generate", time.perf_counter() - start)
+        answer = {"answer": "".join(pieces), "citations": citations}
+        answer_cache.put(repo_id, version, request.question, embedding, answer)
+        QUERIES.inc(endpoint="stream", result="answered")
+        yield sse("done", {"cached": None})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
+@app.post("/refresh")
+def refresh_repo(request: RefreshRequest):
+    """
+    Re-index only the files that changed since the repo was last indexed.
+    """
+    if not is_valid_github_repo_url(request.repo_url):
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid GitHub repo URL. Must be of the form https://github.com/owner/repo",
+        )
+    repo_id = get_repo_id(request.repo_url)
+    job = submit_index_job(repo_id, request.repo_url, refresh=True)
+    return JSONResponse(status_code=202, content={"status": "indexing", "job": job_progress(job)})
+
+
+async def repo_status(res: Resources, repo_id: str):
+    """
+    Returns (HTTP status, body) for /repo-status.
+    """
+    job = await res.index_jobs.find_one({"_id": repo_id})
+    if job is None:
+        if await res.chunks.find_one({"repo_id": repo_id}, {"_id": 1}):
+            return 200, {"status": "indexed"}
+        # Same answer as before jobs were tracked: pollers keep polling
+        return 202, {"status": "indexing"}
+    if job["status"] == DONE or await res.repo_indexes.find_one({"_id": repo_id}, {"_id": 1}) is not None:
+        return 200, {"status": "indexed", "job": job_progress(job)}
+    if job["status"] == FAILED:
+        return 500, {"status": "failed", "job": job_progress(job)}
+    return 202, {"status": "indexing", "job": job_progress(job)}
 
 @app.get("/repo-status")
-def check_repo_status(repo_id: str = Query(..., description="The repo ID (usually the repo name)")):
+async def check_repo_status(
+    repo_id: str = Query(..., description="The repo ID (usually the repo name)"),
+    res: Resources = Depends(get_resources),
+):
     """
-    Check whether a repository has been indexed.
+    Check whether a repository has been indexed, with progress from its index job.
+    Frontends poll this while indexing, so answers are shared between
+    concurrent pollers and cached for REPO_STATUS_CACHE_TTL.
     """
-    repo_exists = collection.find_one({"repo_id": repo_id})
-    if repo_exists:
-        return {"status": "indexed"}
-    return JSONResponse(status_code=202, content={"status": "indexing"})
+    key = ("status", repo_id)
+    status = repo_status_cache.get(key)
+    if status is None:
+        async def load():
+            status = await repo_status(res, repo_id)
+            repo_status_cache.put(key, status)
+            return status
+
+        status = await flights.do(key, load)
+    status_code, content = status
+    return JSONResponse(status_code=status_code, content=content)
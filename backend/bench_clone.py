@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from repo_cloner import clone_repo
+
+# Times clone strategies against a synthetic local repo served over file://.
+# Usage: python bench_clone.py --files 2000 --commits 20 --binary-mb 50
+
+
+def _git(repo_dir, *args):
+    subprocess.run(
+        ["git", "-C", repo_dir, "-c", "user.name=bench", "-c", "user.email=bench@example.com", *args],
+        check=True, capture_output=True,
+    )
+
+
+def make_repo(root, files, commits, binary_mb):
+    """
+    Builds a repo with code files rewritten across `commits` commits, plus a
+    node_modules tree and `binary_mb` MB of random binary assets.
+    """
+    src = os.path.join(root, "source")
+    os.makedirs(src)
+    _git(src, "init", "-q")
+    _git(src, "config", "uploadpack.allowFilter", "true")
+    _git(src, "config", "uploadpack.allowAnySHA1InWant", "true")
+    for commit in range(commits):
+        for i in range(files):
+            path = os.path.join(src, f"pkg{i % 50}", f"module_{i}.py")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(f"# revision {commit}\n" + f"def func_{i}(x):\n    return x * {commit}\n" * 20)
+        if commit == 0:
+            os.makedirs(os.path.join(src, "node_modules", "dep"), exist_ok=True)
+            for i in range(files // 4):
+                with open(os.path.join(src, "node_modules", "dep", f"f{i}.js"), "w") as f:
+                    f.write("module.exports = {};\n" * 50)
+            os.makedirs(os.path.join(src, "assets"), exist_ok=True)
+            for i in range(binary_mb):
+                with open(os.path.join(src, "assets", f"blob{i}.bin"), "wb") as f:
+                    f.write(os.urandom(1024 * 1024))
+        _git(src, "add", "-A")
+        _git(src, "commit", "-q", "-m", f"commit {commit}")
+    return src
+
+
+def du(path):
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            fp = os.path.join(root, name)
+            if not os.path.islink(fp):
+                total += os.path.getsize(fp)
+    return total
+
+
+def count_files(path):
+    total = 0
+    for _, dirs, names in os.walk(path):
+        if ".git" in dirs:
+            dirs.remove(".git")
+        total += len([name for name in names if name != ".git"])
+    return total
+
+
+def timed(label, fn, measure, checkout):
+    start = time.monotonic()
+    fn()
+    elapsed = round(time.monotonic() - start, 3)
+    return {"strategy": label, "seconds": elapsed, "bytes": du(measure), "checked_out_files": count_files(checkout)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark clone strategies against a local repo")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--commits", type=int, default=10)
+    parser.add_argument("--binary-mb", type=int, default=20)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench_clone_")
+    try:
+        src = make_repo(root, args.files, args.commits, args.binary_mb)
+        url = f"file://{src}"
+        cache = os.path.join(root, "cache")
+        dest = lambda name: os.path.join(root, name)
+
+        results = [
+            timed("full", lambda: clone_repo(url, dest("full"), depth=None, blob_filter=None, sparse=False, max_blob_size=None, cache_dir=None), dest("full"), dest("full")),
+            timed("shallow", lambda: clone_repo(url, dest("shallow"), depth=1, blob_filter=None, sparse=False, max_blob_size=None, cache_dir=None), dest("shallow"), dest("shallow")),
+            timed("shallow+partial+sparse", lambda: clone_repo(url, dest("sparse"), depth=1, sparse=True, cache_dir=None), dest("sparse"), dest("sparse")),
+            timed("shallow+partial+sparse, 1 MB cutoff", lambda: clone_repo(url, dest("cutoff"), depth=1, sparse=True, max_blob_size=1_000_000, cache_dir=None), dest("cutoff"), dest("cutoff")),
+            timed("mirror (cold)", lambda: clone_repo(url, dest("cold"), cache_dir=cache), cache, dest("cold")),
+        ]
+        # A new commit upstream, then a warm re-index only fetches the delta
+        with open(os.path.join(src, "pkg0", "module_0.py"), "a") as f:
+            f.write("# new change\n")
+        _git(src, "commit", "-q", "-am", "update")
+        shutil.rmtree(dest("cold"))
+        results.append(timed("mirror (warm)", lambda: clone_repo(url, dest("warm"), cache_dir=cache), cache, dest("warm")))
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,65 @@
+import sys
+import json
+import time
+import argparse
+from more_itertools import chunked
+
+from fakes import FakeEmbedder
+from embedding_engine import EmbeddingEngine
+
+# Compares the old serial embedding loop with EmbeddingEngine against a fake
+# embedder that injects latency and 429s.
+# Usage: python bench_embedding.py --chunks 2000 --latency 0.2 --rpm 600
+
+
+def make_items(n: int) -> list[dict]:
+    return [{"text": f"def f_{i}():\n    return {i}\n", "tokens": 12} for i in range(n)]
+
+
+def run_serial(items, embedder, batch_size=50, pause=0.5):
+    start = time.monotonic()
+    embedded = 0
+    for batch in chunked(items, batch_size):
+        try:
+            embedder([item["text"] for item in batch])
+            embedded += len(batch)
+        except Exception:
+            # Old behaviour: sleep and drop the batch
+            time.sleep(1)
+        time.sleep(pause)
+    elapsed = time.monotonic() - start
+    return {"chunks": embedded, "seconds": round(elapsed, 3), "chunks_per_sec": round(embedded / elapsed, 2)}
+
+
+def run_engine(items, embedder, **engine_kwargs):
+    engine = EmbeddingEngine(embedder, **engine_kwargs)
+    for _ in engine.embed(items):
+        pass
+    return engine.stats.summary()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark serial vs concurrent embedding")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--rpm", type=int, default=None, help="Fake provider quota, requests/min")
+    parser.add_argument("--rate-limit-prob", type=float, default=0.02)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--skip-serial", action="store_true")
+    args = parser.parse_args()
+
+    items = make_items(args.chunks)
+    fake = dict(latency=args.latency, jitter=args.jitter, requests_per_minute=args.rpm, rate_limit_prob=args.rate_limit_prob)
+
+    results = {}
+    if not args.skip_serial:
+        results["serial"] = run_serial(items, FakeEmbedder(**fake))
+    results["engine"] = run_engine(
+        items,
+        FakeEmbedder(**fake),
+        max_concurrency=args.concurrency,
+        requests_per_minute=args.rpm or 100_000,
+    )
+    json.dump(results, sys.stdout, indent=2)
+    print()
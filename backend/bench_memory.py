@@ -0,0 +1,112 @@
+import os
+import sys
+import json
+import shutil
+import resource
+import argparse
+import tempfile
+import subprocess
+from more_itertools import chunked
+
+# Peak RSS of the old materialize-everything ingest vs the streaming pipeline,
+# on synthetic repos of growing size. Each run happens in a fresh subprocess so
+# ru_maxrss reflects that run alone.
+# Usage: python bench_memory.py --sizes 500 2000 8000
+
+
+class NullCollection:
+    """
+    Accepts bulk writes and drops them, so only the pipeline's memory is measured.
+    """
+
+    def bulk_write(self, ops, ordered=True):
+        class Result:
+            bulk_api_result = {"nUpserted": len(ops), "nModified": 0}
+        return Result()
+
+
+def make_repo(root, files):
+    for i in range(files):
+        path = os.path.join(root, f"pkg{i % 100}", f"module_{i}.py")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for j in range(40):
+                f.write(f"def func_{i}_{j}(value):\n    # helper number {j}\n    return value * {j} + {i}\n\n")
+
+
+def embed_items(chunks):
+    # Rough token estimate so the benchmark doesn't need the tiktoken download
+    for chunk in chunks:
+        yield {"text": chunk["content"], "tokens": len(chunk["content"]) // 4, "chunk": chunk}
+
+
+def run_materialized(repo_dir, temp_dir):
+    from file_scanner import get_code_files, read_and_metadata
+    from chunker import split_into_chunks
+    from save_jsonl import save_chunks_jsonl
+    from fakes import FakeEmbedder
+
+    embedder = FakeEmbedder(latency=0)
+    all_chunks = []
+    for file_path in get_code_files(repo_dir):
+        meta = read_and_metadata(file_path, repo_dir, "bench/repo")
+        for i, chunk in enumerate(split_into_chunks(meta["content"])):
+            all_chunks.append({"content": chunk, "filepath": meta["filepath"], "repo": meta["repo"], "language": meta["language"], "chunk_id": i})
+    jsonl_path = os.path.join(temp_dir, "chunks.jsonl")
+    save_chunks_jsonl(all_chunks, path=jsonl_path)
+    with open(jsonl_path) as f:
+        lines = [json.loads(line) for line in f]
+    docs = []
+    for batch in list(chunked(lines, 50)):
+        embeddings = embedder([chunk["content"] for chunk in batch])
+        docs.extend({**chunk, "embedding": embedding} for chunk, embedding in zip(batch, embeddings))
+        # insert_one per chunk kept nothing around, so drop each batch's docs
+        docs.clear()
+    return len(lines)
+
+
+def run_streaming(repo_dir, temp_dir):
+    from file_scanner import get_code_files
+    from pipeline import iter_file_chunks, prefetch, embed_and_write
+    from fakes import FakeEmbedder
+
+    chunks = prefetch(iter_file_chunks(get_code_files(repo_dir), repo_dir, "bench/repo", lambda **_: None))
+    engine, writer = embed_and_write(
+        embed_items(chunks), "bench/repo", "HEAD", NullCollection(), FakeEmbedder(latency=0),
+        requests_per_minute=1_000_000, tokens_per_minute=1_000_000_000,
+    )
+    return writer.stats["written"]
+
+
+def child(mode, repo_dir):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        chunks = {"materialized": run_materialized, "streaming": run_streaming}[mode](repo_dir, temp_dir)
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"mode": mode, "chunks": chunks, "peak_rss_mb": round(peak_kb / 1024, 1)}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest peak memory vs repo size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 8000], help="Files per synthetic repo")
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "REPO_DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        sys.exit(0)
+
+    results = []
+    for size in args.sizes:
+        repo_dir = tempfile.mkdtemp(prefix="bench_memory_")
+        try:
+            make_repo(repo_dir, size)
+            for mode in ("materialized", "streaming"):
+                out = subprocess.run(
+                    [sys.executable, __file__, "--child", mode, repo_dir],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                results.append({"files": size, **json.loads(out.strip().splitlines()[-1])})
+        finally:
+            shutil.rmtree(repo_dir, ignore_errors=True)
+    json.dump(results, sys.stdout, indent=2)
+    print()
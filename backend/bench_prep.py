@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+from file_scanner import get_code_files, read_and_metadata
+from prep import iter_chunked_files
+
+# Files/sec of the CPU-side prep stage (scan + read + chunk): the original
+# serial path against the process-pool path, on a synthetic repo.
+# Usage: python bench_prep.py --files 20000 --workers 8
+
+
+def make_repo(root, files):
+    for i in range(files):
+        path = os.path.join(root, f"pkg{i % 200}", f"sub{i % 7}", f"module_{i}.py")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            for j in range(30):
+                f.write(f"class Thing{i}_{j}:\n    def run(self, value):\n        return value * {j} + {i}\n\n")
+
+
+def serial_baseline(repo_dir):
+    """
+    The pre-parallel path: os.walk, then a fresh splitter for every file.
+    """
+    from config import VALID_EXTENSIONS, EXCLUDE_DIRS, CHUNK_SIZE, CHUNK_OVERLAP
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    files = []
+    for root, dirs, filenames in os.walk(repo_dir):
+        dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
+        files.extend(os.path.join(root, name) for name in filenames if os.path.splitext(name)[1] in VALID_EXTENSIONS)
+    chunks = 0
+    for path in files:
+        meta = read_and_metadata(path, repo_dir, "bench/repo")
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, separators=["\n\n", "\n", " ", ""])
+        chunks += len(splitter.split_text(meta["content"]))
+    return len(files), chunks
+
+
+def parallel(repo_dir, workers):
+    files = get_code_files(repo_dir)
+    chunks = sum(len(file_chunks) for file_chunks in iter_chunked_files(files, repo_dir, "bench/repo", workers))
+    return len(files), chunks
+
+
+def timed(label, fn):
+    start = time.monotonic()
+    files, chunks = fn()
+    elapsed = time.monotonic() - start
+    return {"path": label, "files": files, "chunks": chunks, "seconds": round(elapsed, 3), "files_per_sec": round(files / elapsed, 1)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark serial vs parallel file prep")
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    repo_dir = tempfile.mkdtemp(prefix="bench_prep_")
+    try:
+        make_repo(repo_dir, args.files)
+        results = [
+            timed("serial (baseline)", lambda: serial_baseline(repo_dir)),
+            timed("serial (reused splitter)", lambda: parallel(repo_dir, 1)),
+            timed(f"parallel ({args.workers} workers)", lambda: parallel(repo_dir, args.workers)),
+        ]
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    finally:
+        shutil.rmtree(repo_dir, ignore_errors=True)
@@ -0,0 +1,76 @@
+import sys
+import json
+import argparse
+import bson
+import numpy as np
+
+from vector_codec import embedding_fields, quantize_int8, dequantize_int8
+from local_index import _normalize, _top_k
+
+# Recall@k against exact float32 search vs. bytes per vector for each way of
+# storing embeddings, on synthetic clustered vectors (code embeddings are
+# far from uniform, so uniform noise would flatter quantization).
+# Usage: python bench_quantization.py --vectors 50000 --dim 768 --k 5
+
+
+def make_vectors(n, dim, clusters, seed):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, n)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    queries = centers[rng.integers(0, clusters, 200)] + 0.6 * rng.standard_normal((200, dim)).astype(np.float32)
+    return _normalize(vectors), _normalize(queries)
+
+
+def search(matrix, queries, k):
+    return _top_k(queries @ matrix.T, k)
+
+
+def recall(found, truth):
+    k = truth.shape[1]
+    return round(float(np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth)])), 4)
+
+
+def rescored(candidates, full, queries, k):
+    rows = []
+    for q, cand in enumerate(candidates):
+        exact = full[cand] @ queries[q]
+        rows.append(cand[np.argsort(-exact)[:k]])
+    return np.array(rows)
+
+
+def bson_bytes(vector, storage):
+    # Document overhead of {"embedding": ...} alone, excluding the other fields
+    return len(bson.encode(embedding_fields(vector, storage))) - len(bson.encode({}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark quantized embedding storage")
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    vectors, queries = make_vectors(args.vectors, args.dim, args.clusters, args.seed)
+    k, wide = args.k, args.k * args.rescore_factor
+    truth = search(vectors, queries, k)
+
+    f16 = vectors.astype(np.float16).astype(np.float32)
+    codes, scales = quantize_int8(vectors)
+    i8 = dequantize_int8(codes, scales)
+    f16_wide = search(f16, queries, wide)
+    i8_wide = search(i8, queries, wide)
+
+    results = [
+        {"storage": "array (float64 BSON)", "bytes_per_vector": bson_bytes(vectors[0], "array"), "searched_bytes": 8 * args.dim, "recall": 1.0},
+        {"storage": "float32 binary", "bytes_per_vector": bson_bytes(vectors[0], "float32"), "searched_bytes": 4 * args.dim, "recall": 1.0},
+        {"storage": "float16", "bytes_per_vector": 2 * args.dim, "searched_bytes": 2 * args.dim, "recall": recall(f16_wide[:, :k], truth)},
+        {"storage": "float16 + rescore", "bytes_per_vector": 6 * args.dim, "searched_bytes": 2 * args.dim, "recall": recall(rescored(f16_wide, vectors, queries, k), truth)},
+        {"storage": "int8", "bytes_per_vector": args.dim + 4, "searched_bytes": args.dim, "recall": recall(i8_wide[:, :k], truth)},
+        {"storage": "int8 + rescore (EMBED_STORAGE=int8)", "bytes_per_vector": bson_bytes(vectors[0], "int8"), "searched_bytes": args.dim, "recall": recall(rescored(i8_wide, vectors, queries, k), truth)},
+    ]
+    json.dump({"vectors": args.vectors, "dim": args.dim, "k": k, "rescore_factor": args.rescore_factor, "results": results}, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,174 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+import httpx
+from fastapi import FastAPI
+
+from fakes import FakeGenerator, FakeAsyncMongo, fake_vector
+
+# Concurrent /query throughput of one worker against local stubs: the async
+# handler in app.py vs. a sync handler that makes the same calls blocking on
+# FastAPI's threadpool (the previous design). Latencies are simulated with
+# sleeps, so the numbers measure request-path concurrency, not Gemini or Atlas.
+# The batched run sends the same questions `--batch` at a time to /query/batch,
+# with as many requests in flight as the /query run; every run also reports
+# the embedding, search and generation calls it made.
+# Usage: python bench_query_load.py --requests 1000 --concurrency 200 --batch 8
+
+
+class SleepyRetriever:
+    """
+    Returns a fixed chunk after `latency` seconds, like a $vectorSearch round trip.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0  # search round trips
+
+    def search(self, repo_id, vector, limit=5, num_candidates=100, text=None, version=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        return [{"content": "def handler(request):\n    return 200", "filepath": f"{repo_id}/app.py"}]
+
+    async def asearch(self, repo_id, vector, limit=5, num_candidates=100, text=None, version=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [{"content": "def handler(request):\n    return 200", "filepath": f"{repo_id}/app.py"}]
+
+    async def asearch_many(self, repo_id, vectors, limit=5, num_candidates=100, texts=None, version=None):
+        # One round trip for the whole batch
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [[{"content": "def handler(request):\n    return 200", "filepath": f"{repo_id}/app.py"}] for _ in vectors]
+
+
+def make_sync_app(args):
+    """
+    The blocking request path: every stage holds a threadpool thread.
+    """
+    sync_app = FastAPI()
+    retriever = SleepyRetriever(args.search_latency)
+    calls = {"embed": 0, "generate": 0}
+
+    @sync_app.post("/query")
+    def query(body: dict):
+        time.sleep(args.mongo_latency)  # is_repo_indexed
+        time.sleep(args.embed_latency)
+        calls["embed"] += 1
+        embedding = fake_vector(body["question"], 768)
+        chunks = retriever.search("bench/repo", embedding)
+        time.sleep(args.generate_latency)
+        calls["generate"] += 1
+        return {"answer": f"Answer to {body['question']!r}", "citations": [chunks[0]["filepath"]]}
+
+    return sync_app, lambda: {
+        "embed_calls": calls["embed"],
+        "search_calls": retriever.calls,
+        "generate_calls": calls["generate"],
+    }
+
+
+def make_async_app(args):
+    import app as api
+    from resources import Resources, get_resources
+
+    mongo = FakeAsyncMongo(latency=args.mongo_latency)
+    mongo["unrepo"]["repo_indexes"].docs.append({"_id": "bench/repo", "commit": "bench"})
+    models = FakeGenerator(words=1, first_token_latency=args.generate_latency, token_interval=0.0, embed_latency=args.embed_latency)
+    retriever = SleepyRetriever(args.search_latency)
+    resources = Resources(mongo=mongo, models=models, retriever=retriever)
+    api.app.dependency_overrides[get_resources] = lambda: resources
+    # Each run asks the same questions; start without the previous run's answers
+    api.answer_cache.invalidate("bench/repo")
+    return api.app, lambda: {
+        "embed_calls": models.embed_calls,
+        "search_calls": retriever.calls,
+        "generate_calls": models.calls,
+    }
+
+
+async def load(app_and_calls, requests, concurrency, batch=None, distinct=None):
+    """
+    Sends `requests` questions with `concurrency` HTTP requests in flight
+    (`batch` questions per request with --batch).
+    """
+    target, calls_made = app_and_calls
+    transport = httpx.ASGITransport(app=target)
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        async def one(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                # Distinct questions so the answer cache never short-circuits,
+                # unless --distinct asks for a few hot questions
+                if distinct:
+                    response = await client.post("/query", json={
+                        "question": f"How is request {i % distinct} handled?",
+                        "repo_url": "https://github.com/bench/repo",
+                    })
+                elif batch:
+                    response = await client.post("/query/batch", json={
+                        "questions": [f"How is request {i * batch + j} handled?" for j in range(batch)],
+                        "repo_url": "https://github.com/bench/repo",
+                    })
+                else:
+                    response = await client.post("/query", json={
+                        "question": f"How is request {i} handled?",
+                        "repo_url": "https://github.com/bench/repo",
+                    })
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200
+
+        calls = requests // batch if batch else requests
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(calls)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1)
+    return {
+        "requests": calls,
+        "questions": calls * (batch or 1),
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "requests_per_sec": round(calls / elapsed, 1),
+        "questions_per_sec": round(calls * (batch or 1) / elapsed, 1),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        **calls_made(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the /query request path against local stubs")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--mongo-latency", type=float, default=0.005)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.03)
+    parser.add_argument("--generate-latency", type=float, default=0.4)
+    parser.add_argument("--batch", type=int, default=8, help="Questions per /query/batch call")
+    parser.add_argument("--distinct", type=int, default=10, help="Distinct questions in the hot-question run")
+    args = parser.parse_args()
+
+    results = {
+        "sync (threadpool)": asyncio.run(load(make_sync_app(args), args.requests, args.concurrency)),
+        "async": asyncio.run(load(make_async_app(args), args.requests, args.concurrency)),
+        f"async batched x{args.batch}": asyncio.run(
+            load(make_async_app(args), args.requests, args.concurrency, args.batch)
+        ),
+        f"async, {args.distinct} hot questions": asyncio.run(
+            load(make_async_app(args), args.requests, args.concurrency, distinct=args.distinct)
+        ),
+    }
+    from coalesce import COALESCED
+    results["coalesced_calls"] = {flight: count for (flight,), count in sorted(COALESCED.values.items())}
+    json.dump(results, sys.stdout, indent=2)
+    print()
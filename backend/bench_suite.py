@@ -0,0 +1,325 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import platform
+import resource
+import argparse
+import tempfile
+import functools
+import subprocess
+
+# End-to-end ingest + query benchmark on a synthetic git repo, with every
+# external service swapped for a local stand-in: mongomock for Atlas, the
+# local vector + BM25 indexes for $vectorSearch, FakeEmbedder/FakeGenerator
+# for Gemini. The repo, the fakes and the question set are all derived from
+# --seed, so two runs of the same tree measure the same work.
+#
+# Reports per-stage ingest time (the metrics.py stage histograms), chunk and
+# token throughput, peak RSS and /query latency percentiles under concurrent
+# load, as JSON. With --baseline, also the change against an earlier result.
+# Needs requirements-dev.txt (mongomock).
+# Usage: python bench_suite.py --files 2000 --languages py=0.5 ts=0.3 go=0.2 \
+#            --requests 500 --concurrency 50 --output results.json
+
+REPO_ID = "bench/repo"
+
+# ext -> (file template, function template); {i} is the file, {j} the function
+TEMPLATES = {
+    "py": ("", "def {name}(value, scale={j}):\n    \"\"\"Scales value for step {j} of module {i}.\"\"\"\n    total = value * scale\n    for offset in range({j}):\n        total += offset\n    return total + {i}\n\n"),
+    "js": ("", "function {name}(value) {{\n  // step {j} of module {i}\n  let total = value * {j};\n  for (let k = 0; k < {j}; k++) {{\n    total += k;\n  }}\n  return total + {i};\n}}\n\n"),
+    "ts": ("", "export function {name}(value: number): number {{\n  // step {j} of module {i}\n  let total = value * {j};\n  for (let k = 0; k < {j}; k++) {{\n    total += k;\n  }}\n  return total + {i};\n}}\n\n"),
+    "go": ("package pkg{i}\n\n", "// {name} scales value for step {j}.\nfunc {name}(value int) int {{\n\ttotal := value * {j}\n\tfor k := 0; k < {j}; k++ {{\n\t\ttotal += k\n\t}}\n\treturn total + {i}\n}}\n\n"),
+    "java": ("public class Module{i} {{\n", "    public static int {name}(int value) {{\n        int total = value * {j};\n        for (int k = 0; k < {j}; k++) {{\n            total += k;\n        }}\n        return total + {i};\n    }}\n\n"),
+    "rs": ("", "pub fn {name}(value: i64) -> i64 {{\n    // step {j} of module {i}\n    let mut total = value * {j};\n    for k in 0..{j} {{\n        total += k;\n    }}\n    total + {i}\n}}\n\n"),
+}
+FOOTERS = {"java": "}\n"}
+WORDS = ["parse", "load", "render", "merge", "cache", "index", "token", "route", "fetch", "score", "split", "flush"]
+
+
+def parse_mix(pairs: list[str]) -> dict:
+    mix = {}
+    for pair in pairs:
+        ext, _, weight = pair.partition("=")
+        if ext not in TEMPLATES:
+            raise SystemExit(f"Unknown language {ext!r}; choose from {', '.join(TEMPLATES)}")
+        mix[ext] = float(weight or 1)
+    return mix
+
+
+def _name(rng, ext):
+    first, second = rng.sample(WORDS, 2)
+    if ext in ("py", "rs"):
+        return f"{first}_{second}"
+    if ext == "go":
+        return first.capitalize() + second.capitalize()
+    return first + second.capitalize()
+
+
+def _git(repo_dir, *args):
+    # Fixed identity and dates so the same seed gives the same commit hash
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "bench", "GIT_AUTHOR_EMAIL": "bench@example.com",
+        "GIT_COMMITTER_NAME": "bench", "GIT_COMMITTER_EMAIL": "bench@example.com",
+        "GIT_AUTHOR_DATE": "2024-01-01T00:00:00Z", "GIT_COMMITTER_DATE": "2024-01-01T00:00:00Z",
+    }
+    subprocess.run(["git", *args], cwd=repo_dir, env=env, check=True, capture_output=True)
+
+
+def make_repo(root, files, mix, functions, seed):
+    """
+    Writes `files` source files (language picked by `mix` weights, about
+    `functions` functions each) and commits them. Returns the identifiers
+    defined, for building questions.
+    """
+    rng = random.Random(seed)
+    exts, weights = list(mix), list(mix.values())
+    names = []
+    for i in range(files):
+        ext = rng.choices(exts, weights)[0]
+        header, body = TEMPLATES[ext]
+        path = os.path.join(root, f"pkg{i % 50}", f"module_{i}.{ext}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(header.format(i=i))
+            for j in range(rng.randint(max(1, functions // 2), functions * 3 // 2)):
+                name = f"{_name(rng, ext)}{i}x{j}"
+                names.append(name)
+                f.write(body.format(name=name, i=i, j=j))
+            f.write(FOOTERS.get(ext, ""))
+    _git(root, "init", "-q")
+    _git(root, "add", "-A")
+    _git(root, "commit", "-q", "-m", "synthetic repo")
+    return names
+
+
+def use_stand_ins(workdir):
+    """
+    Points every module at local stand-ins; must run before importing main,
+    jobs or app since they bind their collections at import.
+    """
+    import mongomock
+    import resources
+
+    os.environ.setdefault("GEMINI_API_KEY", "bench")
+    resources._mongo_client = mongomock.MongoClient()
+
+    from retrieval import LocalRetriever, LexicalStore, HybridRetriever
+
+    vectors = LocalRetriever(root=os.path.join(workdir, "vectors"))
+    return HybridRetriever(vectors, LexicalStore(root=os.path.join(workdir, "lexical"), source=vectors.docs))
+
+
+def _stage_seconds(pipeline):
+    from metrics import STAGE_SECONDS
+
+    return {
+        stage: {"seconds": round(series["sum"], 3), "count": series["count"]}
+        for (name, stage), series in STAGE_SECONDS.values.items()
+        if name == pipeline
+    }
+
+
+def _total(counter, **labels):
+    return counter.values.get(counter._key(labels), 0)
+
+
+def run_ingest(repo_dir, workdir, retriever, args):
+    import main
+    from fakes import FakeEmbedder, BulkWriteCollection
+    from repo_cloner import clone_repo
+    from pipeline import CHUNKED_FILES, CHUNKS_PRODUCED
+    from embedding_engine import EMBEDDED_TOKENS, EMBED_REQUEST_SECONDS
+    from writer import CHUNK_WRITES, INSERT_BATCH_SECONDS
+
+    main.collection = BulkWriteCollection(main.collection)
+    main.get_embeddings = FakeEmbedder(latency=args.embed_latency, jitter=args.embed_latency / 2, dim=args.dim, seed=args.seed)
+    main.get_retriever = lambda collection: retriever
+    main.clone_repo = functools.partial(clone_repo, cache_dir=os.path.join(workdir, "repo_cache"))
+    # A warm embedding cache would turn the second run into a cache benchmark
+    main.get_default_cache = lambda: None
+
+    start = time.perf_counter()
+    # Summaries are generation, not ingest throughput
+    main.process_repo(f"file://{repo_dir}", repo_id=REPO_ID, summarize=False)
+    seconds = time.perf_counter() - start
+
+    chunks = _total(CHUNKS_PRODUCED)
+    tokens = _total(EMBEDDED_TOKENS)
+    embed_calls = EMBED_REQUEST_SECONDS.values.get((), {"count": 0, "sum": 0.0})
+    insert_batches = INSERT_BATCH_SECONDS.values.get((), {"count": 0, "sum": 0.0})
+    return {
+        "seconds": round(seconds, 3),
+        "files": _total(CHUNKED_FILES),
+        "chunks": chunks,
+        "chunks_written": _total(CHUNK_WRITES, result="written"),
+        "tokens_embedded": tokens,
+        "chunks_per_sec": round(chunks / seconds, 1),
+        "tokens_per_sec": round(tokens / seconds, 1),
+        "embed_calls": embed_calls["count"],
+        "embed_call_seconds": round(embed_calls["sum"], 3),
+        "insert_batches": insert_batches["count"],
+        "insert_seconds": round(insert_batches["sum"], 3),
+        "stages": _stage_seconds("index"),
+        # ru_maxrss is KiB on Linux; prep workers are child processes
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_worker_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+
+async def _load(target, questions, concurrency):
+    import httpx
+
+    transport = httpx.ASGITransport(app=target)
+    latencies, statuses = [], {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        async def one(question):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/query", json={"question": question, "repo_url": f"https://github.com/{REPO_ID}"})
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(question) for question in questions))
+        elapsed = time.perf_counter() - start
+    return latencies, statuses, elapsed
+
+
+def run_queries(names, retriever, args):
+    import app as api
+    from metrics import STAGE_SECONDS
+    from resources import Resources, get_resources
+    from fakes import FakeGenerator, FakeAsyncMongo
+
+    from index_meta import get_repo_index
+
+    mongo = FakeAsyncMongo(latency=args.mongo_latency)
+    # Search the build run_ingest just swapped in
+    version = get_repo_index(REPO_ID)["version"]
+    mongo["unrepo"]["repo_indexes"].docs.append({"_id": REPO_ID, "commit": "bench", "version": version})
+    resources = Resources(
+        mongo=mongo,
+        models=FakeGenerator(words=args.answer_words, first_token_latency=args.generate_latency,
+                             token_interval=0.0, embed_latency=args.embed_latency, dim=args.dim),
+        retriever=retriever,
+    )
+    api.app.dependency_overrides[get_resources] = lambda: resources
+
+    rng = random.Random(args.seed)
+    # Distinct questions, so the answer cache never short-circuits retrieval
+    questions = [f"How does {rng.choice(names)} work? (#{i})" for i in range(args.requests)]
+    with STAGE_SECONDS.lock:
+        STAGE_SECONDS.values = {key: value for key, value in STAGE_SECONDS.values.items() if key[0] != "query"}
+    latencies, statuses, elapsed = asyncio.run(_load(api.app, questions, args.concurrency))
+
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000, 1)
+    stages = _stage_seconds("query")
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "seconds": round(elapsed, 3),
+        "requests_per_sec": round(args.requests / elapsed, 1),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "stage_mean_ms": {
+            stage: round(value["seconds"] / value["count"] * 1000, 2) for stage, value in stages.items() if value["count"]
+        },
+    }
+
+
+def _flatten(data, prefix=""):
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(results, baseline):
+    """
+    Relative change of every numeric result also present in `baseline`.
+    """
+    current, before = _flatten(results["results"]), _flatten(baseline["results"])
+    return {
+        key: {"baseline": before[key], "current": value, "change": round((value - before[key]) / before[key], 4)}
+        for key, value in current.items()
+        if before.get(key)
+    }
+
+
+def environment():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        revision = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest and /query against local stand-ins")
+    parser.add_argument("--files", type=int, default=1000, help="Files in the synthetic repo")
+    parser.add_argument("--functions", type=int, default=20, help="Average functions per file")
+    parser.add_argument("--languages", nargs="+", default=["py=0.4", "ts=0.25", "go=0.15", "java=0.1", "rs=0.1"],
+                        help="Language mix as ext=weight")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--generate-latency", type=float, default=0.2)
+    parser.add_argument("--mongo-latency", type=float, default=0.002)
+    parser.add_argument("--answer-words", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--skip-query", action="store_true")
+    parser.add_argument("--output", help="Also write the results to this file")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic repo and indexes")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_suite_")
+    try:
+        repo_dir = os.path.join(workdir, "repo")
+        os.makedirs(repo_dir)
+        names = make_repo(repo_dir, args.files, parse_mix(args.languages), args.functions, args.seed)
+        retriever = use_stand_ins(workdir)
+        results = {"ingest": run_ingest(repo_dir, workdir, retriever, args)}
+        if not args.skip_query:
+            results["query"] = run_queries(names, retriever, args)
+    finally:
+        if args.keep:
+            print(f"Kept {workdir}", file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "keep")},
+        "environment": environment(),
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["baseline"] = compare(report, json.load(f))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    json.dump(report, sys.stdout, indent=2)
+    print()
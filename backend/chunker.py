@@ -1,15 +1,288 @@
-from config import CHUNK_SIZE, CHUNK_OVERLAP
+import os
+import re
+import ast
+import json
+from config import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    TOKEN_AWARE_CHUNKING,
+    CHUNK_TOKENS,
+    CHUNK_OVERLAP_TOKENS,
+    SYNTAX_AWARE_CHUNKING,
+    SYNTAX_CHUNK_TOKENS,
+    SYNTAX_CHUNK_CHARS,
+)
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from tokenizer import count_tokens
 
 # Please tweak in config based on Gemini's model limits (2048 for mine)
 
-def split_into_chunks(text: str) -> list[str]:
-    splitter = RecursiveCharacterTextSplitter(
+SEPARATORS = ["\n\n", "\n", " ", ""]
+
+# Built once per process; the splitter is stateless between calls
+if TOKEN_AWARE_CHUNKING:
+    _length = count_tokens
+    _splitter = RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_TOKENS,
+        chunk_overlap=CHUNK_OVERLAP_TOKENS,
+        length_function=count_tokens,
+        separators=SEPARATORS
+    )
+    _max_segment = SYNTAX_CHUNK_TOKENS
+else:
+    _length = len
+    _splitter = RecursiveCharacterTextSplitter(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
-        separators=["\n\n", "\n", " ", ""]
+        separators=SEPARATORS
     )
-    return splitter.split_text(text)
+    _max_segment = SYNTAX_CHUNK_CHARS
+
+# Splits syntax segments that are still too big (e.g. a 500-line function)
+_segment_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=_max_segment,
+    chunk_overlap=0,
+    length_function=_length,
+    separators=SEPARATORS
+)
+
+def split_into_chunks(text: str) -> list[str]:
+    return _splitter.split_text(text)
+
+
+# --- Syntax-aware chunking ---------------------------------------------------
+#
+# A language chunker takes the file's lines and returns boundaries: a list of
+# (line_index, symbol) where a new top-level unit (function, class, heading,
+# cell...) starts. The shared code below turns boundaries into segments,
+# attaches leading comments/decorators, merges small neighbours up to the size
+# budget and splits anything still too large.
+
+_CHUNKERS = {}
+
+def register_chunker(*extensions):
+    def decorator(fn):
+        for ext in extensions:
+            _CHUNKERS[ext] = fn
+        return fn
+    return decorator
+
+def _regex_boundaries(pattern):
+    compiled = re.compile(pattern, re.MULTILINE)
+
+    def boundaries(lines):
+        found = []
+        for i, line in enumerate(lines):
+            match = compiled.match(line)
+            if match:
+                symbol = next((g for g in reversed(match.groups()) if g), None)
+                found.append((i, symbol))
+        return found
+    return boundaries
+
+register_chunker(".js", ".jsx", ".ts", ".tsx", ".vue", ".astro")(_regex_boundaries(
+    r"^(?:export\s+(?:default\s+)?)?(?:declare\s+)?(?:abstract\s+)?(?:async\s+)?"
+    r"(?:function\*?|class|interface|type|enum|const|let|var)\s+([A-Za-z_$][\w$]*)"
+))
+register_chunker(".java", ".kt", ".cs", ".swift")(_regex_boundaries(
+    r"^\s{0,4}(?:@\w+\s+)*(?:(?:public|private|protected|internal|static|final|abstract|open|override|"
+    r"sealed|data|partial|async|virtual|suspend|inline)\s+)*"
+    r"(?:(?:class|interface|enum|struct|record|object|protocol|extension|fun|func)\s+([A-Za-z_]\w*)"
+    r"|[\w<>\[\],?]+\s+([A-Za-z_]\w*)\s*\([^;]*$)"
+))
+register_chunker(".go")(_regex_boundaries(
+    r"^(?:func\s+(?:\([^)]*\)\s*)?([A-Za-z_]\w*)|type\s+([A-Za-z_]\w*))"
+))
+register_chunker(".rs")(_regex_boundaries(
+    r"^\s{0,4}(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?(?:unsafe\s+)?(?:fn|struct|enum|trait|mod|impl(?:<[^>]*>)?)\s+([A-Za-z_][\w:<>, ]*)"
+))
+register_chunker(".c", ".cpp")(_regex_boundaries(
+    r"^(?:(?:class|struct|namespace|enum)\s+([A-Za-z_]\w*)|[A-Za-z_][\w\s\*&:<>,]*?\b([A-Za-z_][\w:~]*)\s*\([^;]*$)"
+))
+register_chunker(".rb")(_regex_boundaries(r"^\s{0,2}(?:def|class|module)\s+([\w.:?!=]+)"))
+register_chunker(".php")(_regex_boundaries(
+    r"^\s{0,4}(?:(?:public|private|protected|static|abstract|final)\s+)*(?:function|class|interface|trait|enum)\s+&?([A-Za-z_]\w*)"
+))
+register_chunker(".md", ".mdx")(_regex_boundaries(r"^#{1,6}\s+(.+?)\s*#*$"))
+
+# tree-sitter grammars, when installed, replace the regex heuristics above
+try:
+    from tree_sitter_languages import get_parser
+except ImportError:
+    get_parser = None
+
+_TREE_SITTER_LANGUAGES = {
+    ".js": "javascript", ".jsx": "javascript", ".ts": "typescript", ".tsx": "tsx",
+    ".java": "java", ".go": "go", ".rs": "rust", ".c": "c", ".cpp": "cpp",
+    ".cs": "c_sharp", ".kt": "kotlin", ".rb": "ruby", ".php": "php",
+}
+
+def _tree_sitter_boundaries(language):
+    parser = get_parser(language)
+
+    def boundaries(lines):
+        tree = parser.parse("\n".join(lines).encode("utf-8"))
+        found = []
+        for node in tree.root_node.named_children:
+            name = node.child_by_field_name("name")
+            symbol = name.text.decode("utf-8", "ignore") if name is not None else None
+            found.append((node.start_point[0], symbol))
+        return found
+    return boundaries
+
+if get_parser is not None:
+    for _ext, _language in _TREE_SITTER_LANGUAGES.items():
+        try:
+            register_chunker(_ext)(_tree_sitter_boundaries(_language))
+        except Exception:
+            pass  # grammar missing from this build; keep the regex chunker
+
+@register_chunker(".py")
+def _python_boundaries(lines):
+    try:
+        tree = ast.parse("\n".join(lines))
+    except SyntaxError:
+        return _regex_boundaries(r"^(?:async\s+def|def|class)\s+([A-Za-z_]\w*)")(lines)
+
+    def start_of(node):
+        return min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+
+    found = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            found.append((start_of(node), node.name))
+            if isinstance(node, ast.ClassDef):
+                # Methods are boundaries too; small ones get merged back together
+                for child in node.body:
+                    if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                        found.append((start_of(child), f"{node.name}.{child.name}"))
+        elif not found or found[-1][1] is not None:
+            found.append((start_of(node), None))
+    return found
+
+def _notebook_source(text):
+    """
+    Extracts cell sources from a notebook, dropping outputs (and the base64
+    images in them). Returns (text, boundaries) over the extracted text.
+    """
+    try:
+        cells = json.loads(text).get("cells", [])
+    except (ValueError, AttributeError):
+        return text, []
+    lines, found = [], []
+    for n, cell in enumerate(cells, start=1):
+        source = cell.get("source", "")
+        if isinstance(source, list):
+            source = "".join(source)
+        if not source.strip():
+            continue
+        if lines:
+            lines.append("")
+        found.append((len(lines), f"{cell.get('cell_type', 'code')} cell {n}"))
+        lines.extend(source.splitlines())
+    return "\n".join(lines), found
+
+_COMMENT = re.compile(r"^\s*(#|//|/\*|\*|@|--|<!--)")
+
+def _segments(lines, boundaries):
+    """
+    Turns boundaries into (start, end, symbol) line spans (end exclusive).
+    Comment and decorator lines directly above a boundary move with it.
+    """
+    starts = []
+    for line, symbol in sorted(boundaries):
+        while line > 0 and (not starts or line - 1 > starts[-1][0]) and _COMMENT.match(lines[line - 1]):
+            line -= 1
+        if starts and line <= starts[-1][0]:
+            continue
+        starts.append((line, symbol))
+    if not starts or starts[0][0] > 0:
+        starts.insert(0, (0, None))
+    ends = [start for start, _ in starts[1:]] + [len(lines)]
+    return [(start, end, symbol) for (start, symbol), end in zip(starts, ends)]
+
+def _emit(chunks, lines, start, end, symbols):
+    raw = "\n".join(lines[start:end])
+    text = raw.lstrip("\n")
+    start += len(raw) - len(text)
+    text = text.rstrip("\n")
+    if not text.strip():
+        return
+    names = [s for s in symbols if s]
+    # "Foo, Foo.bar, Foo.baz" reads better as just "Foo"
+    names = [s for i, s in enumerate(names) if not any(s.startswith(t + ".") for t in names[:i])]
+    symbol = ", ".join(names) or None
+    if _length(text) <= _max_segment:
+        chunks.append({"content": text, "symbol": symbol, "start_line": start + 1, "end_line": start + text.count("\n") + 1})
+        return
+    # Oversized unit: split it, keeping the symbol and tracking line ranges
+    cursor = 0
+    for piece in _segment_splitter.split_text(text):
+        offset = text.find(piece, cursor)
+        offset = cursor if offset < 0 else offset
+        first = start + text.count("\n", 0, offset)
+        chunks.append({
+            "content": piece,
+            "symbol": symbol,
+            "start_line": first + 1,
+            "end_line": first + piece.count("\n") + 1,
+        })
+        cursor = offset + len(piece)
+
+def chunk_document(text: str, filename: str) -> list[dict]:
+    """
+    Splits a file into chunks aligned to syntax units where a chunker exists
+    for its extension, falling back to the generic splitter otherwise.
+
+    Returns dicts with "content", "symbol" (function/class/heading/cell name,
+    or None) and 1-based inclusive "start_line"/"end_line".
+    """
+    ext = os.path.splitext(filename)[1]
+    if ext == ".ipynb":
+        text, boundaries = _notebook_source(text)
+        lines = text.split("\n")
+    else:
+        lines = text.split("\n")
+        chunker = _CHUNKERS.get(ext) if SYNTAX_AWARE_CHUNKING else None
+        boundaries = chunker(lines) if chunker else None
 
+    if boundaries is None:
+        return _emit_generic(text)
 
+    chunks = []
+    newline = _length("\n")
+    group_start, group_end, group_symbols, group_length = None, None, [], 0
+    for start, end, symbol in _segments(lines, boundaries):
+        # Each segment is measured once; a group's length is the sum of its
+        # segments and the newlines joining them (_emit re-measures the
+        # group, and splits it in the rare case merging made it longer)
+        length = _length("\n".join(lines[start:end]))
+        if group_start is not None and group_length + newline + length > _max_segment:
+            _emit(chunks, lines, group_start, group_end, group_symbols)
+            group_start, group_symbols = None, []
+        if group_start is None:
+            group_start, group_length = start, length
+        else:
+            group_length += newline + length
+        group_end = end
+        group_symbols.append(symbol)
+    if group_start is not None:
+        _emit(chunks, lines, group_start, group_end, group_symbols)
+    return chunks
 
+def _emit_generic(text):
+    chunks = []
+    cursor = 0
+    for piece in split_into_chunks(text):
+        offset = text.find(piece, cursor)
+        offset = cursor if offset < 0 else offset
+        first = text.count("\n", 0, offset)
+        chunks.append({
+            "content": piece,
+            "symbol": None,
+            "start_line": first + 1,
+            "end_line": first + piece.count("\n") + 1,
+        })
+        # Overlapping chunks start before the previous one ends
+        cursor = offset + 1
+    return chunks
@@ -0,0 +1,85 @@
+import time
+import asyncio
+import threading
+
+from metrics import Counter
+from config import REPO_STATUS_CACHE_TTL
+
+# Thundering-herd protection for the API: SingleFlight runs one upstream call
+# per key at a time and hands its result (or exception) to every concurrent
+# caller; StatusCache keeps repo index lookups for a few seconds so a burst of
+# /query and /repo-status requests for one repo costs one Mongo round trip.
+
+# Default for StatusCache.get when None is a meaningful cached value
+MISSING = object()
+
+COALESCED = Counter("unrepo_coalesced_calls_total", "Calls that joined an identical in-flight call", ("flight",))
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent async calls by key: the first caller starts
+    `factory()`, callers arriving while it runs await the same task. A caller
+    that is cancelled (client went away) doesn't cancel the shared call.
+    """
+
+    def __init__(self):
+        self.calls = {}
+
+    async def do(self, key, factory):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            COALESCED.inc(flight=key[0] if isinstance(key, tuple) else "call")
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter was cancelled
+            task.exception()
+
+
+class StatusCache:
+    """
+    Thread-safe map with a per-entry TTL, for values that may be a few
+    seconds stale.
+    """
+
+    def __init__(self, ttl: float = REPO_STATUS_CACHE_TTL):
+        self.ttl = ttl
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return default
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            if len(self.entries) > 10_000:
+                now = time.monotonic()
+                self.entries = {k: entry for k, entry in self.entries.items() if entry[0] >= now}
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, repo_id: str):
+        """
+        Drops every entry whose key is (kind, repo_id).
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[1] == repo_id]:
+                del self.entries[key]
+
+
+flights = SingleFlight()
+repo_status_cache = StatusCache()
@@ -42,3 +42,157 @@ CHUNK_LINES = 30
 
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
+
+# Tokenization (shared by ingest and /query)
+TOKEN_ENCODING = "cl100k_base"
+TOKENIZER_THREADS = 4
+MAX_EMBED_TOKENS = 2048
+
+# Size chunks in tokens instead of characters, so they never need truncating
+TOKEN_AWARE_CHUNKING = True
+CHUNK_TOKENS = 128
+CHUNK_OVERLAP_TOKENS = 12
+
+# Split code on function/class boundaries (notebooks by cell, markdown by
+# heading); units are merged or split to stay under this budget
+SYNTAX_AWARE_CHUNKING = True
+SYNTAX_CHUNK_TOKENS = 400
+SYNTAX_CHUNK_CHARS = 1600  # budget when TOKEN_AWARE_CHUNKING is off
+
+# Background indexing jobs
+INDEX_WORKERS = 2
+JOB_STALE_SECONDS = 3 * 60  # without a heartbeat from the owning process
+JOB_HEARTBEAT_INTERVAL = 30.0
+JOB_PROGRESS_INTERVAL = 2.0
+
+# Embedding model
+EMBED_MODEL = "text-embedding-004"
+EMBED_TASK_TYPE = "SEMANTIC_SIMILARITY"
+
+# Embedding cache: "sqlite" (local file), "mongo" (shared collection) or None
+EMBED_CACHE_BACKEND = "sqlite"
+EMBED_CACHE_PATH = "data/embedding_cache.sqlite3"
+EMBED_CACHE_MAX_ENTRIES = 1_000_000
+
+# Embedding throughput (text-embedding-004 quotas, tune per project tier)
+EMBED_BATCH_SIZE = 50
+EMBED_MIN_BATCH_SIZE = 5
+EMBED_MAX_CONCURRENCY = 4
+EMBED_REQUESTS_PER_MINUTE = 1500
+EMBED_TOKENS_PER_MINUTE = 1_000_000
+EMBED_MAX_RETRIES = 6
+EMBED_TARGET_LATENCY = 2.0
+
+# Chunk writer (bulk upserts to MongoDB)
+WRITE_FLUSH_SIZE = 500
+WRITE_FLUSH_INTERVAL = 1.0
+WRITE_QUEUE_SIZE = 1000
+
+# Cloning: shallow/partial/sparse clones and a local mirror cache
+CLONE_DEPTH = 1  # only used without a mirror cache; incremental refresh needs history
+CLONE_FILTER = "blob:none"
+CLONE_SPARSE = True
+CLONE_MAX_BLOB_SIZE = None  # bytes; prefetches all smaller blobs of HEAD, so sparse no longer limits the download
+CLONE_CACHE_DIR = "data/repo_cache"  # None to always clone fresh
+
+# Streaming pipeline
+PREFETCH_CHUNKS = 256  # chunks buffered between the file reader and the embedder
+SPILL_JSONL = False  # also write chunks to a JSONL file in the temp dir (debugging)
+
+# Pre-filter in file_scanner.scan_files: files that would only waste
+# embedding calls (binaries, minified bundles, generated code, data dumps)
+SCAN_MAX_FILE_BYTES = 500_000
+SCAN_MAX_DATA_FILE_BYTES = 100_000  # for SCAN_DATA_EXTENSIONS, mostly data past this
+SCAN_DATA_EXTENSIONS = {".json", ".txt", ".yaml", ".yml", ".toml", ".ini", ".env"}
+SCAN_MAX_NOTEBOOK_BYTES = 10_000_000  # outputs are dropped when chunking
+SCAN_MAX_REPO_BYTES = 50_000_000  # files past this total are skipped
+SCAN_SAMPLE_BYTES = 8192  # read from the head of each file for the checks below
+SCAN_MAX_ENTROPY = 5.8  # bits/byte; source code sits around 4.5-5.5, base64 at 6
+SCAN_MAX_AVG_LINE_LENGTH = 250
+SCAN_GENERATED_NAMES = (
+    "*.min.js", "*.min.css", "*.bundle.js", "*.chunk.js", "package-lock.json", "npm-shrinkwrap.json",
+    "pnpm-lock.yaml", "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.pb.gw.go", "*.generated.*", "*.g.cs",
+    "*.designer.cs",
+)
+
+# Parallel prep (read + chunk); None uses every CPU core
+PREP_WORKERS = None
+PREP_FILES_PER_TASK = 64
+
+# /query answer cache: exact question matches, then near-duplicates by cosine
+ANSWER_CACHE_TTL = 60 * 60
+ANSWER_CACHE_MAX_ENTRIES = 5000
+ANSWER_CACHE_SIMILARITY = 0.95
+ANSWER_CACHE_SEMANTIC_PER_REPO = 512
+
+# Retrieval backend: "atlas" ($vectorSearch) or "local" (in-process index)
+RETRIEVAL_BACKEND = "atlas"
+LOCAL_INDEX_DIR = "data/vector_index"
+LOCAL_INDEX_IVF_THRESHOLD = 50_000  # above this many vectors, search is approximate (IVF)
+LOCAL_INDEX_NPROBE = 8
+LOCAL_INDEX_SEARCH_BATCH = 65_536  # rows scored per matmul
+
+# Embedding storage in chunk documents: "array" (BSON doubles), "float32" or
+# "int8" (BSON binary vectors). Changing it needs migrate_vectors.py and a
+# matching Atlas index definition.
+EMBED_STORAGE = "array"
+RESCORE_FACTOR = 4  # quantized search fetches limit * RESCORE_FACTOR candidates to rescore
+LOCAL_INDEX_DTYPE = "float32"  # "float16" or "int8" to shrink the local index
+
+# Answer generation
+GENERATION_MODEL = "gemini-2.0-flash"
+
+# Shared connection pools (one Mongo client and one Gemini client per process)
+MONGO_MAX_POOL_SIZE = 100
+MONGO_MIN_POOL_SIZE = 5
+GEMINI_MAX_CONNECTIONS = 100
+GEMINI_MAX_KEEPALIVE_CONNECTIONS = 20
+
+# Hybrid retrieval: BM25 over chunk text/paths fused with vector search (RRF)
+HYBRID_RETRIEVAL = True
+HYBRID_CANDIDATES = 30  # fetched from each side before fusion
+RRF_K = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+LEXICAL_INDEX_DIR = "data/lexical_index"
+LEXICAL_INDEX_CACHE_SIZE = 64  # repo indexes kept in memory per process
+
+# Summary index (summaries.py): per-file summaries, directory rollups and a
+# repo overview built after embedding; /query answers overview, layout and
+# "what is <path>" questions from it. Off by default: each build costs up to
+# SUMMARY_MAX_FILES extra generate calls (refreshes only the changed files)
+BUILD_SUMMARIES = False
+SUMMARY_MODEL = "gemini-2.0-flash"
+SUMMARY_CONCURRENCY = 8
+SUMMARY_MAX_FILES = 500  # past this, the deepest files only appear by name in rollups
+SUMMARY_FILE_TOKENS = 2000  # of a file's content (or the README) per prompt
+SUMMARY_ROLLUP_TOKENS = 4000  # of child summaries per directory/repo prompt
+SUMMARY_TREE_MAX_LINES = 300
+
+# Index lifecycle (lifecycle.py, manage_index.py): each build is written
+# under a new version and swapped in atomically; least recently queried repos
+# are evicted past the storage budget or TTL
+INDEX_STORAGE_BUDGET_BYTES = 20_000_000_000  # chunk documents across all repos; None for no budget
+INDEX_TTL_DAYS = 30  # since last queried (or indexed); None to keep repos forever
+INDEX_GC_BATCH = 5000  # chunk documents per delete when collecting old builds
+INDEX_TOUCH_INTERVAL = 300  # seconds between last_queried_at writes per repo and process
+
+# Index snapshots (snapshot.py): a repo's live build exported with its
+# embeddings, to bulk-load into another environment without re-embedding
+SNAPSHOT_DTYPE = "float32"  # "float16" halves the embedding block
+SNAPSHOT_BATCH = 1000  # rows per Mongo cursor batch / bulk-load batch
+
+# Repo index lookups (/query, /repo-status) are cached this long per process
+REPO_STATUS_CACHE_TTL = 2.0
+
+# /query/batch: questions per request and concurrent generations per batch
+BATCH_MAX_QUESTIONS = 32
+BATCH_GENERATION_CONCURRENCY = 8
+
+# Prompt context assembly (context_builder.py)
+CONTEXT_TOKEN_BUDGET = 3000  # max tokens of merged spans in the prompt
+CONTEXT_MIN_PARTIAL_TOKENS = 64  # smallest remainder worth filling with a cut span
+
+# Instrumentation (metrics.py, /metrics)
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+TIMING_HEADERS = False  # add a Server-Timing breakdown to API responses
@@ -0,0 +1,143 @@
+import re
+import logging
+
+from tokenizer import count_tokens, truncate
+from config import CONTEXT_TOKEN_BUDGET, CONTEXT_MIN_PARTIAL_TOKENS
+
+logger = logging.getLogger("uvicorn")
+
+# Turns retrieved chunks into the prompt's context section:
+#   1. chunks of the same file whose line ranges overlap or touch are merged
+#      into one span, with the text they share (splitter overlap) kept once
+#   2. trailing whitespace is stripped and runs of blank lines collapsed
+#   3. spans are ordered by their best chunk's relevance and added until the
+#      token budget is spent; a span that doesn't fit is cut to the remainder
+#      if at least CONTEXT_MIN_PARTIAL_TOKENS are left, otherwise skipped; the
+#      separators, headers and cut marker all count against the budget
+
+_BLANK_RUNS = re.compile(r"\n\s*\n(\s*\n)+")
+_SEPARATOR = "\n\n"
+_CUT_MARKER = "\n..."
+
+
+def compact_whitespace(text: str) -> str:
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    return _BLANK_RUNS.sub("\n\n", text).strip("\n")
+
+
+def join_overlapping(first: str, second: str) -> str:
+    """
+    Concatenates two texts, keeping once the longest suffix of `first` that
+    is also a prefix of `second`.
+    """
+    if second in first:
+        return first
+    for size in range(min(len(first), len(second)), 0, -1):
+        if first[-1] == second[size - 1] and first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def merge_spans(chunks: list[dict]) -> list[dict]:
+    """
+    Groups ranked chunks into per-file spans. Each span keeps the best rank
+    (position in `chunks`) of the chunks it absorbed.
+    """
+    by_file = {}
+    for rank, chunk in enumerate(chunks):
+        by_file.setdefault(chunk["filepath"], []).append((rank, chunk))
+
+    spans = []
+    for filepath, ranked in by_file.items():
+        lined = sorted(
+            [(rank, chunk) for rank, chunk in ranked if chunk.get("start_line") is not None],
+            key=lambda item: item[1]["start_line"],
+        )
+        current = None
+        for rank, chunk in lined:
+            if current is not None and chunk["start_line"] <= current["end_line"] + 1:
+                current["content"] = join_overlapping(current["content"], chunk["content"])
+                current["end_line"] = max(current["end_line"], chunk["end_line"])
+                current["rank"] = min(current["rank"], rank)
+                current["chunks"] += 1
+                continue
+            current = {
+                "filepath": filepath,
+                "content": chunk["content"],
+                "start_line": chunk["start_line"],
+                "end_line": chunk["end_line"],
+                "rank": rank,
+                "chunks": 1,
+            }
+            spans.append(current)
+        # Legacy chunks without line numbers stay as they are
+        for rank, chunk in ranked:
+            if chunk.get("start_line") is None:
+                spans.append({"filepath": filepath, "content": chunk["content"], "start_line": None,
+                              "end_line": None, "rank": rank, "chunks": 1})
+    return sorted(spans, key=lambda span: span["rank"])
+
+
+def _render(span, content=None) -> str:
+    path = span["filepath"].replace("__", "/")
+    where = f"{path}:{span['start_line']}-{span['end_line']}" if span["start_line"] is not None else path
+    return f"--- {where}\n{content if content is not None else span['content']}"
+
+
+def _cut(span, max_tokens):
+    """
+    Renders `span` with its content cut so that, header and cut marker
+    included, it fits in `max_tokens`; None if not even the header fits.
+    """
+    budget = max_tokens - count_tokens(_render(span, _CUT_MARKER))
+    while budget > 0:
+        content, _ = truncate(span["content"], budget)
+        text = _render(span, content + _CUT_MARKER)
+        # Tokens can merge across the cut, so check the rendered text
+        over = count_tokens(text) - max_tokens
+        if over <= 0:
+            return text
+        budget -= over
+    return None
+
+
+def build_context(chunks: list[dict], token_budget: int = CONTEXT_TOKEN_BUDGET) -> dict:
+    """
+    Returns {"text", "citations", "spans", "tokens", "tokens_before",
+    "tokens_saved"}. `tokens_before` is what joining the raw chunks used to
+    cost, so `tokens_saved` includes both de-duplication and the budget cut.
+    """
+    tokens_before = count_tokens("\n\n".join(f"{c['content']} (from {c['filepath']})" for c in chunks))
+    parts, citations, used = [], [], 0
+    for span in merge_spans(chunks):
+        span["content"] = compact_whitespace(span["content"])
+        text = _render(span)
+        tokens = count_tokens(text)
+        separator = count_tokens(_SEPARATOR) if parts else 0
+        remaining = token_budget - used - separator
+        if tokens > remaining:
+            if remaining < CONTEXT_MIN_PARTIAL_TOKENS:
+                continue
+            text = _cut(span, remaining)
+            if text is None:
+                continue
+            tokens = count_tokens(text)
+        parts.append(text)
+        used += separator + tokens
+        path = span["filepath"].replace("__", "/")
+        if path not in citations:
+            citations.append(path)
+
+    context = {
+        "text": _SEPARATOR.join(parts),
+        "citations": citations,
+        "spans": len(parts),
+        "tokens": used,
+        "tokens_before": tokens_before,
+        "tokens_saved": max(0, tokens_before - used),
+    }
+    logger.info(
+        f"🧩 Context: {len(chunks)} chunks -> {len(parts)} spans, "
+        f"{used} tokens ({context['tokens_saved']} saved)"
+    )
+    return context
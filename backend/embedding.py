@@ -1,15 +1,15 @@
 
-from google import genai
-import os
 import logging
 from dotenv import load_dotenv
 from google.genai import types
+from config import EMBED_MODEL, EMBED_TASK_TYPE
+from resources import get_genai_client
 
 logger = logging.getLogger("uvicorn")
 
 load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+client = get_genai_client()
 
 def get_embeddings(texts: list[str]) -> list[list[float]]:
     if not texts:
@@ -17,9 +17,9 @@ def get_embeddings(texts: list[str]) -> list[list[float]]:
 
     try:
         response = client.models.embed_content(
-            model="text-embedding-004",
+            model=EMBED_MODEL,
             contents=texts,
-            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY")
+            config=types.EmbedContentConfig(task_type=EMBED_TASK_TYPE)
         )
         return [embedding.values for embedding in response.embeddings]
     except Exception as e:
@@ -35,15 +35,55 @@ def get_question_embedding(question: str) -> list[float]:
 
     try:
         response = client.models.embed_content(
-            model="text-embedding-004",
+            model=EMBED_MODEL,
             contents=[question],
-            config=types.EmbedContentConfig(task_type="SEMANTIC_SIMILARITY")
+            config=types.EmbedContentConfig(task_type=EMBED_TASK_TYPE)
         )
         return response.embeddings[0].values
     except Exception as e:
         logger.error(f"Failed to get question embedding: {e}")
         raise
 
+async def aget_question_embedding(models, question: str) -> list[float]:
+    """
+    Async get_question_embedding for request handlers; `models` is an async
+    models client such as `genai_client.aio.models`.
+    """
+    if not question.strip():
+        raise ValueError("Question cannot be empty.")
+
+    try:
+        response = await models.embed_content(
+            model=EMBED_MODEL,
+            contents=[question],
+            config=types.EmbedContentConfig(task_type=EMBED_TASK_TYPE)
+        )
+        return response.embeddings[0].values
+    except Exception as e:
+        logger.error(f"Failed to get question embedding: {e}")
+        raise
+
+
+async def aget_question_embeddings(models, questions: list[str]) -> list[list[float]]:
+    """
+    Embeds several questions in one `embed_content` call.
+    """
+    if not questions:
+        return []
+    if any(not question.strip() for question in questions):
+        raise ValueError("Question cannot be empty.")
+
+    try:
+        response = await models.embed_content(
+            model=EMBED_MODEL,
+            contents=list(questions),
+            config=types.EmbedContentConfig(task_type=EMBED_TASK_TYPE)
+        )
+        return [embedding.values for embedding in response.embeddings]
+    except Exception as e:
+        logger.error(f"Failed to get question embeddings: {e}")
+        raise
+
 
 
 # if __name__ == "__main__":
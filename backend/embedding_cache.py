@@ -0,0 +1,175 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from datetime import datetime, timezone
+
+from config import (
+    EMBED_MODEL,
+    EMBED_TASK_TYPE,
+    EMBED_CACHE_BACKEND,
+    EMBED_CACHE_PATH,
+    EMBED_CACHE_MAX_ENTRIES,
+)
+
+logger = logging.getLogger("uvicorn")
+
+
+def cache_key(text: str, model: str = EMBED_MODEL, task_type: str = EMBED_TASK_TYPE) -> str:
+    """
+    Key for an embedding: (model, task_type, sha256 of the exact text embedded).
+    Callers must pass the truncated text, since that's what the model saw.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return f"{model}:{task_type}:{digest}"
+
+
+def _pack(vector) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> list[float]:
+    return array("f", blob).tolist()
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def summary(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class SQLiteEmbeddingCache:
+    """
+    On-disk embedding cache with LRU eviction once `max_entries` is exceeded.
+    """
+
+    def __init__(self, path: str = EMBED_CACHE_PATH, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self.db.commit()
+        self.count = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys: list[str]) -> dict:
+        if not keys:
+            return {}
+        with self.lock:
+            placeholders = ",".join("?" * len(keys))
+            rows = self.db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+            if rows:
+                now = time.time()
+                self.db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key, _ in rows])
+                self.db.commit()
+            found = {key: _unpack(blob) for key, blob in rows}
+            self.stats.hits += len(found)
+            self.stats.misses += len(keys) - len(found)
+            return found
+
+    def put_many(self, entries: dict):
+        if not entries:
+            return
+        with self.lock:
+            now = time.time()
+            before = self.db.total_changes
+            self.db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, _pack(vector), now) for key, vector in entries.items()],
+            )
+            self.count += self.db.total_changes - before
+            if self.count > self.max_entries:
+                overflow = self.count - self.max_entries
+                self.db.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,),
+                )
+                self.count -= overflow
+                self.stats.evictions += overflow
+            self.db.commit()
+
+
+class MongoEmbeddingCache:
+    """
+    Embedding cache in a Mongo collection, shared by every worker.
+    """
+
+    def __init__(self, collection, max_entries: int = EMBED_CACHE_MAX_ENTRIES):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self.collection.create_index("last_used")
+
+    def get_many(self, keys: list[str]) -> dict:
+        if not keys:
+            return {}
+        docs = list(self.collection.find({"_id": {"$in": keys}}, {"vector": 1}))
+        if docs:
+            self.collection.update_many(
+                {"_id": {"$in": [doc["_id"] for doc in docs]}},
+                {"$set": {"last_used": datetime.now(timezone.utc)}},
+            )
+        found = {doc["_id"]: _unpack(doc["vector"]) for doc in docs}
+        self.stats.hits += len(found)
+        self.stats.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, entries: dict):
+        from pymongo import UpdateOne
+
+        if not entries:
+            return
+        now = datetime.now(timezone.utc)
+        self.collection.bulk_write(
+            [
+                UpdateOne({"_id": key}, {"$setOnInsert": {"vector": _pack(vector)}, "$set": {"last_used": now}}, upsert=True)
+                for key, vector in entries.items()
+            ],
+            ordered=False,
+        )
+        overflow = self.collection.estimated_document_count() - self.max_entries
+        if overflow > 0:
+            oldest = [doc["_id"] for doc in self.collection.find({}, {"_id": 1}).sort("last_used", 1).limit(overflow)]
+            self.stats.evictions += self.collection.delete_many({"_id": {"$in": oldest}}).deleted_count
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    """
+    Returns the process-wide cache selected by EMBED_CACHE_BACKEND
+    ("sqlite", "mongo" or None to disable).
+    """
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None and EMBED_CACHE_BACKEND == "sqlite":
+            _default_cache = SQLiteEmbeddingCache()
+        elif _default_cache is None and EMBED_CACHE_BACKEND == "mongo":
+            from resources import get_db
+
+            _default_cache = MongoEmbeddingCache(get_db()["embedding_cache"])
+        return _default_cache
@@ -0,0 +1,293 @@
+import time
+import random
+import socket
+import logging
+import threading
+import httpx
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config import (
+    EMBED_BATCH_SIZE,
+    EMBED_MIN_BATCH_SIZE,
+    EMBED_MAX_CONCURRENCY,
+    EMBED_REQUESTS_PER_MINUTE,
+    EMBED_TOKENS_PER_MINUTE,
+    EMBED_MAX_RETRIES,
+    EMBED_TARGET_LATENCY,
+)
+from embedding_cache import cache_key
+from metrics import Counter, Histogram
+
+logger = logging.getLogger("uvicorn")
+
+EMBED_REQUEST_SECONDS = Histogram("unrepo_embed_request_seconds", "Latency of embedding API calls")
+EMBEDDED_CHUNKS = Counter("unrepo_embedded_chunks_total", "Chunks embedded by the API (cache hits excluded)")
+EMBEDDED_TOKENS = Counter("unrepo_embedded_tokens_total", "Tokens sent to the embedding API")
+EMBED_RETRIES = Counter("unrepo_embed_retries_total", "Embedding calls retried, by cause", ("cause",))
+EMBED_CACHE_LOOKUPS = Counter("unrepo_embedding_cache_lookups_total", "Embedding cache lookups", ("result",))
+
+
+class RateLimitError(Exception):
+    """
+    Raised by embedders (real or fake) when the provider answers with a 429.
+    """
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    if isinstance(e, RateLimitError):
+        return True
+    # google.genai.errors.APIError carries the HTTP status in `code`
+    if getattr(e, "code", None) == 429 or getattr(e, "status_code", None) == 429:
+        return True
+    return "RESOURCE_EXHAUSTED" in str(e)
+
+
+def _status_code(e: Exception):
+    code = getattr(e, "code", None)
+    if code is None:
+        code = getattr(e, "status_code", None)
+    if code is None:
+        code = getattr(getattr(e, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable_error(e: Exception) -> bool:
+    """
+    429s, 5xx (and 408) responses and transport errors are worth retrying.
+    Anything else (bad input, bad or missing key, permission denied) fails
+    the same way every time.
+    """
+    if is_rate_limit_error(e):
+        return True
+    code = _status_code(e)
+    if code is not None:
+        return code == 408 or code >= 500
+    return isinstance(e, (httpx.TransportError, ConnectionError, TimeoutError, socket.timeout))
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled continuously at `per_minute` tokens/min.
+    """
+
+    def __init__(self, per_minute: float, capacity: float = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount: float = 1):
+        # A single request larger than the bucket can never fit, so clamp it
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait_for = (amount - self.tokens) / self.rate
+            time.sleep(wait_for)
+
+    def drain(self):
+        """
+        Empties the bucket, e.g. after the provider told us we're over quota.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens = 0
+
+
+class EmbeddingStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.chunks = 0
+        self.tokens = 0
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+
+    def record(self, chunks: int, tokens: int):
+        with self.lock:
+            self.chunks += chunks
+            self.tokens += tokens
+            self.requests += 1
+
+    def summary(self) -> dict:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "seconds": round(elapsed, 3),
+            "chunks_per_sec": round(self.chunks / elapsed, 2),
+            "tokens_per_sec": round(self.tokens / elapsed, 2),
+        }
+
+
+class EmbeddingEngine:
+    """
+    Keeps several embedding batches in flight while respecting requests/min and
+    tokens/min quotas.
+
+    Concurrency and batch size adapt AIMD-style: both are cut on a 429 and grow
+    back while batches complete under the target latency. Batches that fail
+    with a retryable error (see is_retryable_error) are retried with jittered
+    exponential backoff instead of being dropped; other errors are raised
+    straight away.
+    """
+
+    def __init__(
+        self,
+        embed_fn,
+        batch_size: int = EMBED_BATCH_SIZE,
+        min_batch_size: int = EMBED_MIN_BATCH_SIZE,
+        max_concurrency: int = EMBED_MAX_CONCURRENCY,
+        requests_per_minute: float = EMBED_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = EMBED_TOKENS_PER_MINUTE,
+        max_retries: int = EMBED_MAX_RETRIES,
+        target_latency: float = EMBED_TARGET_LATENCY,
+        cache=None,
+    ):
+        self.embed_fn = embed_fn
+        self.cache = cache
+        self.max_batch_size = batch_size
+        self.min_batch_size = min(min_batch_size, batch_size)
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.target_latency = target_latency
+        self.request_bucket = TokenBucket(requests_per_minute, capacity=max(1, max_concurrency))
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.stats = EmbeddingStats()
+        self.lock = threading.Lock()
+
+    def _on_success(self, latency: float):
+        with self.lock:
+            if latency <= self.target_latency:
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                self.batch_size = min(self.max_batch_size, self.batch_size + self.min_batch_size)
+            else:
+                self.batch_size = max(self.min_batch_size, self.batch_size - self.min_batch_size)
+
+    def _on_rate_limit(self):
+        with self.lock:
+            self.concurrency = max(1, self.concurrency // 2)
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            self.stats.rate_limited += 1
+        self.request_bucket.drain()
+
+    def _embed_batch(self, batch: list[dict]) -> list[list[float]]:
+        texts = [item["text"] for item in batch]
+        tokens = sum(item["tokens"] for item in batch)
+        for attempt in range(self.max_retries + 1):
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(tokens)
+            start = time.monotonic()
+            try:
+                embeddings = self.embed_fn(texts)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    raise
+                rate_limited = is_rate_limit_error(e)
+                if rate_limited:
+                    self._on_rate_limit()
+                EMBED_RETRIES.inc(cause="rate_limit" if rate_limited else "error")
+                with self.lock:
+                    self.stats.retries += 1
+                delay = min(30.0, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"⚠️ Embedding batch failed (attempt {attempt + 1}), retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                continue
+            if len(embeddings) != len(texts):
+                raise RuntimeError(f"Embedder returned {len(embeddings)} vectors for {len(texts)} texts")
+            latency = time.monotonic() - start
+            EMBED_REQUEST_SECONDS.observe(latency)
+            EMBEDDED_CHUNKS.inc(len(batch))
+            EMBEDDED_TOKENS.inc(tokens)
+            self._on_success(latency)
+            self.stats.record(len(batch), tokens)
+            if self.cache is not None:
+                self.cache.put_many({item["cache_key"]: vector for item, vector in zip(batch, embeddings)})
+            return embeddings
+
+    def _next_batch(self, items) -> list[dict]:
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                break
+        return batch
+
+    def _split_cached(self, batch: list[dict]):
+        """
+        Returns (hits, misses): hits as (item, embedding) pairs served from the
+        cache, misses as items that still need an API call.
+        """
+        if self.cache is None or not batch:
+            return [], batch
+        keys = [cache_key(item["text"]) for item in batch]
+        found = self.cache.get_many(keys)
+        hits, misses = [], []
+        for key, item in zip(keys, batch):
+            if key in found:
+                hits.append((item, found[key]))
+            else:
+                item["cache_key"] = key
+                misses.append(item)
+        EMBED_CACHE_LOOKUPS.inc(len(hits), result="hit")
+        EMBED_CACHE_LOOKUPS.inc(len(misses), result="miss")
+        return hits, misses
+
+    def embed_batches(self, items):
+        """
+        Embeds an iterable of `{"text": str, "tokens": int, ...}` dicts.
+
+        Yields a list of `(item, embedding)` pairs per completed batch, so
+        results from different batches may arrive out of input order. With a
+        cache, each batch's hits are yielded straight away and only misses
+        are sent to the embedder. Input is consumed lazily, at most
+        `max_concurrency` batches ahead of the consumer.
+        """
+        items = iter(items)
+        exhausted = False
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embed") as pool:
+            try:
+                while in_flight or not exhausted:
+                    while not exhausted and len(in_flight) < self.concurrency:
+                        batch = self._next_batch(items)
+                        if not batch:
+                            exhausted = True
+                            break
+                        hits, batch = self._split_cached(batch)
+                        if hits:
+                            yield hits
+                        if batch:
+                            in_flight[pool.submit(self._embed_batch, batch)] = batch
+
+                    if not in_flight:
+                        continue
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch = in_flight.pop(future)
+                        yield list(zip(batch, future.result()))
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+    def embed(self, items):
+        """
+        Same as embed_batches, one `(item, embedding)` pair at a time.
+        """
+        for batch in self.embed_batches(items):
+            yield from batch
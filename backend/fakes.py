@@ -0,0 +1,203 @@
+import time
+import random
+import asyncio
+import hashlib
+import threading
+
+from embedding_engine import RateLimitError
+
+# Local stand-ins for the Gemini APIs, used by benchmarks and offline runs.
+
+
+def fake_vector(text: str, dim: int = 768) -> list[float]:
+    """
+    Deterministic pseudo-embedding: the same text always maps to the same vector.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+class FakeEmbedder:
+    """
+    Callable with the same contract as `embedding.get_embeddings`.
+
+    Injects `latency` (+/- `jitter`) seconds per call and raises RateLimitError
+    when more than `requests_per_minute` calls land within a rolling minute, or
+    randomly with probability `rate_limit_prob`. The first calls raise the
+    exceptions in `failures`, one each, in order. `attempts` counts every call.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, requests_per_minute=None, rate_limit_prob=0.0, dim=768, seed=0,
+                 failures=()):
+        self.latency = latency
+        self.jitter = jitter
+        self.requests_per_minute = requests_per_minute
+        self.rate_limit_prob = rate_limit_prob
+        self.dim = dim
+        self.rng = random.Random(seed)
+        self.failures = list(failures)
+        self.calls = []
+        self.attempts = 0
+        self.rate_limited = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, texts: list[str]) -> list[list[float]]:
+        with self.lock:
+            self.attempts += 1
+            if self.failures:
+                raise self.failures.pop(0)
+            now = time.monotonic()
+            self.calls = [t for t in self.calls if now - t < 60]
+            over_quota = self.requests_per_minute is not None and len(self.calls) >= self.requests_per_minute
+            if over_quota or self.rng.random() < self.rate_limit_prob:
+                self.rate_limited += 1
+                raise RateLimitError("429 RESOURCE_EXHAUSTED (fake)")
+            self.calls.append(now)
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        time.sleep(delay)
+        return [fake_vector(text, self.dim) for text in texts]
+
+
+class FakeResponse:
+    def __init__(self, text: str = None, embeddings=None):
+        self.text = text
+        self.embeddings = embeddings
+
+
+class FakeEmbedding:
+    def __init__(self, values):
+        self.values = values
+
+
+class FakeGenerator:
+    """
+    Stand-in for `genai_client.aio.models`: async `generate_content`,
+    `generate_content_stream` and `embed_content` with the same call shape.
+    Answers with `words` words after `first_token_latency` seconds, then one
+    word every `token_interval` seconds. `calls` counts generations,
+    `embed_calls` embedding calls and `cancelled` streams closed early.
+    """
+
+    def __init__(self, words=60, first_token_latency=0.5, token_interval=0.02, embed_latency=0.05, dim=768):
+        self.words = words
+        self.first_token_latency = first_token_latency
+        self.token_interval = token_interval
+        self.embed_latency = embed_latency
+        self.dim = dim
+        self.calls = 0
+        self.embed_calls = 0
+        self.cancelled = 0
+
+    def _words(self, contents):
+        question = contents.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+        return [f"word{i}" if i else f"Answer to {question!r}:" for i in range(self.words)]
+
+    async def embed_content(self, model=None, contents=(), config=None):
+        self.embed_calls += 1
+        await asyncio.sleep(self.embed_latency)
+        return FakeResponse(embeddings=[FakeEmbedding(fake_vector(text, self.dim)) for text in contents])
+
+    async def generate_content(self, model=None, contents="", config=None):
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency + self.token_interval * self.words)
+        return FakeResponse(" ".join(self._words(contents)))
+
+    async def generate_content_stream(self, model=None, contents="", config=None):
+        self.calls += 1
+        words = self._words(contents)
+
+        async def stream():
+            finished = False
+            try:
+                await asyncio.sleep(self.first_token_latency)
+                for i, word in enumerate(words):
+                    if i:
+                        await asyncio.sleep(self.token_interval)
+                    yield FakeResponse(word if i == 0 else " " + word)
+                finished = True
+            finally:
+                if not finished:
+                    self.cancelled += 1
+        return stream()
+
+
+class FakeAsyncCollection:
+    """
+    Just enough of an AsyncMongoClient collection for the /query path:
+    `find_one` and `update_one` with equality filters over an in-memory list
+    of documents.
+    """
+
+    def __init__(self, docs=None, latency=0.0):
+        self.docs = list(docs or [])
+        self.latency = latency
+
+    async def find_one(self, filter=None, projection=None):
+        await asyncio.sleep(self.latency)
+        for doc in self.docs:
+            if all(doc.get(field) == value for field, value in (filter or {}).items()):
+                return dict(doc)
+        return None
+
+    async def update_one(self, filter, update, upsert=False):
+        await asyncio.sleep(self.latency)
+        for doc in self.docs:
+            if all(doc.get(field) == value for field, value in filter.items()):
+                doc.update(update.get("$set", {}))
+                return
+        if upsert:
+            self.docs.append({**filter, **update.get("$set", {})})
+
+
+class FakeAsyncMongo:
+    """
+    `client[db][collection]` over FakeAsyncCollections, created on first use.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return _FakeDatabase(self, name)
+
+    async def close(self):
+        pass
+
+
+class _FakeDatabase:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def __getitem__(self, name):
+        key = (self.name, name)
+        if key not in self.client.collections:
+            self.client.collections[key] = FakeAsyncCollection(latency=self.client.latency)
+        return self.client.collections[key]
+
+
+class BulkWriteCollection:
+    """
+    Wraps a mongomock collection so `bulk_write` of UpdateOne upserts works
+    with current pymongo (mongomock rejects the ops' newer fields); everything
+    else is passed through.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    def bulk_write(self, ops, ordered=True):
+        upserted = modified = 0
+        for op in ops:
+            result = self.collection.update_one(op._filter, op._doc, upsert=op._upsert)
+            upserted += result.upserted_id is not None
+            modified += result.modified_count
+
+        class Result:
+            bulk_api_result = {"nUpserted": upserted, "nModified": modified}
+        return Result()
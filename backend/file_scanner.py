@@ -1,16 +1,188 @@
 import os
-from config import VALID_EXTENSIONS, EXCLUDE_DIRS
+import re
+import math
+import fnmatch
+import logging
+import subprocess
+from collections import Counter
+from config import (
+    VALID_EXTENSIONS,
+    EXCLUDE_DIRS,
+    SCAN_MAX_FILE_BYTES,
+    SCAN_MAX_DATA_FILE_BYTES,
+    SCAN_DATA_EXTENSIONS,
+    SCAN_MAX_NOTEBOOK_BYTES,
+    SCAN_MAX_REPO_BYTES,
+    SCAN_SAMPLE_BYTES,
+    SCAN_MAX_ENTROPY,
+    SCAN_MAX_AVG_LINE_LENGTH,
+    SCAN_GENERATED_NAMES,
+)
+
+logger = logging.getLogger("uvicorn")
+
+_VALID_EXTENSIONS = frozenset(VALID_EXTENSIONS)
+_GENERATED_NAMES = re.compile("|".join(fnmatch.translate(pattern) for pattern in SCAN_GENERATED_NAMES))
+# Header comments code generators leave (protoc, go generate, Facebook's @generated, ...)
+_GENERATED_MARKER = re.compile(
+    rb"^[ \t]*(#|//|/?\*|<!--|--|;)[^\n]*?(@generated|code generated .{0,80}do not edit"
+    rb"|generated by the protocol buffer compiler|auto-?generated (file|code)"
+    rb"|this file (is|was) (automatically )?generated)",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# Reasons a file is skipped, in the order they're checked (cheapest first)
+GENERATED_NAME = "generated_name"
+LINGUIST = "linguist_generated"
+GITIGNORED = "gitignored"
+TOO_LARGE = "too_large"
+BINARY = "binary"
+HIGH_ENTROPY = "high_entropy"
+MINIFIED = "minified"
+GENERATED_HEADER = "generated_header"
+REPO_CAP = "repo_cap"
 
 def get_code_files(base_path):
+    """
+    Walks `base_path` with os.scandir (no per-entry stat calls on Linux) and
+    returns matching files in a stable, sorted order so chunk ids are
+    deterministic across runs.
+    """
     files = []
-    for root, dirs, filenames in os.walk(base_path):
-        dirs[:] = [d for d in dirs if d not in EXCLUDE_DIRS]
-        for file in filenames:
-            ext = os.path.splitext(file)[1]
-            if ext in VALID_EXTENSIONS:
-                files.append(os.path.join(root, file))
+    stack = [base_path]
+    while stack:
+        root = stack.pop()
+        try:
+            with os.scandir(root) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in EXCLUDE_DIRS:
+                    subdirs.append(entry.path)
+            elif os.path.splitext(entry.name)[1] in _VALID_EXTENSIONS:
+                files.append(entry.path)
+        # Reversed so directories are visited in sorted order off the stack
+        stack.extend(reversed(subdirs))
     return files
 
+def _git_lines(repo_dir, args, paths=None):
+    result = subprocess.run(
+        ["git", "-C", repo_dir, *args],
+        input="\0".join(paths).encode() if paths is not None else None,
+        capture_output=True, check=True,
+    )
+    return result.stdout.decode("utf-8", errors="replace").split("\0")
+
+def git_excluded(repo_dir, rel_paths):
+    """
+    Returns (linguist, ignored): paths marked linguist-generated or
+    linguist-vendored in .gitattributes, and tracked paths that match
+    .gitignore rules. Both are empty when `repo_dir` isn't a git checkout.
+    """
+    if not rel_paths or not os.path.exists(os.path.join(repo_dir, ".git")):
+        return set(), set()
+    try:
+        # -z output is path, attribute, value triples
+        fields = _git_lines(repo_dir, ["check-attr", "-z", "--stdin", "linguist-generated", "linguist-vendored"], rel_paths)
+        linguist = {
+            fields[i] for i in range(0, len(fields) - 2, 3) if fields[i + 2] in ("set", "true")
+        }
+        ignored = set(_git_lines(repo_dir, ["ls-files", "-z", "--cached", "--ignored", "--exclude-standard"])) - {""}
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning(f"⚠️ Couldn't read git attributes/ignores in {repo_dir}: {e}")
+        return set(), set()
+    return linguist, ignored
+
+def _entropy(sample: bytes) -> float:
+    total = len(sample)
+    return -sum(count / total * math.log2(count / total) for count in Counter(sample).values())
+
+def sniff(sample: bytes):
+    """
+    Content checks on the first SCAN_SAMPLE_BYTES of a file; returns the skip
+    reason or None.
+    """
+    if b"\0" in sample:
+        return BINARY
+    if len(sample) >= 1024:
+        if _entropy(sample) > SCAN_MAX_ENTROPY:
+            return HIGH_ENTROPY
+        if len(sample) / (sample.count(b"\n") + 1) > SCAN_MAX_AVG_LINE_LENGTH:
+            return MINIFIED
+    if _GENERATED_MARKER.search(sample[:512]):
+        return GENERATED_HEADER
+    return None
+
+def _size_limit(ext):
+    if ext == ".ipynb":
+        return SCAN_MAX_NOTEBOOK_BYTES
+    if ext in SCAN_DATA_EXTENSIONS:
+        return SCAN_MAX_DATA_FILE_BYTES
+    return SCAN_MAX_FILE_BYTES
+
+def scan_files(base_path, max_repo_bytes=SCAN_MAX_REPO_BYTES):
+    """
+    get_code_files plus a pre-filter that drops files not worth embedding:
+    generated or vendored (by name, .gitattributes or header), gitignored,
+    over the size limit for their type, binary, high-entropy (base64 blobs,
+    compressed data), minified, or past the repo's total size cap.
+
+    Returns (files, report) where report is
+    {"kept": n, "kept_bytes": n, "skipped": {reason: {"files", "bytes", "examples"}}}.
+    """
+    candidates = get_code_files(base_path)
+    rel_paths = [os.path.relpath(path, base_path) for path in candidates]
+    linguist, ignored = git_excluded(base_path, rel_paths)
+
+    files, skipped, kept_bytes = [], {}, 0
+
+    def skip(reason, rel_path, size):
+        entry = skipped.setdefault(reason, {"files": 0, "bytes": 0, "examples": []})
+        entry["files"] += 1
+        entry["bytes"] += size
+        if len(entry["examples"]) < 5:
+            entry["examples"].append(rel_path)
+
+    for path, rel_path in zip(candidates, rel_paths):
+        name = os.path.basename(path)
+        ext = os.path.splitext(name)[1]
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        if _GENERATED_NAMES.match(name):
+            skip(GENERATED_NAME, rel_path, size)
+            continue
+        if rel_path in linguist:
+            skip(LINGUIST, rel_path, size)
+            continue
+        if rel_path in ignored:
+            skip(GITIGNORED, rel_path, size)
+            continue
+        if size > _size_limit(ext):
+            skip(TOO_LARGE, rel_path, size)
+            continue
+        if ext != ".ipynb":
+            # Notebooks are JSON with base64 outputs; the chunker keeps only cell sources
+            try:
+                with open(path, "rb") as f:
+                    reason = sniff(f.read(SCAN_SAMPLE_BYTES))
+            except OSError:
+                continue
+            if reason:
+                skip(reason, rel_path, size)
+                continue
+        if max_repo_bytes is not None and kept_bytes + size > max_repo_bytes:
+            skip(REPO_CAP, rel_path, size)
+            continue
+        files.append(path)
+        kept_bytes += size
+
+    return files, {"kept": len(files), "kept_bytes": kept_bytes, "skipped": skipped}
+
 def read_and_metadata(file_path, repo_root, repo_id):
     try:
         with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
@@ -28,4 +200,3 @@ def read_and_metadata(file_path, repo_root, repo_id):
     except Exception as e:
         print(f"⚠️ Skipping {file_path}: {e}")
         return None
-
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+
+from resources import get_db
+
+load_dotenv()
+
+meta_collection = get_db()["repo_indexes"]
+
+# One document per indexed repo, keyed by repo_id:
+#   {"_id": repo_id, "repo_url", "commit", "indexed_at", "mode",
+#    "version", "chunks", "bytes", "last_queried_at", "pinned"}
+# `commit` is the SHA the index was built from and is what refreshes diff against.
+# `version` is the live index build (chunk documents carry the same
+# `version`); swapping it in is a single update, see lifecycle.py. `chunks`
+# and `bytes` size that build, and `last_queried_at` / `pinned` drive eviction.
+
+
+def new_version() -> str:
+    """
+    Id for a new index build; sorts by creation time.
+    """
+    return datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
+
+
+def get_repo_index(repo_id: str):
+    return meta_collection.find_one({"_id": repo_id})
+
+
+def get_indexed_commit(repo_id: str):
+    meta = get_repo_index(repo_id)
+    return meta.get("commit") if meta else None
+
+
+def record_repo_index(repo_id: str, repo_url: str, commit: str, mode: str, version=None, chunks=None, size=None):
+    """
+    Records a finished build and makes `version` the live one. Returns the
+    previous document (None for a repo's first build).
+    """
+    fields = {
+        "repo_url": repo_url,
+        "commit": commit,
+        "mode": mode,
+        "indexed_at": datetime.now(timezone.utc),
+    }
+    if version is not None:
+        fields.update(version=version, chunks=chunks, bytes=size)
+    return meta_collection.find_one_and_update(
+        {"_id": repo_id},
+        {"$set": fields},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
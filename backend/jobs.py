@@ -0,0 +1,252 @@
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config import INDEX_WORKERS, JOB_STALE_SECONDS, JOB_PROGRESS_INTERVAL, JOB_HEARTBEAT_INTERVAL
+from answer_cache import answer_cache
+from coalesce import repo_status_cache
+from lifecycle import enforce_limits
+from resources import get_db
+from retrieval import get_retriever
+from metrics import Counter, Gauge
+
+logger = logging.getLogger("uvicorn")
+
+load_dotenv()
+
+jobs_collection = get_db()["index_jobs"]
+
+# Job lifecycle: queued -> cloning -> chunking -> embedding -> summarizing -> done | failed
+QUEUED = "queued"
+CLONING = "cloning"
+CHUNKING = "chunking"
+EMBEDDING = "embedding"
+SUMMARIZING = "summarizing"
+DONE = "done"
+FAILED = "failed"
+
+ACTIVE_STATES = (QUEUED, CLONING, CHUNKING, EMBEDDING, SUMMARIZING)
+TERMINAL_STATES = (DONE, FAILED)
+
+PROGRESS_FIELDS = ("files_total", "files_skipped", "files_done", "chunks_total", "chunks_embedded", "chunks_inserted")
+
+_executor = ThreadPoolExecutor(max_workers=INDEX_WORKERS, thread_name_prefix="indexer")
+_lock = threading.Lock()
+_running = {}  # repo_id -> Future, for jobs owned by this process
+_heartbeat = None
+
+# Jobs are owned by the process that claimed them. The owner refreshes
+# `heartbeat_at` on all of its jobs, queued or running, every
+# JOB_HEARTBEAT_INTERVAL; a job whose heartbeat is older than
+# JOB_STALE_SECONDS belongs to a process that died and can be re-claimed.
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+INDEX_JOBS = Counter("unrepo_index_jobs_total", "Finished index jobs, by status", ("status",))
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _public(job):
+    if job is None:
+        return None
+    job = dict(job)
+    job.pop("_id", None)
+    return job
+
+
+def get_job(repo_id: str):
+    """
+    Returns the job record for a repo, or None if it has never been queued.
+    """
+    return _public(jobs_collection.find_one({"_id": repo_id}))
+
+
+def _claim(repo_id: str, repo_url: str, refresh: bool = False, owner: str = OWNER):
+    """
+    Atomically creates (or recycles) the job record for a repo.
+
+    Returns (job, claimed). `claimed` is False when another caller, possibly in
+    another process, already owns an active job for the same repo.
+    """
+    now = _now()
+    stale_before = now - timedelta(seconds=JOB_STALE_SECONDS)
+    fresh = {
+        "repo_id": repo_id,
+        "repo_url": repo_url,
+        "refresh": refresh,
+        "status": QUEUED,
+        "error": None,
+        "owner": owner,
+        "heartbeat_at": now,
+        "created_at": now,
+        "updated_at": now,
+        "started_at": None,
+        "finished_at": None,
+        **{field: 0 for field in PROGRESS_FIELDS},
+    }
+    try:
+        job = jobs_collection.find_one_and_update(
+            {
+                "_id": repo_id,
+                "$or": [
+                    {"status": {"$in": list(TERMINAL_STATES)}},
+                    # Owner died (restart/crash) without finishing the job
+                    {"heartbeat_at": {"$lt": stale_before}},
+                    # Records written before jobs had heartbeats
+                    {"heartbeat_at": {"$exists": False}, "updated_at": {"$lt": stale_before}},
+                ],
+            },
+            {"$set": fresh},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return _public(job), True
+    except DuplicateKeyError:
+        # The filter didn't match but the _id exists: an active job is in flight
+        return get_job(repo_id), False
+
+
+def beat(repo_ids, owner: str = OWNER) -> int:
+    """
+    Refreshes the heartbeat of the given jobs that `owner` still owns.
+    Returns the number of those jobs.
+    """
+    if not repo_ids:
+        return 0
+    result = jobs_collection.update_many(
+        {"_id": {"$in": list(repo_ids)}, "owner": owner}, {"$set": {"heartbeat_at": _now()}}
+    )
+    # Not modified_count: a beat in the same millisecond as the last one changes nothing
+    return result.matched_count
+
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
+        with _lock:
+            repo_ids = list(_running)
+        try:
+            beat(repo_ids)
+        except Exception as e:
+            logger.warning(f"⚠️ Index job heartbeat failed: {e}")
+
+
+def _start_heartbeat():
+    # Called with _lock held
+    global _heartbeat
+    if _heartbeat is None:
+        _heartbeat = threading.Thread(target=_heartbeat_loop, name="index-heartbeat", daemon=True)
+        _heartbeat.start()
+
+
+class JobProgress:
+    """
+    Progress reporter handed to process_repo. Writes are throttled so that
+    per-batch updates don't turn into a Mongo round trip per batch.
+    """
+
+    def __init__(self, repo_id: str, interval: float = JOB_PROGRESS_INTERVAL, owner: str = OWNER):
+        self.repo_id = repo_id
+        self.owner = owner
+        self.interval = interval
+        self._pending = {}
+        self._last_flush = 0.0
+        # Pipeline stages report from several threads
+        self._lock = threading.Lock()
+
+    def __call__(self, status=None, **counters):
+        with self._lock:
+            self._pending.update(counters)
+            if status is not None:
+                self._pending["status"] = status
+            # Status transitions are always written immediately
+            due = status is not None or time.monotonic() - self._last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            update = {**self._pending, "updated_at": _now()}
+            self._pending = {}
+            self._last_flush = time.monotonic()
+        # A job re-claimed by another process is no longer ours to update
+        jobs_collection.update_one({"_id": self.repo_id, "owner": self.owner}, {"$set": update})
+
+
+def _run(repo_id: str, repo_url: str, refresh: bool):
+    # Imported here so that importing jobs doesn't pull in the whole pipeline
+    from main import process_repo
+
+    progress = JobProgress(repo_id)
+    jobs_collection.update_one(
+        {"_id": repo_id, "owner": OWNER}, {"$set": {"started_at": _now(), "updated_at": _now()}}
+    )
+    try:
+        process_repo(repo_url, progress=progress, refresh=refresh, repo_id=repo_id)
+        progress(status=DONE, finished_at=_now())
+        answer_cache.invalidate(repo_id)
+        repo_status_cache.invalidate(repo_id)
+        INDEX_JOBS.inc(status=DONE)
+        logger.info(f"✅ Index job finished: {repo_id}")
+        _enforce_limits(repo_id)
+    except Exception as e:
+        logger.error(f"❌ Index job failed for {repo_id}: {e}")
+        progress(status=FAILED, error=str(e), finished_at=_now())
+        repo_status_cache.invalidate(repo_id)
+        INDEX_JOBS.inc(status=FAILED)
+    finally:
+        with _lock:
+            _running.pop(repo_id, None)
+
+
+def _enforce_limits(repo_id: str):
+    # A new build is the only thing that grows the index
+    try:
+        enforce_limits(get_retriever(get_db()["code_chunks"]), protect=(repo_id,))
+    except Exception as e:
+        logger.warning(f"⚠️ Index eviction failed: {e}")
+
+
+def submit_index_job(repo_id: str, repo_url: str, refresh: bool = False):
+    """
+    Queues `process_repo` for a repo on the bounded worker pool and returns the
+    job record. Concurrent callers for the same repo share a single job.
+    With `refresh=True` the job only re-indexes files changed since the last index.
+    """
+    with _lock:
+        if repo_id in _running:
+            return get_job(repo_id)
+
+        job, claimed = _claim(repo_id, repo_url, refresh)
+        if not claimed:
+            return job
+
+        _running[repo_id] = _executor.submit(_run, repo_id, repo_url, refresh)
+        _start_heartbeat()
+        repo_status_cache.invalidate(repo_id)
+        logger.info(f"📥 Queued index job: {repo_id}")
+        return job
+
+
+def queue_depth() -> int:
+    """
+    Number of jobs owned by this process that are queued or running.
+    """
+    with _lock:
+        return len(_running)
+
+
+QUEUE_DEPTH = Gauge("unrepo_index_queue_depth", "Index jobs queued or running in this process", fn=queue_depth)
@@ -0,0 +1,176 @@
+import os
+import re
+import math
+import json
+import logging
+import threading
+from collections import Counter
+
+from config import BM25_K1, BM25_B
+
+logger = logging.getLogger("uvicorn")
+
+# Per-repo BM25 index over chunk content, file paths and symbols, for the
+# lexical half of hybrid retrieval. Identifiers are indexed whole and split
+# into parts, so "safe_truncate", "safeTruncate" and "truncate" all match.
+# Only postings, lengths and each row's (filepath, chunk_id) are kept, so a
+# build's memory doesn't grow with its content; search returns those ids and
+# HybridRetriever fetches the chunks. Persisted as one JSON file:
+# {"ids": [[filepath, chunk_id], ...], "lengths": [...], "postings": {term: {row: tf}}}.
+
+_WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+_PARTS = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+# Path and symbol terms count this many times as much as a content term
+_NAME_WEIGHT = 3
+
+
+def code_terms(text: str) -> list[str]:
+    terms = []
+    for word in _WORD.findall(text):
+        lower = word.lower()
+        terms.append(lower)
+        parts = _PARTS.findall(word)
+        if len(parts) > 1:
+            terms.extend(part.lower() for part in parts)
+    return terms
+
+
+def _doc_terms(doc) -> Counter:
+    counts = Counter(code_terms(doc["content"]))
+    names = code_terms(doc["filepath"].replace("__", "/") + " " + (doc.get("symbol") or ""))
+    for term in names:
+        counts[term] += _NAME_WEIGHT
+    return counts
+
+
+def chunk_id_of(doc) -> tuple:
+    return doc["filepath"], doc["chunk_id"]
+
+
+class LexicalIndex:
+    def __init__(self, path, k1=BM25_K1, b=BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.ids = []  # row -> (filepath, chunk_id), None once deleted
+        self.lengths = []
+        # term -> {row: term frequency}; deleted rows stay in here until save()
+        self.postings = {}
+        self.rows = {}  # (filepath, chunk_id) -> row
+        self.total_length = 0
+        self.dirty = False  # changes not written by save() yet
+        self.load()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        if not self.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if "ids" in data:
+            self.ids = [tuple(ref) for ref in data["ids"]]
+        else:
+            # Written before the index dropped chunk contents
+            self.ids = [chunk_id_of(doc) if doc is not None else None for doc in data["docs"]]
+        self.lengths = data["lengths"]
+        self.postings = {term: {int(row): tf for row, tf in rows.items()} for term, rows in data["postings"].items()}
+        self.rows = {ref: row for row, ref in enumerate(self.ids) if ref is not None}
+        self.total_length = sum(length for ref, length in zip(self.ids, self.lengths) if ref is not None)
+
+    def add(self, docs):
+        """
+        Indexes `docs` (any iterable, consumed once), replacing chunks with
+        the same filepath and chunk_id.
+        """
+        with self.lock:
+            for doc in docs:
+                ref = chunk_id_of(doc)
+                if ref in self.rows:
+                    self._remove(self.rows.pop(ref))
+                row = len(self.ids)
+                counts = _doc_terms(doc)
+                self.ids.append(ref)
+                self.lengths.append(sum(counts.values()))
+                self.total_length += self.lengths[row]
+                for term, tf in counts.items():
+                    self.postings.setdefault(term, {})[row] = tf
+                self.rows[ref] = row
+                self.dirty = True
+
+    def _remove(self, row):
+        # The row's postings are dropped by the next save()
+        self.total_length -= self.lengths[row]
+        self.ids[row] = None
+
+    def delete(self, filepaths=None):
+        filepaths = set(filepaths or ())
+        removed = 0
+        with self.lock:
+            for ref, row in list(self.rows.items()):
+                if ref[0] in filepaths:
+                    self._remove(row)
+                    del self.rows[ref]
+                    removed += 1
+            self.dirty = self.dirty or removed > 0
+        return removed
+
+    def search(self, query: str, k: int = 20) -> list[dict]:
+        """
+        Top-k chunks by BM25, each as {"filepath", "chunk_id", "score"}.
+        """
+        terms = set(code_terms(query))
+        with self.lock:
+            n = len(self.rows)
+            if not n:
+                return []
+            average = self.total_length / n
+            scores = Counter()
+            for term in terms:
+                rows = self.postings.get(term)
+                if not rows:
+                    continue
+                idf = math.log(1 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+                for row, tf in rows.items():
+                    if self.ids[row] is None:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[row] / average)
+                    scores[row] += idf * tf * (self.k1 + 1) / (tf + norm)
+            return [
+                {"filepath": self.ids[row][0], "chunk_id": self.ids[row][1], "score": score}
+                for row, score in scores.most_common(k)
+            ]
+
+    def save(self):
+        """
+        Writes the index compacted (deleted rows dropped) and swaps it in.
+        """
+        with self.lock:
+            live = [row for row, ref in enumerate(self.ids) if ref is not None]
+            renumber = {row: new for new, row in enumerate(live)}
+            postings = {}
+            for term, rows in self.postings.items():
+                kept = {renumber[row]: tf for row, tf in rows.items() if row in renumber}
+                if kept:
+                    postings[term] = kept
+            data = {
+                "ids": [self.ids[row] for row in live],
+                "lengths": [self.lengths[row] for row in live],
+                "postings": postings,
+            }
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, default=str)
+            os.replace(tmp, self.path)
+            self.ids, self.lengths, self.postings = data["ids"], data["lengths"], postings
+            self.rows = {ref: row for row, ref in enumerate(self.ids)}
+            self.dirty = False
+        logger.info(f"🔤 Saved lexical index {self.path} ({len(self.ids)} chunks, {len(self.postings)} terms)")
@@ -0,0 +1,200 @@
+import time
+import logging
+from datetime import datetime, timezone, timedelta
+from pymongo.errors import OperationFailure
+
+from resources import get_db
+from index_meta import meta_collection
+from summaries import summaries_collection
+from answer_cache import answer_cache
+from coalesce import repo_status_cache
+from metrics import Counter
+from config import (
+    INDEX_STORAGE_BUDGET_BYTES,
+    INDEX_TTL_DAYS,
+    INDEX_GC_BATCH,
+    INDEX_TOUCH_INTERVAL,
+    REPO_STATUS_CACHE_TTL,
+)
+
+logger = logging.getLogger("uvicorn")
+
+chunks_collection = get_db()["code_chunks"]
+jobs_collection = get_db()["index_jobs"]
+
+# Index lifecycle:
+#   builds    process_repo writes every build under a new `version` (a full
+#             build from scratch, a refresh starting from a copy of the live
+#             build), then record_repo_index swaps it in with one update, so
+#             queries only ever see a complete build. Older builds are
+#             deleted in batches once queries have moved over.
+#   eviction  repos not queried for INDEX_TTL_DAYS, then the least recently
+#             queried ones while the chunks of all repos are over
+#             INDEX_STORAGE_BUDGET_BYTES, are deleted entirely (chunks,
+#             summaries, metadata and job) and re-indexed on their next query.
+#             Pinned repos and repos with an active index job are kept.
+
+EVICTED_REPOS = Counter("unrepo_evicted_repos_total", "Repos evicted from the index, by reason", ("reason",))
+COLLECTED_CHUNKS = Counter("unrepo_collected_chunks_total", "Chunk documents deleted from old or evicted builds")
+
+_touched = {}  # repo_id -> monotonic time of this process's last last_queried_at write
+
+
+def copy_build(collection, repo_id: str, version, new_version: str, exclude_filepaths=()):
+    """
+    Server-side copy of a build's chunks (minus `exclude_filepaths`) into
+    `new_version`; the starting point of an incremental refresh.
+    """
+    collection.aggregate([
+        {"$match": {"repo_id": repo_id, "version": version, "filepath": {"$nin": list(exclude_filepaths)}}},
+        {"$project": {"_id": 0}},
+        {"$addFields": {"version": new_version}},
+        {"$merge": {"into": collection.name, "whenMatched": "keepExisting", "whenNotMatched": "insert"}},
+    ])
+
+
+def measure_build(collection, repo_id: str, version) -> tuple:
+    """
+    Returns (chunks, bytes) of a build; bytes is None on servers without $bsonSize.
+    """
+    query = {"repo_id": repo_id, "version": version}
+    try:
+        stats = list(collection.aggregate([
+            {"$match": query},
+            {"$group": {"_id": None, "chunks": {"$sum": 1}, "bytes": {"$sum": {"$bsonSize": "$$ROOT"}}}},
+        ]))
+    except OperationFailure:
+        return collection.count_documents(query), None
+    return (stats[0]["chunks"], stats[0]["bytes"]) if stats else (0, 0)
+
+
+def delete_chunks(collection, query: dict, batch: int = INDEX_GC_BATCH) -> int:
+    """
+    Deletes matching chunks `batch` documents at a time, so collecting a
+    large build never holds one huge delete against the live collection.
+    """
+    removed = 0
+    while True:
+        ids = [doc["_id"] for doc in collection.find(query, {"_id": 1}).limit(batch)]
+        if not ids:
+            break
+        removed += collection.delete_many({"_id": {"$in": ids}}).deleted_count
+    COLLECTED_CHUNKS.inc(removed)
+    return removed
+
+
+def retire_builds(repo_id: str, live_version: str, retriever, previous=None, collection=None,
+                  grace: float = REPO_STATUS_CACHE_TTL) -> int:
+    """
+    After a swap: deletes every chunk of `repo_id` outside the live build and
+    drops the retriever's index of the `previous` live build. Returns the
+    number of chunks deleted.
+    """
+    collection = collection if collection is not None else chunks_collection
+    repo_status_cache.invalidate(repo_id)
+    if previous is not None:
+        # Requests that looked the repo up just before the swap (here or in
+        # another process's status cache) may still search the previous build
+        time.sleep(grace)
+        retriever.drop(repo_id, previous.get("version"))
+    removed = delete_chunks(collection, {"repo_id": repo_id, "version": {"$ne": live_version}})
+    if removed:
+        logger.info(f"🧹 Removed {removed} chunks of old builds of {repo_id}")
+    return removed
+
+
+def discard_build(repo_id: str, version: str, retriever, collection=None):
+    """
+    Deletes an unfinished build, e.g. after process_repo failed half way.
+    """
+    collection = collection if collection is not None else chunks_collection
+    retriever.drop(repo_id, version)
+    removed = delete_chunks(collection, {"repo_id": repo_id, "version": version})
+    logger.info(f"🧹 Discarded build {version} of {repo_id} ({removed} chunks)")
+
+
+def evict_repo(repo_id: str, retriever=None, reason: str = "manual") -> int:
+    """
+    Deletes everything stored for a repo. Returns the number of chunks deleted.
+    """
+    meta = meta_collection.find_one({"_id": repo_id}, {"version": 1})
+    removed = delete_chunks(chunks_collection, {"repo_id": repo_id})
+    summaries_collection.delete_many({"repo_id": repo_id})
+    meta_collection.delete_one({"_id": repo_id})
+    jobs_collection.delete_one({"_id": repo_id})
+    if retriever is not None:
+        retriever.drop(repo_id, None)
+        if meta and meta.get("version"):
+            retriever.drop(repo_id, meta["version"])
+    answer_cache.invalidate(repo_id)
+    repo_status_cache.invalidate(repo_id)
+    EVICTED_REPOS.inc(reason=reason)
+    logger.info(f"🗑️ Evicted {repo_id} ({reason}, {removed} chunks)")
+    return removed
+
+
+def last_used(meta: dict) -> datetime:
+    value = meta.get("last_queried_at") or meta.get("indexed_at") or datetime.min
+    # Mongo returns naive UTC datetimes unless the client is tz_aware
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def plan_eviction(repos: list[dict], budget=INDEX_STORAGE_BUDGET_BYTES, ttl_days=INDEX_TTL_DAYS, now=None) -> list:
+    """
+    Picks repos to evict from their metadata documents: past the TTL first,
+    then least recently used until the rest fit the budget. Returns
+    [(repo_id, reason)]; the caller filters out repos that must be kept.
+    """
+    now = now or datetime.now(timezone.utc)
+    evict, kept = [], []
+    for meta in sorted(repos, key=last_used):
+        if ttl_days is not None and last_used(meta) < now - timedelta(days=ttl_days):
+            evict.append((meta["_id"], "ttl"))
+        else:
+            kept.append(meta)
+    if budget is not None:
+        total = sum(meta.get("bytes") or 0 for meta in kept)
+        for meta in kept:
+            if total <= budget:
+                break
+            evict.append((meta["_id"], "budget"))
+            total -= meta.get("bytes") or 0
+    return evict
+
+
+def enforce_limits(retriever=None, budget=INDEX_STORAGE_BUDGET_BYTES, ttl_days=INDEX_TTL_DAYS, protect=(),
+                   dry_run: bool = False) -> list:
+    """
+    Evicts repos past the TTL or over the storage budget. Pinned repos,
+    repos with an active index job and `protect` are never evicted.
+    Returns the [(repo_id, reason)] evicted (or that would be, with `dry_run`).
+    """
+    # jobs imports this module
+    from jobs import ACTIVE_STATES
+
+    repos = list(meta_collection.find(
+        {"pinned": {"$ne": True}}, {"bytes": 1, "last_queried_at": 1, "indexed_at": 1}
+    ))
+    busy = {job["_id"] for job in jobs_collection.find({"status": {"$in": list(ACTIVE_STATES)}}, {"_id": 1})}
+    keep = busy | set(protect)
+    if budget is not None:
+        # Kept repos still count towards the budget
+        pinned = meta_collection.find({"pinned": True}, {"bytes": 1})
+        budget -= sum(meta.get("bytes") or 0 for meta in pinned)
+        budget = max(0, budget - sum(meta.get("bytes") or 0 for meta in repos if meta["_id"] in keep))
+    evictions = plan_eviction([meta for meta in repos if meta["_id"] not in keep], budget, ttl_days)
+    if not dry_run:
+        for repo_id, reason in evictions:
+            evict_repo(repo_id, retriever, reason)
+    return evictions
+
+
+async def touch_repo(repo_indexes, repo_id: str, interval: float = INDEX_TOUCH_INTERVAL):
+    """
+    Records that a repo was queried, at most once per `interval` per process.
+    """
+    now = time.monotonic()
+    if now - _touched.get(repo_id, float("-inf")) < interval:
+        return
+    _touched[repo_id] = now
+    await repo_indexes.update_one({"_id": repo_id}, {"$set": {"last_queried_at": datetime.now(timezone.utc)}})
@@ -0,0 +1,335 @@
+import os
+import json
+import logging
+import threading
+import numpy as np
+
+from vector_codec import quantize_int8, dequantize_int8
+from config import (
+    LOCAL_INDEX_IVF_THRESHOLD,
+    LOCAL_INDEX_NPROBE,
+    LOCAL_INDEX_SEARCH_BATCH,
+    LOCAL_INDEX_DTYPE,
+    RESCORE_FACTOR,
+)
+
+logger = logging.getLogger("uvicorn")
+
+# On-disk layout of one repo's index (a directory):
+#   vectors.npy  (n, dim) L2-normalized vectors in the search dtype (float32,
+#                float16 or int8), memory-mapped on load
+#   scales.npy   per-row scales of int8 vectors
+#   full.npy     float32 vectors for rescoring, when the search dtype is lossy;
+#                only the rows of top candidates are ever read
+#   docs.jsonl   one chunk document per row (everything but the embedding)
+#   ivf.npz      coarse quantizer for large repos: centroids plus the rows of
+#                each inverted list, stored as (order, offsets)
+# Adds and deletes are applied in memory (appended rows, tombstones) and
+# written out by save(), which compacts the files and rebuilds the IVF lists.
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _chunk_key(doc):
+    # Unique within a build: a refresh drops a changed file's chunks before re-adding them
+    return doc["filepath"], doc["chunk_id"]
+
+
+def _top_k(scores, k):
+    """
+    Indices of the k largest scores per row, best first.
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def train_ivf(vectors, nlist, iterations=10, sample_size=None, seed=0):
+    """
+    Spherical k-means over (a sample of) the rows. Returns (centroids, order,
+    offsets): rows of list i are order[offsets[i]:offsets[i + 1]].
+    """
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    sample_size = min(n, sample_size or nlist * 64)
+    sample = np.asarray(vectors[np.sort(rng.choice(n, sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        for i in range(nlist):
+            members = sample[assign == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+
+    assign = np.empty(n, dtype=np.int32)
+    for start in range(0, n, LOCAL_INDEX_SEARCH_BATCH):
+        block = np.asarray(vectors[start:start + LOCAL_INDEX_SEARCH_BATCH])
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    order = np.argsort(assign, kind="stable").astype(np.int64)
+    offsets = np.searchsorted(assign[order], np.arange(nlist + 1)).astype(np.int64)
+    return centroids, order, offsets
+
+
+class LocalVectorIndex:
+    """
+    One repo's vectors, searched in-process by cosine similarity.
+
+    Up to `ivf_threshold` rows every search is exact: a batched matmul over
+    the memory-mapped matrix. Past that, save() trains an IVF quantizer and
+    searches only score the rows in the `nprobe` closest lists (plus rows
+    added since the last save, which are always scanned).
+
+    With a float16 or int8 `dtype`, saved rows are searched in that dtype for
+    `rescore_factor * k` candidates, which are re-ranked in float32.
+    """
+
+    def __init__(self, path, ivf_threshold=LOCAL_INDEX_IVF_THRESHOLD, nprobe=LOCAL_INDEX_NPROBE,
+                 dtype=LOCAL_INDEX_DTYPE, rescore_factor=RESCORE_FACTOR):
+        self.path = path
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.dtype = dtype
+        self.rescore_factor = rescore_factor
+        self.lock = threading.Lock()
+        self.base = None  # saved (n, dim) matrix, memory-mapped
+        self.scales = None
+        self.full = None
+        self.added = []  # vectors appended since the last save
+        self._added_matrix = None
+        self.docs = []  # row -> document, base rows first
+        self.live = np.zeros(0, dtype=bool)  # row -> not deleted or replaced
+        self._live_buffer = self.live
+        self.keys = {}  # chunk key -> row
+        self.ivf = None
+        self.load()
+
+    @property
+    def dim(self):
+        if self.base is not None:
+            return self.base.shape[1]
+        return self.added[0].shape[0] if self.added else None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def load(self):
+        vectors_path = os.path.join(self.path, "vectors.npy")
+        if not os.path.exists(vectors_path):
+            return
+        self.base = np.load(vectors_path, mmap_mode="r")
+        if os.path.exists(os.path.join(self.path, "scales.npy")):
+            self.scales = np.load(os.path.join(self.path, "scales.npy"))
+        if os.path.exists(os.path.join(self.path, "full.npy")):
+            self.full = np.load(os.path.join(self.path, "full.npy"), mmap_mode="r")
+        with open(os.path.join(self.path, "docs.jsonl"), encoding="utf-8") as f:
+            self.docs = [json.loads(line) for line in f]
+        self.live = self._live_buffer = np.ones(len(self.docs), dtype=bool)
+        self.keys = {_chunk_key(doc): row for row, doc in enumerate(self.docs)}
+        ivf_path = os.path.join(self.path, "ivf.npz")
+        if os.path.exists(ivf_path):
+            with np.load(ivf_path) as ivf:
+                self.ivf = (ivf["centroids"], ivf["order"], ivf["offsets"])
+
+    def add(self, docs):
+        """
+        Adds or replaces (by filepath and chunk_id) documents that
+        carry an "embedding".
+        """
+        docs = list(docs)
+        if not docs:
+            return
+        vectors = _normalize([doc["embedding"] for doc in docs])
+        with self.lock:
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-d embeddings, got {vectors.shape[1]}")
+            first = len(self.docs)
+            self._grow_live(len(docs))
+            for row, doc in enumerate(docs, start=first):
+                key = _chunk_key(doc)
+                if key in self.keys:
+                    self.live[self.keys[key]] = False
+                self.keys[key] = row
+                self.docs.append({field: value for field, value in doc.items() if field != "embedding"})
+            self.added.extend(vectors)
+            self._added_matrix = None
+
+    def _grow_live(self, count):
+        # `live` is a view of a buffer whose capacity doubles, so appending
+        # rows one at a time stays linear overall
+        n = len(self.live)
+        if n + count > len(self._live_buffer):
+            buffer = np.zeros(max(2 * len(self._live_buffer), n + count, 1024), dtype=bool)
+            buffer[:n] = self.live
+            self._live_buffer = buffer
+        self._live_buffer[n:n + count] = True
+        self.live = self._live_buffer[:n + count]
+
+    def delete(self, filepaths=None):
+        """
+        Drops the chunks of `filepaths`. Returns the number of chunks removed.
+        """
+        filepaths = set(filepaths or ())
+        removed = 0
+        with self.lock:
+            for key, row in list(self.keys.items()):
+                doc = self.docs[row]
+                if doc["filepath"] in filepaths:
+                    self.live[row] = False
+                    del self.keys[key]
+                    removed += 1
+        return removed
+
+    def get(self, ids) -> list[dict]:
+        """
+        Documents of the (filepath, chunk_id) `ids` that are in the index.
+        """
+        with self.lock:
+            return [self.docs[self.keys[ref]] for ref in ids if ref in self.keys]
+
+    def _snapshot(self):
+        with self.lock:
+            if self._added_matrix is None and self.added:
+                self._added_matrix = np.vstack(self.added)
+            return self.base, self.scales, self.full, self._added_matrix, self.live.copy(), self.ivf, self.docs
+
+    @staticmethod
+    def _rows(base, scales, rows):
+        """
+        Saved rows (a slice or an index array) as float32.
+        """
+        block = np.asarray(base[rows])
+        if scales is not None:
+            return dequantize_int8(block, scales[rows])
+        return block.astype(np.float32, copy=False)
+
+    def search_batch(self, queries, k=5):
+        """
+        Top-k documents for each query vector, as lists of docs with a "score".
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        base, scales, full, added, live, ivf, docs = self._snapshot()
+        n_base = base.shape[0] if base is not None else 0
+        final_k = k
+        if full is not None:
+            k *= self.rescore_factor
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+
+        def merge(scores, rows):
+            nonlocal best_scores, best_rows
+            scores = np.where(live[rows], scores, -np.inf)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, np.broadcast_to(rows, scores.shape)], axis=1)
+            keep = _top_k(best_scores, k)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        if base is not None and ivf is not None:
+            centroids, order, offsets = ivf
+            probes = _top_k(queries @ centroids.T, self.nprobe)
+            for q, lists in enumerate(probes):
+                rows = np.concatenate([order[offsets[i]:offsets[i + 1]] for i in lists])
+                rows.sort()  # sequential reads from the memory map
+                scores = np.full((len(queries), len(rows)), -np.inf, dtype=np.float32)
+                scores[q] = self._rows(base, scales, rows) @ queries[q]
+                merge(scores, rows)
+        elif base is not None:
+            for start in range(0, n_base, LOCAL_INDEX_SEARCH_BATCH):
+                block = self._rows(base, scales, slice(start, start + LOCAL_INDEX_SEARCH_BATCH))
+                merge(queries @ block.T, np.arange(start, start + len(block)))
+        if added is not None:
+            merge(queries @ added.T, np.arange(n_base, n_base + len(added)))
+
+        if full is not None:
+            for q, rows in enumerate(best_rows):
+                saved = (rows < n_base) & (best_scores[q] > -np.inf)
+                # Sorted index reads keep memory-map access sequential
+                order = np.argsort(rows[saved])
+                exact = np.empty(saved.sum(), dtype=np.float32)
+                exact[order] = np.asarray(full[rows[saved][order]]) @ queries[q]
+                best_scores[q, saved] = exact
+            keep = _top_k(best_scores, final_k)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        return [
+            [{**docs[row], "score": float(score)} for row, score in zip(rows, scores) if score > -np.inf]
+            for rows, scores in zip(best_rows, best_scores)
+        ]
+
+    def search(self, query, k=5):
+        return self.search_batch([query], k)[0]
+
+    def save(self):
+        """
+        Compacts live rows into fresh files (written aside, then swapped in),
+        rebuilds the IVF lists if the index is large enough and reloads.
+        """
+        with self.lock:
+            base = self.full if self.full is not None else self.base
+            added, live, docs = self.added, self.live.copy(), list(self.docs)
+            os.makedirs(self.path, exist_ok=True)
+            parts = []
+            n_base = base.shape[0] if base is not None else 0
+            if base is not None:
+                parts.append(self._rows(base, self.scales if self.full is None else None, slice(None))[live[:n_base]])
+            if added:
+                parts.append(np.vstack(added)[live[n_base:]])
+            rows = np.flatnonzero(live)
+            if not len(rows):
+                self._remove("vectors.npy", "scales.npy", "full.npy", "docs.jsonl", "ivf.npz")
+                self._reset()
+                return
+            vectors = np.vstack(parts)
+
+            if self.dtype == "float32":
+                np.save(os.path.join(self.path, "vectors.tmp.npy"), vectors)
+            else:
+                if self.dtype == "int8":
+                    codes, scales = quantize_int8(vectors)
+                    np.save(os.path.join(self.path, "vectors.tmp.npy"), codes)
+                    np.save(os.path.join(self.path, "scales.tmp.npy"), scales)
+                else:
+                    np.save(os.path.join(self.path, "vectors.tmp.npy"), vectors.astype(np.float16))
+                np.save(os.path.join(self.path, "full.tmp.npy"), vectors)
+            with open(os.path.join(self.path, "docs.tmp.jsonl"), "w", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(docs[row], default=str) + "\n")
+            ivf_path = os.path.join(self.path, "ivf.npz")
+            if len(vectors) > self.ivf_threshold:
+                nlist = min(4096, int(np.sqrt(len(vectors))))
+                centroids, order, offsets = train_ivf(vectors, nlist)
+                np.savez(os.path.join(self.path, "ivf.tmp.npz"), centroids=centroids, order=order, offsets=offsets)
+                os.replace(os.path.join(self.path, "ivf.tmp.npz"), ivf_path)
+            elif os.path.exists(ivf_path):
+                os.remove(ivf_path)
+            self._remove("scales.npy", "full.npy")
+            for name in ("vectors.npy", "scales.npy", "full.npy", "docs.jsonl"):
+                stem, ext = os.path.splitext(name)
+                tmp = os.path.join(self.path, f"{stem}.tmp{ext}")
+                if os.path.exists(tmp):
+                    os.replace(tmp, os.path.join(self.path, name))
+
+            self._reset()
+            self.load()
+        logger.info(f"🧭 Saved local vector index {self.path} ({len(vectors)} {self.dtype} vectors)")
+
+    def _remove(self, *names):
+        for name in names:
+            if os.path.exists(os.path.join(self.path, name)):
+                os.remove(os.path.join(self.path, name))
+
+    def _reset(self):
+        self.base, self.scales, self.full, self.ivf = None, None, None, None
+        self.added, self._added_matrix = [], None
+        self.docs, self.live, self.keys = [], np.zeros(0, dtype=bool), {}
+        self._live_buffer = self.live
@@ -3,25 +3,28 @@ from dotenv import load_dotenv
 import shutil
 import os
 import sys
-import json
+import argparse
 import math
 import logging
-import certifi
 import tempfile
-import tiktoken
-from tqdm import tqdm
-import time
-from pymongo import MongoClient
 from urllib.parse import urlparse
-from more_itertools import chunked
 
 
 # Local modules
-from repo_cloner import clone_repo
-from file_scanner import get_code_files, read_and_metadata
-from chunker import split_into_chunks
-from save_jsonl import save_chunks_jsonl
+from repo_cloner import clone_repo, get_head_commit, has_commit, diff_name_status
+from index_meta import get_indexed_commit, get_repo_index, record_repo_index, new_version
+from lifecycle import copy_build, measure_build, retire_builds, discard_build
+from file_scanner import scan_files
+from summaries import build_summary_index, ensure_summary_indexes
 from embedding import get_embeddings  # Updated to batch embeddings
+from embedding_cache import get_default_cache
+from writer import ensure_chunk_indexes
+from retrieval import get_retriever
+from resources import get_db
+from pipeline import iter_file_chunks, prefetch, spill_jsonl, embed_and_write
+from tokenizer import truncate
+from metrics import Counter, Gauge, stage
+from config import SPILL_JSONL, MAX_EMBED_TOKENS, BUILD_SUMMARIES
 
 # Load environment variables
 load_dotenv()
@@ -29,8 +32,7 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 MONGODB_URI = os.getenv("MONGODB_URI")
 
 # MongoDB setup
-client = MongoClient(MONGODB_URI, tlsCAFile=certifi.where())
-collection = client["unrepo"]["code_chunks"]
+collection = get_db()["code_chunks"]
 
 # FastAPI app
 app = FastAPI()
@@ -39,20 +41,32 @@ app = FastAPI()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("uvicorn")
 
-# Token truncation setup
-MAX_EMBED_TOKENS = 2048
-encoding = tiktoken.get_encoding("cl100k_base")
-
-def safe_truncate(text: str, max_tokens=MAX_EMBED_TOKENS) -> str:
-    tokens = encoding.encode(text)
-    if len(tokens) <= max_tokens:
-        return text
-    truncated = encoding.decode(tokens[:max_tokens])
-    return truncated
-
-
-def count_tokens(text: str) -> int:
-    return len(encoding.encode(text))
+INDEX_RUNS = Counter("unrepo_index_runs_total", "Completed process_repo runs, by mode", ("mode",))
+SKIPPED_FILES = Counter("unrepo_skipped_files_total", "Files dropped by the scan pre-filter, by reason", ("reason",))
+INDEX_CHUNKS_PER_SEC = Gauge("unrepo_index_chunks_per_second", "Embedding throughput of the last index run")
+
+def embed_items(chunks):
+    """
+    Wraps chunks into the `{"text", "tokens"}` items EmbeddingEngine expects,
+    reusing the token count computed at chunking time.
+    """
+    for chunk in chunks:
+        text, tokens = chunk["content"], chunk.get("tokens")
+        if tokens is None or tokens > MAX_EMBED_TOKENS:
+            text, tokens = truncate(text, MAX_EMBED_TOKENS)
+        yield {"text": text, "tokens": tokens, "chunk": chunk}
+
+def log_skipped(scan):
+    skipped = scan["skipped"]
+    if not skipped:
+        return
+    files = sum(entry["files"] for entry in skipped.values())
+    size = sum(entry["bytes"] for entry in skipped.values())
+    reasons = ", ".join(f"{reason} {entry['files']}" for reason, entry in sorted(skipped.items(), key=lambda item: -item[1]["files"]))
+    logger.info(f"🚫 Skipped {files} files ({size / 1e6:.1f} MB): {reasons}")
+    for reason, entry in skipped.items():
+        SKIPPED_FILES.inc(entry["files"], reason=reason)
+        logger.debug(f"   {reason}: {', '.join(entry['examples'])}")
 
 def get_repo_id(repo_url: str) -> str:
     parts = urlparse(repo_url).path.strip("/").split("/")
@@ -61,79 +75,146 @@ def get_repo_id(repo_url: str) -> str:
     owner, repo = parts
     return f"{owner}/{repo}"
 
-def process_repo(repo_url):
-    repo_id = get_repo_id(repo_url)  # e.g., "owner/repo"
+def _no_progress(status=None, **counters):
+    pass
+
+def plan_refresh(repo_dir, repo_id, files):
+    """
+    Works out which files an incremental refresh has to touch.
+
+    Returns (files_to_index, stale_filepaths) where stale_filepaths are the
+    stored `filepath` values whose chunks must be dropped, or None if the repo
+    has no usable previous index and needs a full build.
+    """
+    old_commit = get_indexed_commit(repo_id)
+    if not old_commit or not has_commit(repo_dir, old_commit):
+        return None
+
+    changes = diff_name_status(repo_dir, old_commit)
+    changed = set(changes["added"]) | set(changes["modified"])
+    stale = changes["modified"] + changes["deleted"]
+    files_to_index = [f for f in files if os.path.relpath(f, repo_dir) in changed]
+    logger.info(
+        f"🔁 {repo_id} {old_commit[:7]}..HEAD: {len(changes['added'])} added, "
+        f"{len(changes['modified'])} modified, {len(changes['deleted'])} deleted"
+    )
+    return files_to_index, [f"{repo_id}/{path}" for path in stale]
+
+def process_repo(repo_url, progress=None, refresh=False, repo_id=None, summarize=BUILD_SUMMARIES):
+    """
+    Clones, chunks, embeds and stores a repo.
+
+    `progress` is an optional callable `progress(status=None, **counters)` used
+    by background jobs to report the current stage and counters.
+
+    Every run writes a new index build (see lifecycle.py) that is swapped in
+    once complete; until then queries keep using the live build, and a failed
+    run leaves it untouched. With `refresh=True`, the new build starts as a
+    copy of the live one and only files changed since the indexed commit are
+    re-chunked and re-embedded. Falls back to a full build when there's no
+    previous index to diff against.
+    `repo_id` overrides the id derived from the URL (e.g. for local clones).
+    With `summarize=True`, the summary index (per-file, per-directory and repo
+    summaries) is rebuilt once the new build is live; unchanged nodes are reused.
+    """
+    progress = progress or _no_progress
+    repo_id = repo_id or get_repo_id(repo_url)  # e.g., "owner/repo"
     sanitized_repo_id = repo_id.replace("/", "__")  # safe for folder names
 
     with tempfile.TemporaryDirectory() as temp_dir:
-        repo_dir = clone_repo(repo_url, dest_dir=os.path.join(temp_dir, sanitized_repo_id))
-        files = get_code_files(repo_dir)
-        logger.info("📂 Got all files")
-
-        all_chunks = []
-        for file_path in files:
-            meta = read_and_metadata(file_path, repo_dir, repo_id)
-            if not meta:
-                continue
-            chunks = split_into_chunks(meta["content"])
-            for i, chunk in enumerate(chunks):
-                all_chunks.append({
-                    "content": chunk,
-                    "filepath": meta["filepath"],
-                    "repo": meta["repo"],
-                    "language": meta["language"],
-                    "chunk_id": i
-                })
-
-        jsonl_path = os.path.join(temp_dir, f"{sanitized_repo_id}_chunks.jsonl")
-        save_chunks_jsonl(all_chunks, path=jsonl_path)
-
-        # Insert to MongoDB with batching
-        inserted_count = 0
-        BATCH_SIZE = 50
-        with open(jsonl_path, "r") as f:
-            lines = [json.loads(line) for line in f]
-        
-        batches = list(chunked(lines, BATCH_SIZE))
-        for i, batch in enumerate(tqdm(batches, desc="🔄 Embedding", total=len(batches))):
-            contents = [safe_truncate(chunk["content"]) for chunk in batch]
-            token_counts = [len(encoding.encode(text)) for text in contents]
-            total_tokens = sum(token_counts)
-            
-            tqdm.write(f"📦 Batch {i+1}/{len(batches)} - {len(batch)} chunks, {total_tokens} tokens")
-            
-            try:
-                embeddings = get_embeddings(contents)
-            except Exception as e:
-                logger.warning(f"⚠️ Skipping batch due to embedding error: {e}")
-                time.sleep(1)
-                continue
-
-            for chunk, embedding in zip(batch, embeddings):
+        progress(status="cloning")
+        with stage("index", "clone"):
+            repo_dir = clone_repo(repo_url, dest_dir=os.path.join(temp_dir, sanitized_repo_id))
+            commit = get_head_commit(repo_dir)
+        with stage("index", "scan"):
+            files, scan = scan_files(repo_dir)
+        logger.info(f"📂 Got {len(files)} files ({scan['kept_bytes'] / 1e6:.1f} MB)")
+        log_skipped(scan)
+        scanned = files
+        progress(files_skipped=sum(entry["files"] for entry in scan["skipped"].values()))
+
+        retriever = get_retriever(collection)
+        ensure_chunk_indexes(collection)
+        live = get_repo_index(repo_id)
+        version = new_version()
+        try:
+            with stage("index", "plan"):
+                plan = plan_refresh(repo_dir, repo_id, files) if refresh else None
+                mode = "incremental" if plan else "full"
+                if plan:
+                    files, stale_filepaths = plan
+                    copy_build(collection, repo_id, live.get("version"), version, exclude_filepaths=stale_filepaths)
+                    retriever.copy(repo_id, live.get("version"), version, exclude_filepaths=stale_filepaths)
+            progress(status="chunking", files_total=len(files))
+
+            # Stream files -> chunks -> embeddings -> Mongo; nothing holds the whole repo
+            chunks = prefetch(iter_file_chunks(files, repo_dir, repo_id, progress))
+            if SPILL_JSONL:
+                chunks = spill_jsonl(chunks, os.path.join(temp_dir, f"{sanitized_repo_id}_chunks.jsonl"))
+
+            cache = get_default_cache()
+            # Chunking, embedding and inserting overlap; their own time is in the
+            # "chunk" stage and the embed request / insert batch histograms
+            with stage("index", "embed_and_write"):
+                engine, writer = embed_and_write(
+                    embed_items(chunks), repo_id, commit, collection, get_embeddings,
+                    cache=cache, progress=progress, retriever=retriever, version=version
+                )
+            inserted_count = writer.stats["written"]
+            if writer.stats["failed"]:
+                logger.warning(f"⚠️ Build {version} of {repo_id} is missing {writer.stats['failed']} chunks that failed to write")
+
+            with stage("index", "flush"):
+                retriever.flush(repo_id, version=version)
+                chunk_count, size = measure_build(collection, repo_id, version)
+                # The swap: from here on queries search the new build
+                record_repo_index(repo_id, repo_url, commit, mode, version=version, chunks=chunk_count, size=size)
+        except BaseException:
+            discard_build(repo_id, version, retriever, collection)
+            raise
+        with stage("index", "cleanup"):
+            retire_builds(repo_id, version, retriever, previous=live, collection=collection)
+        # After the swap, so summarizing never holds back the new chunk index
+        if summarize:
+            progress(status="summarizing")
+            with stage("index", "summarize"):
                 try:
-                    doc = {
-                        "repo_id": repo_id,
-                        "content": chunk["content"],
-                        "filepath": chunk["filepath"],
-                        "language": chunk["language"],
-                        "embedding": embedding
-                    }
-                    collection.insert_one(doc)
-                    inserted_count += 1
+                    ensure_summary_indexes()
+                    build_summary_index(repo_dir, scanned, repo_id, commit, changed=files if plan else None)
                 except Exception as e:
-                    logger.warning(f"❌ Failed to insert chunk: {e}")
-            time.sleep(0.5)  # gentle pacing between batches
-
-        logger.info(f"✅ Inserted {inserted_count} chunks into MongoDB for repo '{repo_id}'")
+                    # Queries fall back to chunk retrieval without summaries
+                    logger.warning(f"⚠️ Summary index failed for {repo_id}: {e}")
+
+        stats = engine.stats.summary()
+        INDEX_RUNS.inc(mode=mode)
+        if stats["chunks"]:
+            INDEX_CHUNKS_PER_SEC.set(stats["chunks_per_sec"])
+        logger.info(
+            f"⚡ Embedded {stats['chunks']} chunks in {stats['seconds']}s "
+            f"({stats['chunks_per_sec']} chunks/s, {stats['tokens_per_sec']} tokens/s, "
+            f"{stats['retries']} retries, {stats['rate_limited']} rate limited)"
+        )
+        if cache is not None:
+            cache_stats = cache.stats.summary()
+            logger.info(
+                f"🗃️ Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                f"({cache_stats['hit_rate']:.0%} hit rate), {cache_stats['evictions']} evicted"
+            )
+        logger.info(f"✅ Inserted {inserted_count} chunks into MongoDB for repo '{repo_id}' (build {version}, {chunk_count} chunks)")
         print(f"✅ Inserted {inserted_count} chunks into MongoDB for repo '{repo_id}'")
 
 # CLI entry
 if __name__ == "__main__":
-    if len(sys.argv) == 2:
-        repo_url = sys.argv[1]
-        process_repo(repo_url)
+    if len(sys.argv) >= 2:
+        parser = argparse.ArgumentParser(description="Index a GitHub repo")
+        parser.add_argument("repo_url")
+        parser.add_argument("--refresh", action="store_true", help="Only re-index files changed since the last index")
+        parser.add_argument("--repo-id", help="Override the owner/repo id (e.g. for local or file:// clones)")
+        parser.add_argument("--summaries", action="store_true", help="Also build the summary index")
+        args = parser.parse_args()
+        process_repo(args.repo_url, refresh=args.refresh, repo_id=args.repo_id, summarize=args.summaries or BUILD_SUMMARIES)
     else:
-        logger.info("💡 To process a GitHub repo: python main.py <github_repo_url>")
-        print("💡 To process a GitHub repo: python main.py <github_repo_url>")
+        logger.info("💡 To process a GitHub repo: python main.py <github_repo_url> [--refresh]")
+        print("💡 To process a GitHub repo: python main.py <github_repo_url> [--refresh]")
         logger.info("💡 To run API server: uvicorn main:app --reload")
         print("💡 To run API server: uvicorn main:app --reload")
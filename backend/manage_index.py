@@ -0,0 +1,124 @@
+import sys
+import json
+import argparse
+from dotenv import load_dotenv
+
+from resources import get_db
+from retrieval import get_retriever
+from index_meta import meta_collection
+from lifecycle import evict_repo, enforce_limits, delete_chunks, last_used, jobs_collection
+from jobs import ACTIVE_STATES
+from config import INDEX_STORAGE_BUDGET_BYTES, INDEX_TTL_DAYS
+
+# Index maintenance (replaces clear_db.py):
+#   python manage_index.py list
+#   python manage_index.py delete owner/repo [owner/repo ...]
+#   python manage_index.py delete --all --yes
+#   python manage_index.py evict [--budget-gb N] [--ttl-days N] [--dry-run]
+#   python manage_index.py gc [--dry-run]
+#   python manage_index.py pin|unpin owner/repo
+
+load_dotenv()
+
+collection = get_db()["code_chunks"]
+
+
+def list_repos() -> list[dict]:
+    """
+    Every repo with chunks, largest first; repos indexed before index
+    metadata existed show up with only a chunk count.
+    """
+    metas = {meta["_id"]: meta for meta in meta_collection.find()}
+    counts = {row["_id"]: row["chunks"] for row in collection.aggregate([
+        {"$group": {"_id": "$repo_id", "chunks": {"$sum": 1}}},
+    ])}
+    repos = []
+    for repo_id in sorted(set(metas) | set(counts)):
+        meta = metas.get(repo_id, {})
+        repos.append({
+            "repo_id": repo_id,
+            "version": meta.get("version"),
+            "commit": meta.get("commit"),
+            "chunks": meta.get("chunks"),
+            "stored_chunks": counts.get(repo_id, 0),  # all builds, including unfinished ones
+            "mb": round(meta["bytes"] / 1e6, 1) if meta.get("bytes") is not None else None,
+            "last_used": last_used(meta).isoformat() if meta else None,
+            "pinned": bool(meta.get("pinned")),
+        })
+    return sorted(repos, key=lambda repo: -(repo["mb"] or 0))
+
+
+def collect_orphans(retriever, dry_run: bool = False) -> dict:
+    """
+    Deletes chunks outside every repo's live build: unfinished builds of
+    crashed index runs and old builds a crash kept from being collected.
+    Repos that are being indexed are skipped. Returns {repo_id: chunks}.
+    """
+    live = {meta["_id"]: meta.get("version") for meta in meta_collection.find({}, {"version": 1})}
+    busy = {job["_id"] for job in jobs_collection.find({"status": {"$in": list(ACTIVE_STATES)}}, {"_id": 1})}
+    removed = {}
+    for repo_id in collection.distinct("repo_id"):
+        if repo_id not in live or repo_id in busy:
+            # Without metadata the repo was indexed before builds were versioned
+            continue
+        query = {"repo_id": repo_id, "version": {"$ne": live[repo_id]}}
+        if dry_run:
+            count = collection.count_documents(query)
+        else:
+            for version in collection.distinct("version", query):
+                retriever.drop(repo_id, version)
+            count = delete_chunks(collection, query)
+        if count:
+            removed[repo_id] = count
+    return removed
+
+
+def set_pinned(repo_id: str, pinned: bool):
+    result = meta_collection.update_one({"_id": repo_id}, {"$set": {"pinned": pinned}})
+    if not result.matched_count:
+        sys.exit(f"❌ {repo_id} has no index metadata")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, evict and garbage-collect indexed repos")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Show indexed repos with their size and last use")
+    delete = commands.add_parser("delete", help="Delete everything stored for some repos")
+    delete.add_argument("repo_ids", nargs="*")
+    delete.add_argument("--all", action="store_true", help="Delete every repo")
+    delete.add_argument("--yes", action="store_true", help="Confirm --all")
+    evict = commands.add_parser("evict", help="Evict repos past the TTL or over the storage budget")
+    evict.add_argument("--budget-gb", type=float, help="Override INDEX_STORAGE_BUDGET_BYTES")
+    evict.add_argument("--ttl-days", type=float, help="Override INDEX_TTL_DAYS")
+    evict.add_argument("--dry-run", action="store_true", help="Only report what would be evicted")
+    gc = commands.add_parser("gc", help="Delete chunks of builds that aren't live")
+    gc.add_argument("--dry-run", action="store_true", help="Only count them")
+    for name in ("pin", "unpin"):
+        commands.add_parser(name, help=f"{name.capitalize()} a repo against eviction").add_argument("repo_id")
+    args = parser.parse_args()
+
+    retriever = get_retriever(collection)
+    if args.command == "list":
+        result = list_repos()
+    elif args.command == "delete":
+        if args.all and not args.yes:
+            sys.exit("❌ Refusing to delete every repo without --yes")
+        if not args.all and not args.repo_ids:
+            sys.exit("❌ Name the repos to delete, or pass --all --yes")
+        if args.all:
+            repo_ids = set(collection.distinct("repo_id")) | {meta["_id"] for meta in meta_collection.find({}, {"_id": 1})}
+        else:
+            repo_ids = set(args.repo_ids)
+        result = {repo_id: evict_repo(repo_id, retriever) for repo_id in sorted(repo_ids)}
+    elif args.command == "evict":
+        budget = int(args.budget_gb * 1e9) if args.budget_gb is not None else INDEX_STORAGE_BUDGET_BYTES
+        ttl_days = args.ttl_days if args.ttl_days is not None else INDEX_TTL_DAYS
+        result = enforce_limits(retriever, budget=budget, ttl_days=ttl_days, dry_run=args.dry_run)
+    elif args.command == "gc":
+        result = collect_orphans(retriever, args.dry_run)
+    else:
+        set_pinned(args.repo_id, args.command == "pin")
+        result = {"repo_id": args.repo_id, "pinned": args.command == "pin"}
+
+    json.dump(result, sys.stdout, indent=2, default=str)
+    print()
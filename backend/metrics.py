@@ -0,0 +1,168 @@
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import METRICS_BUCKETS
+
+logger = logging.getLogger("uvicorn")
+
+# In-process metrics in the Prometheus text exposition format (served by
+# app.py on /metrics). Counters, gauges and histograms live in one registry
+# per process, so with several uvicorn workers every worker reports its own
+# series and Prometheus sums them.
+#
+# `stage(pipeline, name)` times a block into unrepo_stage_seconds and, inside
+# a request, into that request's timing breakdown (see `collect_timings`).
+
+_registry = []
+_registry_lock = threading.Lock()
+
+_timings = ContextVar("unrepo_timings", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels=(), fn=None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        # fn() -> value, or {label values tuple: value}, read at scrape time
+        self.fn = fn
+        self.values = {}
+        self.lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        if self.fn is None:
+            with self.lock:
+                return list(self.values.items())
+        value = self.fn()
+        return list(value.items()) if isinstance(value, dict) else [((), value)]
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in self.samples():
+            lines.append(f"{self.name}{_labels(self.label_names, key)} {_number(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=METRICS_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            series = [(key, {**value, "counts": list(value["counts"])}) for key, value in self.values.items()]
+        for key, value in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, value["counts"]):
+                cumulative += count
+                le = _labels(self.label_names, key, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_number(value['sum'])}")
+            lines.append(f"{self.name}_count{labels} {value['count']}")
+        return lines
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            # A broken callback shouldn't take the whole endpoint down
+            logger.warning(f"⚠️ Failed to collect {metric.name}: {e}")
+    return "\n".join(lines) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "unrepo_stage_seconds", "Time spent in each stage of indexing and querying", ("pipeline", "stage")
+)
+
+
+@contextmanager
+def stage(pipeline: str, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(pipeline, name, time.perf_counter() - start)
+
+
+def record_stage(pipeline: str, name: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, pipeline=pipeline, stage=name)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def collect_timings() -> dict:
+    """
+    Starts a per-request timing breakdown in the current context and returns
+    it; stages recorded later in this context (and tasks or threads started
+    from it) add their seconds to the returned dict.
+    """
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def server_timing(timings: dict) -> str:
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
@@ -0,0 +1,84 @@
+import sys
+import json
+import time
+import argparse
+from pymongo import UpdateOne
+
+from vector_codec import STORAGE_MODES, embedding_fields, decode_embedding
+from resources import get_db
+
+# Converts the `embedding` field of existing chunk documents to another
+# storage mode, in place and in batches. Documents already in the target
+# mode are skipped, so an interrupted run can simply be restarted.
+# The Atlas vector index on `embedding` must be redefined for the new type.
+# Usage: python migrate_vectors.py --to int8 [--repo-id owner/repo] [--batch-size 500]
+
+_BINARY = 5  # BSON type number of binData
+
+
+def source_filter(target: str, repo_id: str = None) -> dict:
+    if target == "array":
+        query = {"embedding": {"$type": _BINARY}}
+    elif target == "float32":
+        query = {"$or": [{"embedding": {"$type": "array"}}, {"embedding_full": {"$exists": True}}]}
+    else:
+        query = {"embedding_full": {"$exists": False}, "embedding": {"$exists": True}}
+    if repo_id:
+        query["repo_id"] = repo_id
+    return query
+
+
+def migrate(collection, target: str, repo_id: str = None, batch_size: int = 500, dry_run: bool = False) -> dict:
+    stats = {"converted": 0, "batches": 0, "bytes_before": 0, "bytes_after": 0}
+    fields = {"embedding": 1, "embedding_scale": 1, "embedding_full": 1}
+    query = source_filter(target, repo_id)
+    last_id = None
+    start = time.monotonic()
+    while True:
+        page = dict(query, _id={"$gt": last_id}) if last_id is not None else query
+        docs = list(collection.find(page, fields).sort("_id", 1).limit(batch_size))
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        ops = []
+        for doc in docs:
+            vector = decode_embedding(doc)
+            new = embedding_fields(vector, target)
+            stats["bytes_before"] += sum(_size(doc.get(field)) for field in fields)
+            stats["bytes_after"] += sum(_size(value) for value in new.values())
+            unset = {field: "" for field in fields if field not in new and field in doc}
+            update = {"$set": new}
+            if unset:
+                update["$unset"] = unset
+            ops.append(UpdateOne({"_id": doc["_id"]}, update))
+        if not dry_run:
+            collection.bulk_write(ops, ordered=False)
+        stats["converted"] += len(ops)
+        stats["batches"] += 1
+        print(f"🔁 Converted {stats['converted']} documents", file=sys.stderr)
+    stats["seconds"] = round(time.monotonic() - start, 2)
+    return stats
+
+
+def _size(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, list):
+        # BSON array: per element a type byte, the index as a C string and a double
+        return sum(2 + len(str(i)) + 8 for i in range(len(value)))
+    return 8
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert stored chunk embeddings to another storage mode")
+    parser.add_argument("--to", required=True, choices=STORAGE_MODES)
+    parser.add_argument("--repo-id", help="Only migrate one repo")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Report sizes without writing")
+    args = parser.parse_args()
+
+    collection = get_db()["code_chunks"]
+    json.dump(migrate(collection, args.to, args.repo_id, args.batch_size, args.dry_run), sys.stdout, indent=2)
+    print()
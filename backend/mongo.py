@@ -1,12 +1,9 @@
-from pymongo import MongoClient
-import certifi
-import os
+from resources import get_db
 from dotenv import load_dotenv
 
 load_dotenv()
 
-client = MongoClient(os.getenv("MONGODB_URI"), tlsCAFile=certifi.where())
-collection = client["unrepo"]["code_chunks"]
+collection = get_db()["code_chunks"]
 
 def insert_chunks_with_embeddings(chunks, repo_name: str, embed_fn):
     docs = []
@@ -0,0 +1,150 @@
+import time
+import queue
+import logging
+import threading
+from tqdm import tqdm
+
+from prep import iter_chunked_files
+from embedding_engine import EmbeddingEngine
+from writer import ChunkWriter
+from vector_codec import embedding_fields
+from metrics import Counter, record_stage
+from config import PREFETCH_CHUNKS, PREP_WORKERS
+
+logger = logging.getLogger("uvicorn")
+
+# Streaming stages for process_repo: files -> chunks -> embeddings -> Mongo.
+# Every stage is a generator or a bounded queue, so at most a few batches of
+# chunks are alive at once no matter how big the repo is.
+
+_DONE = object()
+
+CHUNKED_FILES = Counter("unrepo_chunked_files_total", "Files read and chunked")
+CHUNKS_PRODUCED = Counter("unrepo_chunks_total", "Chunks produced by the chunker")
+
+
+def iter_file_chunks(files, repo_dir, repo_id, progress, workers=PREP_WORKERS):
+    """
+    Reads and chunks files (across `workers` processes), yielding chunk dicts
+    in file order. Time spent waiting on the chunking workers is recorded as
+    the "chunk" stage.
+    """
+    chunks_total = 0
+    waited = 0.0
+    chunked = iter_chunked_files(files, repo_dir, repo_id, workers)
+    files_done = 0
+    while True:
+        start = time.perf_counter()
+        chunks = next(chunked, None)
+        waited += time.perf_counter() - start
+        if chunks is None:
+            break
+        files_done += 1
+        chunks_total += len(chunks)
+        CHUNKED_FILES.inc()
+        CHUNKS_PRODUCED.inc(len(chunks))
+        yield from chunks
+        progress(files_done=files_done, chunks_total=chunks_total)
+    record_stage("index", "chunk", waited)
+    progress(status="embedding", chunks_total=chunks_total)
+
+
+def prefetch(iterable, maxsize: int = PREFETCH_CHUNKS):
+    """
+    Runs `iterable` on a background thread through a bounded queue, so that
+    producing items (file IO, chunking) overlaps with consuming them. The
+    producer blocks once `maxsize` items are waiting.
+    """
+    buffer = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+    failure = []
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        buffer.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            failure.append(e)
+        finally:
+            buffer.put(_DONE)
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                break
+            yield item
+        if failure:
+            raise failure[0]
+    finally:
+        # Consumer stopped early (error downstream): release the producer
+        stop.set()
+        while thread.is_alive():
+            try:
+                buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def spill_jsonl(chunks, path):
+    """
+    Passes chunks through unchanged while appending each one to a JSONL file.
+    """
+    from save_jsonl import append_chunks_jsonl
+
+    with append_chunks_jsonl(path) as write:
+        for chunk in chunks:
+            write(chunk)
+            yield chunk
+
+
+def embed_and_write(items, repo_id, commit, collection, embed_fn, cache=None, progress=None, retriever=None,
+                    version=None, **engine_options):
+    """
+    Embeds `{"text", "tokens", "chunk"}` items and streams the resulting
+    documents, tagged with the index build `version`, into a ChunkWriter and
+    into `retriever` when it keeps its own index. Returns (engine, writer)
+    for their stats.
+    """
+    engine = EmbeddingEngine(embed_fn, cache=cache, **engine_options)
+    embedded_count = 0
+    with ChunkWriter(collection) as writer, tqdm(desc="🔄 Embedding", unit="chunk") as bar:
+        for batch in engine.embed_batches(items):
+            indexed = []
+            for item, embedding in batch:
+                chunk = item["chunk"]
+                doc = {
+                    "repo_id": repo_id,
+                    "content": chunk["content"],
+                    "filepath": chunk["filepath"],
+                    "language": chunk["language"],
+                    "chunk_id": chunk["chunk_id"],
+                    "symbol": chunk.get("symbol"),
+                    "start_line": chunk.get("start_line"),
+                    "end_line": chunk.get("end_line"),
+                    "token_count": item["tokens"],
+                    "commit": commit,
+                    "version": version,
+                }
+                stored = {**doc, **embedding_fields(embedding)}
+                writer.add(stored)
+                indexed.append({**doc, "content_hash": stored["content_hash"], "embedding": embedding})
+            if retriever is not None:
+                # One add per embedded batch
+                retriever.add(repo_id, indexed, version=version)
+            embedded_count += len(batch)
+            bar.update(len(batch))
+            if progress:
+                progress(chunks_embedded=embedded_count, chunks_inserted=writer.stats["written"])
+    if progress:
+        progress(chunks_embedded=embedded_count, chunks_inserted=writer.stats["written"])
+    return engine, writer
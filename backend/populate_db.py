@@ -1,17 +1,14 @@
 import json
-import os
 import logging
 from dotenv import load_dotenv
-from pymongo import MongoClient
-import certifi
+from resources import get_db
 from embedding import get_embedding  # Gemini embedding
 
 logger = logging.getLogger("uvicorn")
 
 load_dotenv()
 
-client = MongoClient(os.getenv("MONGODB_URI"), tlsCAFile=certifi.where())
-collection = client["unrepo"]["code_chunks"]
+collection = get_db()["code_chunks"]
 
 # Clear collection (optional for testing)
 collection.delete_many({})
@@ -0,0 +1,75 @@
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from file_scanner import read_and_metadata
+from chunker import chunk_document
+from tokenizer import count_tokens_batch
+from config import PREP_WORKERS, PREP_FILES_PER_TASK
+
+# CPU-side prep (read + chunk + count tokens) fanned out across processes. Kept
+# free of Mongo and Gemini imports so spawned workers start quickly.
+
+
+def chunk_file(file_path, repo_dir, repo_id) -> list[dict]:
+    meta = read_and_metadata(file_path, repo_dir, repo_id)
+    if not meta:
+        return []
+    return [
+        {
+            "content": chunk["content"],
+            "filepath": meta["filepath"],
+            "repo": meta["repo"],
+            "language": meta["language"],
+            "chunk_id": i,
+            "symbol": chunk["symbol"],
+            "start_line": chunk["start_line"],
+            "end_line": chunk["end_line"]
+        }
+        for i, chunk in enumerate(chunk_document(meta["content"], file_path))
+    ]
+
+
+def chunk_files(file_paths, repo_dir, repo_id) -> list[list[dict]]:
+    """
+    Worker task: chunks a group of files, one list of chunks per file. Token
+    counts for the whole group are computed in one batch and carried on each
+    chunk, so later stages never have to encode it again.
+    """
+    per_file = [chunk_file(path, repo_dir, repo_id) for path in file_paths]
+    chunks = [chunk for file_chunks in per_file for chunk in file_chunks]
+    for chunk, tokens in zip(chunks, count_tokens_batch([chunk["content"] for chunk in chunks])):
+        chunk["tokens"] = tokens
+    return per_file
+
+
+def iter_chunked_files(files, repo_dir, repo_id, workers=PREP_WORKERS, files_per_task=PREP_FILES_PER_TASK):
+    """
+    Yields one list of chunks per file, in the same order as `files`.
+
+    With more than one worker, groups of `files_per_task` files are chunked in
+    a process pool. At most `2 * workers` groups are in flight, so results never
+    pile up faster than the consumer takes them.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(files) <= files_per_task:
+        for start in range(0, len(files), files_per_task):
+            yield from chunk_files(files[start:start + files_per_task], repo_dir, repo_id)
+        return
+
+    groups = [files[i:i + files_per_task] for i in range(0, len(files), files_per_task)]
+    # spawn, not fork: the caller runs in a multi-threaded process
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        pending = deque()
+        next_group = 0
+        try:
+            while pending or next_group < len(groups):
+                while next_group < len(groups) and len(pending) < 2 * workers:
+                    pending.append(pool.submit(chunk_files, groups[next_group], repo_dir, repo_id))
+                    next_group += 1
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
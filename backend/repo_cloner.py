@@ -1,11 +1,147 @@
 import subprocess
 import shutil
+import fcntl
 import os
 import logging
+from contextlib import contextmanager
+from config import (
+    VALID_EXTENSIONS,
+    EXCLUDE_DIRS,
+    CLONE_DEPTH,
+    CLONE_FILTER,
+    CLONE_SPARSE,
+    CLONE_MAX_BLOB_SIZE,
+    CLONE_CACHE_DIR,
+)
 
 logger = logging.getLogger("uvicorn")
 
-def clone_repo(repo_url, dest_dir=None):
+def sparse_patterns() -> list[str]:
+    """
+    Non-cone sparse-checkout patterns mirroring file_scanner's filters, so we
+    never check out (and, with a partial clone, never download) other files.
+    """
+    patterns = [f"*{ext}" for ext in VALID_EXTENSIONS]
+    patterns += [f"!**/{d}/**" for d in sorted(EXCLUDE_DIRS)]
+    return patterns
+
+def _prefetch_head(repo_dir, max_blob_size):
+    """
+    Downloads the blobs of HEAD no larger than `max_blob_size` in one request,
+    and none of history's. Checkout then only has to fetch what's left, which
+    _missing_blob_paths leaves out.
+    """
+    shallow = os.path.join(repo_dir, _git(repo_dir, "rev-parse", "--git-common-dir").strip(), "shallow")
+    was_shallow = os.path.exists(shallow)
+    subprocess.run(
+        ["git", "-C", repo_dir, "-c", "fetch.negotiationAlgorithm=noop", "fetch", "-q", "--no-tags",
+         "--no-write-fetch-head", "--recurse-submodules=no", "--depth=1",
+         f"--filter=blob:limit={max_blob_size}", "origin", get_head_commit(repo_dir)],
+        check=True,
+    )
+    # The depth-1 fetch marks HEAD as a shallow boundary, but a mirror
+    # already has every commit and tree before it
+    if not was_shallow and os.path.exists(shallow):
+        os.remove(shallow)
+
+def _missing_blob_paths(repo_dir) -> list[str]:
+    """
+    Paths in HEAD whose blobs are still missing after _prefetch_head, i.e.
+    oversized files. Only HEAD's tree is walked, and nothing is fetched.
+    """
+    missing = {
+        line[1:] for line in _git(repo_dir, "rev-list", "--objects", "--missing=print", "--no-walk", "HEAD").splitlines()
+        if line.startswith("?")
+    }
+    if not missing:
+        return []
+    paths = []
+    for entry in _git(repo_dir, "ls-tree", "-r", "-z", "HEAD").split("\0"):
+        if not entry:
+            continue
+        info, path = entry.split("\t", 1)
+        if info.split()[2] in missing:
+            paths.append(path)
+    return paths
+
+def _checkout(repo_dir, sparse, max_blob_size):
+    if sparse or max_blob_size:
+        patterns = sparse_patterns() if sparse else ["/*"]
+        if max_blob_size:
+            patterns += [f"!/{path}" for path in _missing_blob_paths(repo_dir)]
+        subprocess.run(
+            ["git", "-C", repo_dir, "sparse-checkout", "set", "--no-cone", "--stdin"],
+            input="\n".join(patterns), text=True, check=True, capture_output=True,
+        )
+    # With a partial clone, this fetches the checked-out blobs still missing in one batch
+    subprocess.run(["git", "-C", repo_dir, "checkout", "-q"], check=True)
+
+@contextmanager
+def _locked(path):
+    with open(path, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _mirror_path(repo_url, cache_dir) -> str:
+    parts = repo_url.rstrip("/").removesuffix(".git").split("/")
+    return os.path.join(cache_dir, "__".join(parts[-2:]) + ".git")
+
+def _configure_mirror(mirror_dir, blob_filter):
+    # Branches and tags only (a --mirror clone also pulls refs/pull/* from
+    # GitHub); also migrates caches created as full mirrors
+    config = ["git", "-C", mirror_dir, "config"]
+    subprocess.run(config + ["--replace-all", "remote.origin.fetch", "+refs/heads/*:refs/heads/*"], check=True)
+    subprocess.run(config + ["--add", "remote.origin.fetch", "+refs/tags/*:refs/tags/*"], check=True)
+    subprocess.run(config + ["--unset-all", "remote.origin.mirror"], capture_output=True)
+    if blob_filter:
+        subprocess.run(config + ["remote.origin.partialclonefilter", blob_filter], check=True)
+    stray = _git(mirror_dir, "for-each-ref", "--format=delete %(refname)", "refs/pull", "refs/remotes")
+    if stray:
+        subprocess.run(["git", "-C", mirror_dir, "update-ref", "--stdin"], input=stray, text=True, check=True)
+
+def _update_mirror(repo_url, mirror_dir, blob_filter):
+    if os.path.exists(mirror_dir):
+        _configure_mirror(mirror_dir, blob_filter)
+        subprocess.run(["git", "-C", mirror_dir, "fetch", "-q", "--prune", "origin"], check=True)
+        subprocess.run(["git", "-C", mirror_dir, "worktree", "prune"], check=True)
+        logger.info(f"🔄 Fetched {repo_url} into cached mirror")
+        return
+    os.makedirs(os.path.dirname(mirror_dir), exist_ok=True)
+    cmd = ["git", "clone", "-q", "--bare"]
+    if blob_filter:
+        cmd.append(f"--filter={blob_filter}")
+    subprocess.run(cmd + [repo_url, mirror_dir], check=True)
+    _configure_mirror(mirror_dir, blob_filter)
+    logger.info(f"📦 Created cached mirror for {repo_url}")
+
+def clone_repo(
+    repo_url,
+    dest_dir=None,
+    depth=CLONE_DEPTH,
+    blob_filter=CLONE_FILTER,
+    sparse=CLONE_SPARSE,
+    max_blob_size=CLONE_MAX_BLOB_SIZE,
+    cache_dir=CLONE_CACHE_DIR,
+):
+    """
+    Checks out `repo_url` into `dest_dir`.
+
+    With `cache_dir`, a partial bare clone of the repo's branches and tags is
+    kept per repo and refreshed with `git fetch`; `dest_dir` becomes a
+    worktree of it, so repeat indexes only download new objects (and history
+    stays available for incremental diffs). Without it, a fresh clone is
+    made, shallow when `depth` is set.
+
+    `blob_filter` (e.g. "blob:none") makes the clone partial: history comes
+    without file contents, and only the blobs HEAD's checkout needs are
+    downloaded. `sparse` limits the checkout to VALID_EXTENSIONS outside
+    EXCLUDE_DIRS. `max_blob_size` (bytes) skips downloading and checking out
+    larger files of HEAD, at the price of prefetching every smaller blob of
+    HEAD, sparse or not.
+    """
     if dest_dir is None:
         repo_name = repo_url.rstrip("/").split("/")[-1]
         dest_dir = repo_name
@@ -14,7 +150,60 @@ def clone_repo(repo_url, dest_dir=None):
     if os.path.exists(dest_dir):
         shutil.rmtree(dest_dir)
 
+    if cache_dir:
+        mirror_dir = _mirror_path(repo_url, cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        # Lazy blob fetches during checkout write into the mirror too
+        with _locked(mirror_dir + ".lock"):
+            _update_mirror(repo_url, mirror_dir, blob_filter)
+            if blob_filter and max_blob_size:
+                _prefetch_head(mirror_dir, max_blob_size)
+            subprocess.run(
+                ["git", "-C", mirror_dir, "worktree", "add", "-q", "--no-checkout", "--detach", os.path.abspath(dest_dir), "HEAD"],
+                check=True,
+            )
+            _checkout(dest_dir, sparse, max_blob_size)
+        logger.info(f"✅ Checked out {repo_url} into {dest_dir} from cached mirror")
+        return dest_dir
+
     # Clone into the destination directory
-    subprocess.run(["git", "clone", repo_url, dest_dir], check=True)
+    cmd = ["git", "clone", "-q", "--no-checkout"]
+    if depth:
+        cmd += ["--depth", str(depth)]
+    if blob_filter:
+        cmd.append(f"--filter={blob_filter}")
+    subprocess.run(cmd + [repo_url, dest_dir], check=True)
+    if blob_filter and max_blob_size:
+        _prefetch_head(dest_dir, max_blob_size)
+    _checkout(dest_dir, sparse, max_blob_size)
     logger.info(f"✅ Cloned {repo_url} into {dest_dir}")
     return dest_dir
+
+def _git(repo_dir, *args) -> str:
+    result = subprocess.run(["git", "-C", repo_dir, *args], check=True, capture_output=True, text=True)
+    return result.stdout
+
+def get_head_commit(repo_dir) -> str:
+    return _git(repo_dir, "rev-parse", "HEAD").strip()
+
+def has_commit(repo_dir, sha) -> bool:
+    result = subprocess.run(
+        ["git", "-C", repo_dir, "cat-file", "-e", f"{sha}^{{commit}}"], capture_output=True
+    )
+    return result.returncode == 0
+
+def diff_name_status(repo_dir, old_sha, new_sha="HEAD") -> dict:
+    """
+    Returns the paths changed between two commits, relative to the repo root:
+    {"added": [...], "modified": [...], "deleted": [...]}.
+    Renames are reported as a delete plus an add.
+    """
+    out = _git(repo_dir, "diff", "--name-status", "--no-renames", "-z", old_sha, new_sha)
+    fields = out.split("\0")
+    changes = {"added": [], "modified": [], "deleted": []}
+    kinds = {"A": "added", "M": "modified", "T": "modified", "D": "deleted"}
+    for status, path in zip(fields[0::2], fields[1::2]):
+        kind = kinds.get(status[:1])
+        if kind:
+            changes[kind].append(path)
+    return changes
@@ -0,0 +1,110 @@
+import os
+import logging
+import threading
+import certifi
+import httpx
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from fastapi import Request
+from google import genai
+from google.genai import types
+from pymongo import MongoClient, AsyncMongoClient
+
+from retrieval import get_retriever
+from config import (
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    GEMINI_MAX_CONNECTIONS,
+    GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+)
+
+logger = logging.getLogger("uvicorn")
+
+load_dotenv()
+
+# Shared clients. Every module in a process uses the same pooled MongoClient
+# and genai.Client instead of opening its own at import time:
+#   get_mongo_client()/get_db()  sync, for index jobs, the pipeline and scripts
+#   get_genai_client()           sync and async (.aio) Gemini calls
+#   Resources                    async clients for the API, created by the
+#                                FastAPI lifespan and injected with
+#                                Depends(get_resources)
+
+_mongo_client = None
+_genai_client = None
+_lock = threading.Lock()
+
+
+def _mongo_options() -> dict:
+    return {
+        "tlsCAFile": certifi.where(),
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "appname": "unrepo",
+    }
+
+
+def get_mongo_client() -> MongoClient:
+    global _mongo_client
+    with _lock:
+        if _mongo_client is None:
+            _mongo_client = MongoClient(os.getenv("MONGODB_URI"), **_mongo_options())
+        return _mongo_client
+
+
+def get_db():
+    return get_mongo_client()["unrepo"]
+
+
+def get_genai_client() -> genai.Client:
+    global _genai_client
+    with _lock:
+        if _genai_client is None:
+            limits = httpx.Limits(
+                max_connections=GEMINI_MAX_CONNECTIONS,
+                max_keepalive_connections=GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+            )
+            _genai_client = genai.Client(
+                api_key=os.getenv("GEMINI_API_KEY"),
+                http_options=types.HttpOptions(
+                    client_args={"limits": limits},
+                    async_client_args={"limits": limits},
+                ),
+            )
+        return _genai_client
+
+
+class Resources:
+    """
+    Async clients for request handlers. `mongo`, `models` and `retriever`
+    can be swapped for stand-ins (see fakes.py) in benchmarks.
+    """
+
+    def __init__(self, mongo=None, models=None, retriever=None):
+        self.mongo = mongo if mongo is not None else AsyncMongoClient(os.getenv("MONGODB_URI"), **_mongo_options())
+        self.db = self.mongo["unrepo"]
+        self.chunks = self.db["code_chunks"]
+        self.repo_indexes = self.db["repo_indexes"]
+        self.index_jobs = self.db["index_jobs"]
+        self.summaries = self.db["repo_summaries"]
+        self.models = models if models is not None else get_genai_client().aio.models
+        self.retriever = retriever if retriever is not None else get_retriever(self.chunks)
+
+    async def close(self):
+        await self.mongo.close()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    app.state.resources = Resources()
+    logger.info("🔌 Opened Mongo and Gemini connection pools")
+    try:
+        # Fail now, not on every /query, if the vector index can't serve queries
+        await app.state.resources.retriever.acheck_index()
+        yield
+    finally:
+        await app.state.resources.close()
+
+
+def get_resources(request: Request) -> Resources:
+    return request.app.state.resources
@@ -0,0 +1,557 @@
+import os
+import shutil
+import asyncio
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+from pymongo.errors import OperationFailure
+
+from local_index import LocalVectorIndex
+from lexical_index import LexicalIndex, chunk_id_of
+from vector_codec import decode_embedding, query_vector
+from config import (
+    RETRIEVAL_BACKEND,
+    LOCAL_INDEX_DIR,
+    EMBED_STORAGE,
+    RESCORE_FACTOR,
+    HYBRID_RETRIEVAL,
+    HYBRID_CANDIDATES,
+    RRF_K,
+    LEXICAL_INDEX_DIR,
+    LEXICAL_INDEX_CACHE_SIZE,
+)
+
+logger = logging.getLogger("uvicorn")
+
+# Retrieval backends behind one interface, selected by RETRIEVAL_BACKEND:
+#   "atlas"  MongoDB Atlas $vectorSearch over the chunks collection (the
+#            collection *is* the index, ChunkWriter keeps it up to date)
+#   "local"  in-process LocalVectorIndex per repo, fed during indexing
+# With HYBRID_RETRIEVAL, either is wrapped in a HybridRetriever that fuses it
+# with a per-repo BM25 index.
+#
+#   search(repo_id, vector, limit, num_candidates, text=None)
+#                                                   -> [chunk doc + "score"]
+#   asearch(...)                                    same, for request handlers
+#   search_many(repo_id, vectors, limit, num_candidates, texts=None)
+#                                                   -> one result list per vector,
+#                                                      in a single round trip
+#   asearch_many(...)                               same, for request handlers
+#   fetch(repo_id, ids)                             chunk docs by (filepath, chunk_id)
+#   afetch(...)                                     same, for request handlers
+#   add(repo_id, docs)                              docs carry "embedding"
+#   delete(repo_id, filepaths=None)
+#   flush(repo_id)                                  persist pending changes
+#   copy(repo_id, version, new_version, exclude_filepaths=())
+#                                                   seed a new build from an old one
+#   drop(repo_id, version)                          remove a build's index
+#   check_index()                                   raise if the index can't serve
+#                                                   queries; called at startup
+#   acheck_index()                                  same, for the API lifespan
+#
+# Every method also takes `version=`, the index build (see lifecycle.py) to
+# read or write; None is the unversioned index of repos built before builds
+# were versioned. With the Atlas backend, `version` must be a filter field of
+# the vector search index.
+
+# Chunk fields returned by search; never the embedding itself
+SEARCH_FIELDS = ("repo_id", "content", "filepath", "language", "chunk_id", "symbol", "start_line", "end_line", "commit")
+
+# Fields every $vectorSearch filters on, so the Atlas index must declare them
+FILTER_FIELDS = ("repo_id", "version")
+
+
+def index_key(repo_id, version=None) -> str:
+    """
+    Name of a repo build's local index files.
+    """
+    key = repo_id if version is None else f"{repo_id}@{version}"
+    return key.replace("/", "__")
+
+
+def rescore(docs, vector, limit):
+    """
+    Re-ranks candidates by exact float32 cosine similarity against their
+    full-precision embeddings, keeping the best `limit`.
+    """
+    if not docs:
+        return docs
+    query = np.asarray(vector, dtype=np.float32)
+    matrix = np.vstack([decode_embedding(doc) for doc in docs])
+    scores = matrix @ query / ((np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)) + 1e-12)
+    ranked = []
+    for i in np.argsort(-scores)[:limit]:
+        doc = {field: value for field, value in docs[i].items() if not field.startswith("embedding")}
+        ranked.append({**doc, "score": float(scores[i])})
+    return ranked
+
+
+class AtlasRetriever:
+    """
+    With quantized storage, $vectorSearch runs over the int8 codes for
+    `RESCORE_FACTOR` times as many candidates, which are then rescored
+    against their float32 vectors.
+    """
+
+    def __init__(self, collection, index_name="default", storage=EMBED_STORAGE, rescore_factor=RESCORE_FACTOR):
+        self.collection = collection
+        self.index_name = index_name
+        self.storage = storage
+        self.rescore_factor = rescore_factor
+        self.quantized = storage == "int8"
+
+    def _pipeline(self, repo_id, vector, limit, num_candidates, version=None):
+        candidates = limit * self.rescore_factor if self.quantized else limit
+        search = {
+            "index": self.index_name,
+            "path": "embedding",
+            "queryVector": query_vector(vector, self.storage),
+            "numCandidates": max(num_candidates, candidates),
+            "limit": candidates,
+        }
+        if repo_id is not None:
+            search["filter"] = {"repo_id": repo_id}
+            if version is not None:
+                search["filter"]["version"] = version
+        projection = {field: 1 for field in SEARCH_FIELDS}
+        projection.update({"_id": 0, "score": {"$meta": "vectorSearchScore"}})
+        if self.quantized:
+            projection["embedding_full"] = 1
+        return [{"$vectorSearch": search}, {"$project": projection}]
+
+    def _batch_pipeline(self, repo_id, vectors, limit, num_candidates, version=None):
+        """
+        One aggregate for several query vectors: each search runs in its own
+        $unionWith branch and tags its results with the query's position.
+        """
+        def tagged(i, vector):
+            return self._pipeline(repo_id, vector, limit, num_candidates, version) + [{"$addFields": {"_query": i}}]
+
+        pipeline = tagged(0, vectors[0])
+        for i, vector in enumerate(vectors[1:], start=1):
+            pipeline.append({"$unionWith": {"coll": self.collection.name, "pipeline": tagged(i, vector)}})
+        return pipeline
+
+    def _split(self, docs, vectors, limit):
+        per_query = [[] for _ in vectors]
+        for doc in docs:
+            per_query[doc.pop("_query")].append(doc)
+        if self.quantized:
+            return [rescore(found, vector, limit) for found, vector in zip(per_query, vectors)]
+        return per_query
+
+    def search(self, repo_id, vector, limit=5, num_candidates=100, text=None, version=None):
+        docs = list(self.collection.aggregate(self._pipeline(repo_id, vector, limit, num_candidates, version)))
+        return rescore(docs, vector, limit) if self.quantized else docs
+
+    async def asearch(self, repo_id, vector, limit=5, num_candidates=100, text=None, version=None):
+        # Needs an async collection (AsyncMongoClient)
+        cursor = await self.collection.aggregate(self._pipeline(repo_id, vector, limit, num_candidates, version))
+        docs = await cursor.to_list()
+        return rescore(docs, vector, limit) if self.quantized else docs
+
+    def search_many(self, repo_id, vectors, limit=5, num_candidates=100, texts=None, version=None):
+        if not vectors:
+            return []
+        docs = list(self.collection.aggregate(self._batch_pipeline(repo_id, vectors, limit, num_candidates, version)))
+        return self._split(docs, vectors, limit)
+
+    async def asearch_many(self, repo_id, vectors, limit=5, num_candidates=100, texts=None, version=None):
+        if not vectors:
+            return []
+        cursor = await self.collection.aggregate(self._batch_pipeline(repo_id, vectors, limit, num_candidates, version))
+        return self._split(await cursor.to_list(), vectors, limit)
+
+    def _fetch_query(self, repo_id, ids, version=None):
+        query = {"repo_id": repo_id, "$or": [{"filepath": filepath, "chunk_id": chunk_id} for filepath, chunk_id in ids]}
+        if version is not None:
+            query["version"] = version
+        projection = {field: 1 for field in SEARCH_FIELDS}
+        projection["_id"] = 0
+        return query, projection
+
+    def fetch(self, repo_id, ids, version=None):
+        if not ids:
+            return []
+        return list(self.collection.find(*self._fetch_query(repo_id, ids, version)))
+
+    async def afetch(self, repo_id, ids, version=None):
+        if not ids:
+            return []
+        return await self.collection.find(*self._fetch_query(repo_id, ids, version)).to_list()
+
+    def _check(self, definitions):
+        definition = next((d for d in definitions if d.get("name") == self.index_name), None)
+        if definition is None:
+            raise RuntimeError(
+                f"Atlas Vector Search index {self.index_name!r} not found on {self.collection.name} "
+                "(see the index definition in the README)"
+            )
+        fields = (definition.get("latestDefinition") or {}).get("fields", [])
+        filters = {field.get("path") for field in fields if field.get("type") == "filter"}
+        missing = [field for field in FILTER_FIELDS if field not in filters]
+        if missing:
+            raise RuntimeError(
+                f"Atlas Vector Search index {self.index_name!r} on {self.collection.name} is missing filter "
+                f"field(s) {', '.join(missing)}; every /query filters on them. Add "
+                + ", ".join(f'{{"type": "filter", "path": "{field}"}}' for field in missing)
+                + " to the index definition (see the README)"
+            )
+
+    def check_index(self):
+        try:
+            definitions = list(self.collection.list_search_indexes(self.index_name))
+        except OperationFailure as e:
+            # Not Atlas (or no permission to list): nothing to check against
+            logger.warning(f"⚠️ Could not list search indexes on {self.collection.name}: {e}")
+            return
+        self._check(definitions)
+
+    async def acheck_index(self):
+        try:
+            cursor = await self.collection.list_search_indexes(self.index_name)
+            definitions = await cursor.to_list()
+        except OperationFailure as e:
+            logger.warning(f"⚠️ Could not list search indexes on {self.collection.name}: {e}")
+            return
+        self._check(definitions)
+
+    # The chunks collection is the index; lifecycle.py copies and drops builds
+    def add(self, repo_id, docs, version=None):
+        pass
+
+    def delete(self, repo_id, filepaths=None, version=None):
+        return 0
+
+    def flush(self, repo_id, version=None):
+        pass
+
+    def copy(self, repo_id, version, new_version, exclude_filepaths=()):
+        pass
+
+    def drop(self, repo_id, version=None):
+        pass
+
+
+class LocalRetriever:
+    def __init__(self, root=LOCAL_INDEX_DIR):
+        self.root = root
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def index(self, repo_id, version=None) -> LocalVectorIndex:
+        key = index_key(repo_id, version)
+        with self.lock:
+            if key not in self.indexes:
+                self.indexes[key] = LocalVectorIndex(os.path.join(self.root, key))
+            return self.indexes[key]
+
+    def search(self, repo_id, vector, limit=5, num_candidates=100, text=None, version=None):
+        if repo_id is None:
+            raise ValueError("The local retrieval backend searches one repo at a time")
+        return self.index(repo_id, version).search(vector, limit)
+
+    async def asearch(self, repo_id, vector, limit=5, num_candidates=100, text=None, version=None):
+        # NumPy releases the GIL during the matmuls
+        return await asyncio.to_thread(self.search, repo_id, vector, limit, num_candidates, version=version)
+
+    def search_many(self, repo_id, vectors, limit=5, num_candidates=100, texts=None, version=None):
+        if repo_id is None:
+            raise ValueError("The local retrieval backend searches one repo at a time")
+        if not len(vectors):
+            return []
+        # One matrix product for every query
+        return self.index(repo_id, version).search_batch(np.asarray(vectors, dtype=np.float32), limit)
+
+    async def asearch_many(self, repo_id, vectors, limit=5, num_candidates=100, texts=None, version=None):
+        return await asyncio.to_thread(self.search_many, repo_id, vectors, limit, num_candidates, version=version)
+
+    def fetch(self, repo_id, ids, version=None):
+        return self.index(repo_id, version).get(ids)
+
+    async def afetch(self, repo_id, ids, version=None):
+        return self.fetch(repo_id, ids, version)
+
+    def add(self, repo_id, docs, version=None):
+        self.index(repo_id, version).add(docs)
+
+    def delete(self, repo_id, filepaths=None, version=None):
+        return self.index(repo_id, version).delete(filepaths=filepaths)
+
+    def flush(self, repo_id, version=None):
+        self.index(repo_id, version).save()
+
+    def copy(self, repo_id, version, new_version, exclude_filepaths=()):
+        """
+        Seeds `new_version` with the saved files of `version`, minus the
+        chunks of `exclude_filepaths`.
+        """
+        source = os.path.join(self.root, index_key(repo_id, version))
+        if os.path.exists(source):
+            shutil.copytree(source, os.path.join(self.root, index_key(repo_id, new_version)), dirs_exist_ok=True)
+        self.index(repo_id, new_version).delete(filepaths=exclude_filepaths)
+
+    def drop(self, repo_id, version=None):
+        key = index_key(repo_id, version)
+        with self.lock:
+            self.indexes.pop(key, None)
+        shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+
+    # Indexes are created on first use
+    def check_index(self):
+        pass
+
+    async def acheck_index(self):
+        pass
+
+    def docs(self, repo_id, version=None):
+        index = self.index(repo_id, version)
+        for row in list(index.keys.values()):
+            yield index.docs[row]
+
+
+def stored_chunks(repo_id, version=None):
+    from resources import get_db
+
+    # Just what LexicalIndex.add reads; the cursor streams them in batches
+    fields = {"_id": 0, "filepath": 1, "chunk_id": 1, "symbol": 1, "content": 1}
+    query = {"repo_id": repo_id}
+    if version is not None:
+        query["version"] = version
+    return get_db()["code_chunks"].find(query, fields)
+
+
+class LexicalStore:
+    """
+    Per-repo LexicalIndex files. A repo indexed before lexical indexes existed
+    gets one built on first use from `source(repo_id)`, its stored chunks.
+
+    Loaded indexes are kept in memory least recently used first, up to
+    `max_indexes` (indexes with unsaved changes are never dropped). Loading
+    or building one repo's index only blocks callers of that same index.
+    """
+
+    def __init__(self, root=LEXICAL_INDEX_DIR, source=stored_chunks, max_indexes=LEXICAL_INDEX_CACHE_SIZE):
+        self.root = root
+        self.source = source
+        self.max_indexes = max_indexes
+        self.indexes = OrderedDict()
+        self.loading = {}  # key -> lock held while that index is loaded or built
+        self.lock = threading.Lock()
+
+    def path(self, repo_id, version=None) -> str:
+        return os.path.join(self.root, index_key(repo_id, version) + ".json")
+
+    def _cached(self, key):
+        # Called with self.lock held
+        index = self.indexes.get(key)
+        if index is not None:
+            self.indexes.move_to_end(key)
+        return index
+
+    def index(self, repo_id, version=None) -> LexicalIndex:
+        key = index_key(repo_id, version)
+        with self.lock:
+            index = self._cached(key)
+            if index is not None:
+                return index
+            loading = self.loading.setdefault(key, threading.Lock())
+
+        with loading:
+            with self.lock:
+                index = self._cached(key)
+            if index is not None:
+                return index
+            index = LexicalIndex(self.path(repo_id, version))
+            if not index.exists():
+                index.add(self.source(repo_id, version))
+                if len(index):
+                    index.save()
+            with self.lock:
+                self.indexes[key] = index
+                self.loading.pop(key, None)
+                self._evict()
+            return index
+
+    def _evict(self):
+        # Called with self.lock held
+        excess = len(self.indexes) - self.max_indexes
+        for key in [key for key, index in self.indexes.items() if not index.dirty][:max(0, excess)]:
+            del self.indexes[key]
+
+    def copy(self, repo_id, version, new_version, exclude_filepaths=()):
+        source = self.path(repo_id, version)
+        if os.path.exists(source):
+            shutil.copyfile(source, self.path(repo_id, new_version))
+        self.index(repo_id, new_version).delete(filepaths=exclude_filepaths)
+
+    def drop(self, repo_id, version=None):
+        with self.lock:
+            self.indexes.pop(index_key(repo_id, version), None)
+        if os.path.exists(self.path(repo_id, version)):
+            os.remove(self.path(repo_id, version))
+
+
+def fuse(ranked_lists, k=RRF_K):
+    """
+    Reciprocal-rank fusion: each doc scores sum(1 / (k + rank)) over the
+    lists it appears in. Returns docs best first, with "score" replaced.
+    """
+    scores, docs = {}, {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked, start=1):
+            key = (doc["filepath"], doc["chunk_id"], doc["content"])
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [{**docs[key], "score": scores[key]} for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def dedupe(docs):
+    """
+    Drops chunks whose line range overlaps a better-ranked chunk of the same
+    file (the splitter's overlap makes neighbours share lines).
+    """
+    kept, spans = [], {}
+    for doc in docs:
+        start, end = doc.get("start_line"), doc.get("end_line")
+        taken = spans.setdefault(doc["filepath"], [])
+        if start is not None and end is not None:
+            if any(start <= other_end and other_start <= end for other_start, other_end in taken):
+                continue
+            taken.append((start, end))
+        kept.append(doc)
+    return kept
+
+
+class HybridRetriever:
+    """
+    Vector search from `vector` plus BM25 over `lexical`, fused with RRF and
+    de-duplicated; context_builder fits the result to the prompt's token
+    budget. Without query text it's a plain vector search.
+
+    BM25 hits are ids only: chunks the vector search also found are taken
+    from its results, the rest are fetched from `vector` in one round trip.
+    """
+
+    def __init__(self, vector, lexical, candidates=HYBRID_CANDIDATES):
+        self.vector = vector
+        self.lexical = lexical
+        self.candidates = candidates
+
+    def _combine(self, by_vector, by_text, limit):
+        return dedupe(fuse([by_vector, by_text]))[:limit]
+
+    @staticmethod
+    def _missing(by_vector, by_text):
+        """
+        Ids of BM25 hits (over every query) not among the vector results.
+        """
+        known = {chunk_id_of(doc) for docs in by_vector for doc in docs}
+        missing = {chunk_id_of(hit) for hits in by_text for hit in hits} - known
+        return sorted(missing, key=lambda ref: (ref[0], str(ref[1])))
+
+    @staticmethod
+    def _hydrate(by_vector, by_text, fetched):
+        """
+        Replaces each BM25 hit with its chunk doc and BM25 score; hits whose
+        chunk is gone are dropped.
+        """
+        docs = {chunk_id_of(doc): doc for doc in fetched}
+        for found in by_vector:
+            docs.update((chunk_id_of(doc), doc) for doc in found)
+        return [
+            [{**docs[chunk_id_of(hit)], "score": hit["score"]} for hit in hits if chunk_id_of(hit) in docs]
+            for hits in by_text
+        ]
+
+    def _lexical_many(self, repo_id, texts, version=None):
+        index = self.lexical.index(repo_id, version)
+        return [index.search(text, self.candidates) for text in texts]
+
+    def search(self, repo_id, vector, limit=5, num_candidates=100, text=None, version=None):
+        if text is None or repo_id is None:
+            return self.vector.search(repo_id, vector, limit, num_candidates, version=version)
+        return self.search_many(repo_id, [vector], limit, num_candidates, texts=[text], version=version)[0]
+
+    async def asearch(self, repo_id, vector, limit=5, num_candidates=100, text=None, version=None):
+        if text is None or repo_id is None:
+            return await self.vector.asearch(repo_id, vector, limit, num_candidates, version=version)
+        return (await self.asearch_many(repo_id, [vector], limit, num_candidates, texts=[text], version=version))[0]
+
+    def search_many(self, repo_id, vectors, limit=5, num_candidates=100, texts=None, version=None):
+        if texts is None or repo_id is None:
+            return self.vector.search_many(repo_id, vectors, limit, num_candidates, version=version)
+        by_vector = self.vector.search_many(
+            repo_id, vectors, self.candidates, max(num_candidates, self.candidates), version=version
+        )
+        by_text = self._lexical_many(repo_id, texts, version)
+        fetched = self.vector.fetch(repo_id, self._missing(by_vector, by_text), version=version)
+        by_text = self._hydrate(by_vector, by_text, fetched)
+        return [self._combine(v, t, limit) for v, t in zip(by_vector, by_text)]
+
+    async def asearch_many(self, repo_id, vectors, limit=5, num_candidates=100, texts=None, version=None):
+        if texts is None or repo_id is None:
+            return await self.vector.asearch_many(repo_id, vectors, limit, num_candidates, version=version)
+        by_vector, by_text = await asyncio.gather(
+            self.vector.asearch_many(
+                repo_id, vectors, self.candidates, max(num_candidates, self.candidates), version=version
+            ),
+            asyncio.to_thread(self._lexical_many, repo_id, texts, version),
+        )
+        fetched = await self.vector.afetch(repo_id, self._missing(by_vector, by_text), version=version)
+        by_text = self._hydrate(by_vector, by_text, fetched)
+        return [self._combine(v, t, limit) for v, t in zip(by_vector, by_text)]
+
+    def add(self, repo_id, docs, version=None):
+        self.vector.add(repo_id, docs, version=version)
+        self.lexical.index(repo_id, version).add(docs)
+
+    def delete(self, repo_id, filepaths=None, version=None):
+        self.lexical.index(repo_id, version).delete(filepaths=filepaths)
+        return self.vector.delete(repo_id, filepaths=filepaths, version=version)
+
+    def flush(self, repo_id, version=None):
+        self.vector.flush(repo_id, version=version)
+        self.lexical.index(repo_id, version).save()
+
+    def copy(self, repo_id, version, new_version, exclude_filepaths=()):
+        self.vector.copy(repo_id, version, new_version, exclude_filepaths)
+        self.lexical.copy(repo_id, version, new_version, exclude_filepaths)
+
+    def drop(self, repo_id, version=None):
+        self.vector.drop(repo_id, version)
+        self.lexical.drop(repo_id, version)
+
+    def check_index(self):
+        self.vector.check_index()
+
+    async def acheck_index(self):
+        await self.vector.acheck_index()
+
+
+_local_retriever = None
+_lexical_store = None
+_local_lock = threading.Lock()
+
+
+def get_retriever(collection):
+    """
+    Returns the backend selected by RETRIEVAL_BACKEND (wrapped for hybrid
+    search with HYBRID_RETRIEVAL). Local and lexical indexes are shared
+    process-wide, so index jobs and queries see the same in-memory index.
+    """
+    global _local_retriever, _lexical_store
+    with _local_lock:
+        if RETRIEVAL_BACKEND == "local":
+            if _local_retriever is None:
+                _local_retriever = LocalRetriever()
+            retriever = _local_retriever
+        else:
+            retriever = AtlasRetriever(collection)
+        if not HYBRID_RETRIEVAL:
+            return retriever
+        if _lexical_store is None:
+            source = retriever.docs if RETRIEVAL_BACKEND == "local" else stored_chunks
+            _lexical_store = LexicalStore(source=source)
+        return HybridRetriever(retriever, _lexical_store)
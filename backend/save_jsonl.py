@@ -1,6 +1,7 @@
 import json
 import os
 import logging
+from contextlib import contextmanager
 
 logger = logging.getLogger("uvicorn")
 
@@ -11,3 +12,19 @@ def save_chunks_jsonl(data, path="data/chunks.jsonl"):
             f.write(json.dumps(entry) + "\n")
     logger.info(f"✅ Saved {len(data)} chunks to {path}")
     print(f"✅ Saved {len(data)} chunks to {path}")
+
+@contextmanager
+def append_chunks_jsonl(path):
+    """
+    Streaming counterpart of save_chunks_jsonl: yields a `write(entry)` function
+    so chunks can be spilled one at a time without holding them all in memory.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        def write(entry):
+            nonlocal count
+            f.write(json.dumps(entry) + "\n")
+            count += 1
+        yield write
+    logger.info(f"✅ Saved {count} chunks to {path}")
@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import shutil
+import logging
+import argparse
+from array import array
+from datetime import datetime, timezone
+import numpy as np
+from dotenv import load_dotenv
+
+from resources import get_db
+from writer import ChunkWriter, ensure_chunk_indexes
+from vector_codec import embedding_fields, decode_embedding
+from index_meta import get_repo_index, record_repo_index, new_version
+from lifecycle import measure_build, retire_builds, discard_build, jobs_collection
+from jobs import ACTIVE_STATES
+from answer_cache import answer_cache
+from retrieval import get_retriever
+from config import EMBED_MODEL, SNAPSHOT_DTYPE, SNAPSHOT_BATCH
+
+load_dotenv()
+
+logger = logging.getLogger("uvicorn")
+
+# A snapshot is one build of a repo (chunks and their embeddings) as a
+# directory of columns, written in one streaming pass and read without
+# parsing or copying the embeddings:
+#   manifest.json      format, repo_id, repo_url, commit, source build
+#                      version, embedding model, rows, dim and dtype
+#   embeddings.bin     (rows, dim) little-endian float32 or float16, row-major;
+#                      memory-mapped on read
+#   text.bin           UTF-8 chunk contents back to back; memory-mapped
+#   columns.npz        per row: content offsets into text.bin (rows + 1),
+#                      chunk_id, start_line, end_line, token_count (-1 for
+#                      None), content_hash (32 bytes) and dictionary codes for
+#                      the string columns below (-1 for None)
+#   dictionaries.json  distinct values of filepath, language, symbol, commit
+# Usage:
+#   python snapshot.py export owner/repo snapshots/owner__repo [--dtype float16]
+#   python snapshot.py load snapshots/owner__repo [--repo-id owner/repo] [--force]
+#   python snapshot.py info snapshots/owner__repo
+
+FORMAT = 1
+DTYPES = {"float32": "<f4", "float16": "<f2"}
+INT_COLUMNS = ("chunk_id", "start_line", "end_line", "token_count")
+STRING_COLUMNS = ("filepath", "language", "symbol", "commit")
+
+
+class SnapshotWriter:
+    """
+    Streams chunk documents and their embeddings into a snapshot directory.
+    Contents and embeddings go straight to disk; only the small per-row
+    columns are kept in memory. Files are written to `<path>.partial` and
+    moved into place by close(), so a failed export leaves nothing behind.
+    Use as a context manager.
+    """
+
+    def __init__(self, path, repo_id: str, dtype: str = SNAPSHOT_DTYPE, **meta):
+        if dtype not in DTYPES:
+            raise ValueError(f"Snapshot dtype must be one of {sorted(DTYPES)}, got {dtype!r}")
+        self.path = path
+        self.partial = f"{os.path.normpath(path)}.partial"
+        shutil.rmtree(self.partial, ignore_errors=True)
+        os.makedirs(self.partial)
+        self.manifest = {
+            "format": FORMAT,
+            "repo_id": repo_id,
+            **meta,
+            "embed_model": EMBED_MODEL,
+            "rows": 0,
+            "dim": None,
+            "dtype": dtype,
+        }
+        self.dtype = np.dtype(DTYPES[dtype])
+        self.embeddings = open(os.path.join(self.partial, "embeddings.bin"), "wb")
+        self.text = open(os.path.join(self.partial, "text.bin"), "wb")
+        self.offsets = array("q", [0])
+        self.ints = {name: array("i") for name in INT_COLUMNS}
+        self.codes = {name: array("i") for name in STRING_COLUMNS}
+        self.values = {name: {} for name in STRING_COLUMNS}  # value -> code
+        self.hashes = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, doc: dict, embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self.manifest["dim"] is None:
+            self.manifest["dim"] = int(vector.shape[0])
+        elif vector.shape[0] != self.manifest["dim"]:
+            raise ValueError(f"Expected {self.manifest['dim']}-d embeddings, got {vector.shape[0]}")
+        self.embeddings.write(vector.astype(self.dtype).tobytes())
+        self.offsets.append(self.offsets[-1] + self.text.write(doc["content"].encode("utf-8")))
+        for name in INT_COLUMNS:
+            value = doc.get(name)
+            self.ints[name].append(-1 if value is None else value)
+        for name in STRING_COLUMNS:
+            value = doc.get(name)
+            self.codes[name].append(-1 if value is None else self.values[name].setdefault(value, len(self.values[name])))
+        if doc.get("content_hash"):
+            self.hashes += bytes.fromhex(doc["content_hash"])
+        else:
+            self.hashes += bytes(32)  # recomputed from the content on load
+        self.manifest["rows"] += 1
+
+    def close(self) -> dict:
+        self.embeddings.close()
+        self.text.close()
+        rows = self.manifest["rows"]
+        columns = {
+            "content_offsets": np.frombuffer(self.offsets, dtype=np.int64),
+            "content_hash": np.frombuffer(bytes(self.hashes), dtype=np.uint8).reshape(rows, 32),
+        }
+        for name in INT_COLUMNS:
+            columns[name] = np.frombuffer(self.ints[name], dtype=np.int32)
+        for name in STRING_COLUMNS:
+            columns[f"{name}_code"] = np.frombuffer(self.codes[name], dtype=np.int32)
+        np.savez(os.path.join(self.partial, "columns.npz"), **columns)
+        with open(os.path.join(self.partial, "dictionaries.json"), "w", encoding="utf-8") as f:
+            json.dump({name: list(values) for name, values in self.values.items()}, f)
+        self.manifest["created_at"] = datetime.now(timezone.utc).isoformat()
+        with open(os.path.join(self.partial, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(self.partial, self.path)
+        logger.info(f"📦 Wrote snapshot {self.path} ({rows} chunks, {self.manifest['dim']}-d {self.manifest['dtype']})")
+        return self.manifest
+
+    def abort(self):
+        self.embeddings.close()
+        self.text.close()
+        shutil.rmtree(self.partial, ignore_errors=True)
+
+
+class Snapshot:
+    """
+    A snapshot opened for reading. `embeddings` is a read-only memory map of
+    the (rows, dim) block; documents are decoded row by row on demand.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT:
+            raise ValueError(f"{path}: unsupported snapshot format {self.manifest.get('format')!r}")
+        with open(os.path.join(path, "dictionaries.json"), encoding="utf-8") as f:
+            self.dictionaries = json.load(f)
+        with np.load(os.path.join(path, "columns.npz")) as columns:
+            self.columns = {name: columns[name] for name in columns.files}
+        rows, dim = self.manifest["rows"], self.manifest["dim"]
+        dtype = np.dtype(DTYPES[self.manifest["dtype"]])
+        if rows:
+            self.embeddings = np.memmap(os.path.join(path, "embeddings.bin"), dtype=dtype, mode="r", shape=(rows, dim))
+        else:
+            self.embeddings = np.empty((0, dim or 0), dtype=dtype)
+        text_path = os.path.join(path, "text.bin")
+        self.text = np.memmap(text_path, dtype=np.uint8, mode="r") if os.path.getsize(text_path) else b""
+
+    def __len__(self):
+        return self.manifest["rows"]
+
+    def doc(self, row: int) -> dict:
+        """
+        The chunk document of a row, without repo_id, version or embedding.
+        """
+        columns = self.columns
+        start, end = columns["content_offsets"][row], columns["content_offsets"][row + 1]
+        doc = {"content": bytes(self.text[start:end]).decode("utf-8")}
+        for name in STRING_COLUMNS:
+            code = int(columns[f"{name}_code"][row])
+            doc[name] = self.dictionaries[name][code] if code >= 0 else None
+        for name in INT_COLUMNS:
+            value = int(columns[name][row])
+            doc[name] = value if value >= 0 else None
+        digest = columns["content_hash"][row]
+        if digest.any():
+            doc["content_hash"] = digest.tobytes().hex()
+        return doc
+
+    def iter_batches(self, size: int = SNAPSHOT_BATCH):
+        """
+        Yields (docs, vectors) per `size` rows; `vectors` is a view into the
+        memory-mapped embedding block.
+        """
+        for start in range(0, len(self), size):
+            stop = min(start + size, len(self))
+            yield [self.doc(row) for row in range(start, stop)], self.embeddings[start:stop]
+
+
+def export_repo(collection, repo_id: str, path, dtype: str = SNAPSHOT_DTYPE) -> dict:
+    """
+    Writes the live build of `repo_id` to a snapshot at `path`. Returns the
+    snapshot's manifest.
+    """
+    meta = get_repo_index(repo_id) or {}
+    version = meta.get("version")
+    query = {"repo_id": repo_id, "version": version}
+    if not collection.count_documents(query, limit=1):
+        raise ValueError(f"{repo_id} has no indexed chunks")
+    snapshot_meta = {"repo_url": meta.get("repo_url"), "commit": meta.get("commit"), "source_version": version}
+    with SnapshotWriter(path, repo_id, dtype, **snapshot_meta) as writer:
+        for doc in collection.find(query, batch_size=SNAPSHOT_BATCH):
+            writer.add(doc, decode_embedding(doc))
+        if (get_repo_index(repo_id) or {}).get("version") != version:
+            # The build was swapped out (and is being deleted) while we read it
+            raise RuntimeError(f"{repo_id} was re-indexed during the export; run it again")
+    return writer.manifest
+
+
+def load_snapshot(path, collection, retriever, repo_id: str = None, force: bool = False) -> dict:
+    """
+    Bulk-loads a snapshot as a new build of `repo_id` (the snapshot's own by
+    default, chunk filepaths are moved under it) into Mongo and `retriever`,
+    then swaps it in like an index run would. Nothing is embedded; with `force`, a snapshot built with another
+    embedding model than EMBED_MODEL is loaded anyway.
+    """
+    snapshot = Snapshot(path)
+    manifest = snapshot.manifest
+    repo_id = repo_id or manifest["repo_id"]
+    if manifest["embed_model"] != EMBED_MODEL and not force:
+        raise ValueError(
+            f"{path} was embedded with {manifest['embed_model']}, not {EMBED_MODEL}; pass force to load it anyway"
+        )
+    if jobs_collection.find_one({"_id": repo_id, "status": {"$in": list(ACTIVE_STATES)}}, {"_id": 1}):
+        raise RuntimeError(f"{repo_id} is being indexed; load the snapshot once the job is done")
+
+    # Chunk filepaths start with the repo id; re-home them under the new one
+    prefix = f"{manifest['repo_id']}/"
+    rehome = repo_id != manifest["repo_id"]
+
+    ensure_chunk_indexes(collection)
+    live = get_repo_index(repo_id)
+    version = new_version()
+    try:
+        with ChunkWriter(collection) as writer:
+            for docs, vectors in snapshot.iter_batches():
+                vectors = np.asarray(vectors, dtype=np.float32)
+                for doc, vector in zip(docs, vectors):
+                    doc.update(repo_id=repo_id, version=version)
+                    if rehome and doc["filepath"].startswith(prefix):
+                        doc["filepath"] = f"{repo_id}/{doc['filepath'][len(prefix):]}"
+                    writer.add({**doc, **embedding_fields(vector)})
+                retriever.add(repo_id, [{**doc, "embedding": vector} for doc, vector in zip(docs, vectors)], version=version)
+        if writer.stats["failed"]:
+            raise RuntimeError(f"{writer.stats['failed']} chunks failed to write: {writer.errors[:1]}")
+        retriever.flush(repo_id, version=version)
+        chunk_count, size = measure_build(collection, repo_id, version)
+        record_repo_index(
+            repo_id, manifest["repo_url"], manifest["commit"], "snapshot", version=version, chunks=chunk_count, size=size
+        )
+    except BaseException:
+        discard_build(repo_id, version, retriever, collection)
+        raise
+    retire_builds(repo_id, version, retriever, previous=live, collection=collection)
+    answer_cache.invalidate(repo_id)
+    logger.info(f"📥 Loaded {len(snapshot)} chunks of {repo_id} from {path} (build {version})")
+    return {"repo_id": repo_id, "version": version, "commit": manifest["commit"], "chunks": chunk_count, "bytes": size}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export indexed repos to snapshots and bulk-load them")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write a repo's live build to a snapshot directory")
+    export.add_argument("repo_id")
+    export.add_argument("path")
+    export.add_argument("--dtype", choices=sorted(DTYPES), default=SNAPSHOT_DTYPE)
+    load = commands.add_parser("load", help="Load a snapshot into Mongo and the configured retriever")
+    load.add_argument("path")
+    load.add_argument("--repo-id", help="Load under another owner/repo id")
+    load.add_argument("--force", action="store_true", help="Load even if the embedding model differs")
+    commands.add_parser("info", help="Show a snapshot's manifest").add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        result = Snapshot(args.path).manifest
+    else:
+        collection = get_db()["code_chunks"]
+        if args.command == "export":
+            result = export_repo(collection, args.repo_id, args.path, args.dtype)
+        else:
+            result = load_snapshot(args.path, collection, get_retriever(collection), args.repo_id, args.force)
+
+    json.dump(result, sys.stdout, indent=2, default=str)
+    print()
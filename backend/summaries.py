@@ -0,0 +1,354 @@
+import os
+import re
+import hashlib
+import logging
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from pymongo import UpdateOne
+
+from tokenizer import truncate
+from resources import get_db, get_genai_client
+from metrics import Counter
+from config import (
+    SUMMARY_MODEL,
+    SUMMARY_CONCURRENCY,
+    SUMMARY_MAX_FILES,
+    SUMMARY_FILE_TOKENS,
+    SUMMARY_ROLLUP_TOKENS,
+    SUMMARY_TREE_MAX_LINES,
+)
+
+logger = logging.getLogger("uvicorn")
+
+summaries_collection = get_db()["repo_summaries"]
+
+# Hierarchical summary index, built by process_repo after the swap. One
+# document per node, keyed by "<repo_id>/<path>" (the repo node is "<repo_id>"):
+#   {"_id", "repo_id", "kind": "file" | "dir" | "repo", "path", "parent",
+#    "summary", "citations", "input_hash", "commit", "updated_at"}
+# The repo node also stores the rendered file `tree` and its top-level
+# `sections` ({"path", "summary"} per directory), so /query can answer
+# overview and layout questions with one find_one.
+#
+# Nodes are built bottom-up (files, then directories deepest first, then the
+# repo) and `input_hash` is the sha256 of the model and the exact prompt, so a
+# re-index only regenerates nodes whose file content or child summaries
+# changed, and forks reuse each other's summaries.
+
+FILE = "file"
+DIR = "dir"
+REPO = "repo"
+
+SUMMARIES = Counter("unrepo_summaries_total", "Summary index nodes built, by kind and source", ("kind", "result"))
+
+FILE_PROMPT = """Summarize what this file does in 2-3 sentences for a developer who is new to the codebase. Name its main classes or functions and what the rest of the code uses it for.
+
+File: {path}
+
+{content}"""
+
+DIR_PROMPT = """Summarize what the `{path}/` directory of this repository is for in 2-3 sentences, based on its contents:
+
+{children}"""
+
+REPO_PROMPT = """Write an overview of the repository {repo_id} for a developer who is new to it: what it does, how it's organized and the main technologies it uses. Use a short paragraph followed by a few bullet points.
+
+README:
+{readme}
+
+Top-level contents:
+{children}"""
+
+_README = re.compile(r"readme(\.(md|mdx|txt|rst))?", re.IGNORECASE)
+
+
+def input_hash(prompt: str, model: str = SUMMARY_MODEL) -> str:
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def generate_summary(prompt: str) -> str:
+    response = get_genai_client().models.generate_content(model=SUMMARY_MODEL, contents=prompt)
+    return (response.text or "").strip()
+
+
+def render_tree(paths, max_lines: int = SUMMARY_TREE_MAX_LINES) -> str:
+    """
+    Indented listing of relative '/'-separated `paths`, directories first.
+    When that's longer than `max_lines`, only directories are listed, with
+    their file counts.
+    """
+    root = {}
+    for path in paths:
+        node = root
+        *dirs, name = path.split("/")
+        for part in dirs:
+            node = node.setdefault(part + "/", {})
+        node[name] = None
+
+    def count(node):
+        return sum(1 if child is None else count(child) for child in node.values())
+
+    def walk(node, depth, with_files):
+        for name in sorted(node, key=lambda name: (node[name] is None, name)):
+            child = node[name]
+            if child is None:
+                if with_files:
+                    yield "  " * depth + name
+                continue
+            yield "  " * depth + name + ("" if with_files else f" ({count(child)} files)")
+            yield from walk(child, depth + 1, with_files)
+
+    lines = list(walk(root, 0, True))
+    if len(lines) > max_lines:
+        lines = list(walk(root, 0, False))
+    if len(lines) > max_lines:
+        lines = lines[:max_lines] + [f"... ({len(lines) - max_lines} more)"]
+    return "\n".join(lines)
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def _children_listing(children, summaries) -> str:
+    lines = []
+    for name, path in children:
+        summary = summaries.get(path)
+        lines.append(f"- {name}: {summary}" if summary else f"- {name}")
+    text, _ = truncate("\n".join(lines), SUMMARY_ROLLUP_TOKENS)
+    return text
+
+
+class _Level:
+    """
+    Generates one level of nodes: reuses stored summaries by input hash and
+    generates the rest with up to `concurrency` calls at a time.
+    """
+
+    def __init__(self, collection, generate, concurrency):
+        self.collection = collection
+        self.generate = generate
+        self.concurrency = concurrency
+        self.stats = {"cached": 0, "generated": 0, "failed": 0}
+
+    def _try_generate(self, prompt):
+        try:
+            return self.generate(prompt)
+        except Exception as e:
+            logger.warning(f"⚠️ Summary generation failed: {e}")
+            return None
+
+    def run(self, kind: str, prompts: dict) -> tuple[dict, dict]:
+        """
+        `prompts` maps path -> prompt; returns (path -> summary, path -> input hash).
+        Paths whose generation failed are left out of the summaries.
+        """
+        hashes = {path: input_hash(prompt) for path, prompt in prompts.items()}
+        stored = {}
+        if hashes:
+            for doc in self.collection.find(
+                {"input_hash": {"$in": list(set(hashes.values()))}}, {"input_hash": 1, "summary": 1}
+            ):
+                stored[doc["input_hash"]] = doc["summary"]
+
+        summaries = {path: stored[digest] for path, digest in hashes.items() if digest in stored}
+        missing = [path for path in prompts if path not in summaries]
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="summarizer") as pool:
+            generated = list(pool.map(lambda path: self._try_generate(prompts[path]), missing))
+
+        failed = 0
+        for path, summary in zip(missing, generated):
+            if summary:
+                summaries[path] = summary
+            else:
+                failed += 1
+        for result, count in (("cached", len(prompts) - len(missing)), ("generated", len(missing) - failed), ("failed", failed)):
+            self.stats[result] += count
+            if count:
+                SUMMARIES.inc(count, kind=kind, result=result)
+        return summaries, hashes
+
+
+def build_summary_index(repo_dir, files, repo_id: str, commit: str, collection=None, generate=None,
+                        concurrency: int = SUMMARY_CONCURRENCY, changed=None) -> dict:
+    """
+    Builds and stores the summary index for the scanned `files` of a checkout
+    and drops nodes of paths that no longer exist. `generate(prompt) -> str`
+    defaults to a Gemini call. With `changed` (the files a refresh re-indexed),
+    other files keep their stored summaries without being read again.
+
+    Returns {"files", "dirs", "cached", "generated", "failed"}.
+    """
+    collection = collection if collection is not None else summaries_collection
+    level = _Level(collection, generate or generate_summary, concurrency)
+    rel_paths = sorted(os.path.relpath(path, repo_dir).replace(os.sep, "/") for path in files)
+
+    # Top-level files first: past SUMMARY_MAX_FILES, the deepest files only
+    # show up by name in their directory's rollup
+    picked = sorted(rel_paths, key=lambda path: (path.count("/"), path))[:SUMMARY_MAX_FILES]
+    kept = {}
+    if changed is not None:
+        changed = {os.path.relpath(path, repo_dir).replace(os.sep, "/") for path in changed}
+        ids = [f"{repo_id}/{path}" for path in picked if path not in changed]
+        for doc in collection.find({"_id": {"$in": ids}, "kind": FILE}, {"path": 1, "summary": 1, "input_hash": 1}):
+            kept[doc["path"]] = doc
+    file_prompts = {}
+    for path in picked:
+        if path in kept:
+            continue
+        content, _ = truncate(_read(os.path.join(repo_dir, path)), SUMMARY_FILE_TOKENS)
+        if content.strip():
+            file_prompts[path] = FILE_PROMPT.format(path=path, content=content)
+    summaries, hashes = level.run(FILE, file_prompts)
+    for path, doc in kept.items():
+        summaries[path], hashes[path] = doc["summary"], doc["input_hash"]
+    if kept:
+        level.stats["cached"] += len(kept)
+        SUMMARIES.inc(len(kept), kind=FILE, result="cached")
+
+    # directory -> [(name, path)] of its files and subdirectories
+    children = {"": []}
+    for path in rel_paths:
+        name, child, parent = os.path.basename(path), path, os.path.dirname(path)
+        while True:
+            seen = parent in children
+            children.setdefault(parent, []).append((name, child))
+            if seen:
+                break
+            name, child, parent = os.path.basename(parent) + "/", parent, os.path.dirname(parent)
+
+    dirs = [path for path in children if path]
+    for depth in sorted({path.count("/") for path in dirs}, reverse=True):
+        prompts = {
+            path: DIR_PROMPT.format(path=path, children=_children_listing(children[path], summaries))
+            for path in dirs if path.count("/") == depth
+        }
+        level_summaries, level_hashes = level.run(DIR, prompts)
+        summaries.update(level_summaries)
+        hashes.update(level_hashes)
+
+    readme = next((path for _, path in children[""] if _README.fullmatch(path)), None)
+    readme_text, _ = truncate(_read(os.path.join(repo_dir, readme)), SUMMARY_FILE_TOKENS) if readme else ("", 0)
+    repo_prompt = REPO_PROMPT.format(
+        repo_id=repo_id, readme=readme_text or "(none)", children=_children_listing(children[""], summaries)
+    )
+    repo_summaries, repo_hashes = level.run(REPO, {"": repo_prompt})
+
+    now = datetime.now(timezone.utc)
+    ops = []
+    for path, summary in summaries.items():
+        ops.append(UpdateOne({"_id": f"{repo_id}/{path}"}, {"$set": {
+            "repo_id": repo_id,
+            "kind": DIR if path in children else FILE,
+            "path": path,
+            "parent": os.path.dirname(path),
+            "summary": summary,
+            "citations": [f"{repo_id}/{path}"],
+            "input_hash": hashes[path],
+            "commit": commit,
+            "updated_at": now,
+        }}, upsert=True))
+    if "" in repo_summaries:
+        ops.append(UpdateOne({"_id": repo_id}, {"$set": {
+            "repo_id": repo_id,
+            "kind": REPO,
+            "path": "",
+            "parent": None,
+            "summary": repo_summaries[""],
+            "citations": [f"{repo_id}/{readme}"] if readme else [],
+            "tree": render_tree(rel_paths),
+            "sections": [
+                {"path": path, "summary": summaries[path]}
+                for _, path in children[""] if path in children and path in summaries
+            ],
+            "input_hash": repo_hashes[""],
+            "commit": commit,
+            "updated_at": now,
+        }}, upsert=True))
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    # Nodes not rewritten by this build are for paths that no longer exist
+    # (or whose generation failed, which falls back to chunk retrieval)
+    collection.delete_many({"repo_id": repo_id, "commit": {"$ne": commit}})
+
+    stats = {"files": len(file_prompts) + len(kept), "dirs": len(dirs), **level.stats}
+    logger.info(
+        f"📝 Summary index for {repo_id}: {stats['files']} files, {stats['dirs']} directories "
+        f"({stats['generated']} generated, {stats['cached']} reused, {stats['failed']} failed)"
+    )
+    return stats
+
+
+def ensure_summary_indexes(collection=None):
+    collection = collection if collection is not None else summaries_collection
+    collection.create_index("input_hash")
+    collection.create_index([("repo_id", 1), ("commit", 1)])
+
+
+# Question routing for /query: broad questions that the summary index
+# answers better (and far faster) than top-5 chunk retrieval. Patterns match
+# case-insensitively so PATH keeps the path as written.
+_REPO_WORDS = r"(this|the) (repo|repository|project|codebase|code base|library|app|tool)"
+OVERVIEW = "overview"
+LAYOUT = "layout"
+PATH = "path"
+_ROUTES = (
+    (OVERVIEW, re.compile(
+        rf"what (is|does) {_REPO_WORDS}( (do|about|for))?"
+        rf"|what's {_REPO_WORDS}( (about|for))?"
+        rf"|(give me |can you give me )?(an? )?(overview|summary|tl;?dr)( of {_REPO_WORDS})?"
+        rf"|(summari[sz]e|explain|describe) {_REPO_WORDS}",
+        re.IGNORECASE,
+    )),
+    (LAYOUT, re.compile(
+        r"(show( me)?|what is|what's|explain|describe) (the )?"
+        r"(file|folder|directory|project|repo|repository|codebase|code) (structure|layout|tree|organi[sz]ation)"
+        rf"|how is {_REPO_WORDS} (structured|organi[sz]ed|laid out)",
+        re.IGNORECASE,
+    )),
+    (PATH, re.compile(
+        r"(what (is|does)|what's|explain|describe|summari[sz]e) (the )?"
+        r"`?(?P<path>[\w.\-]+(/[\w.\-]+)*)/?`?( (?P<kind>folder|directory|dir|module|package|file))?( (do|for|contain|about))?",
+        re.IGNORECASE,
+    )),
+)
+# A file extension: "README.md", "src/App.tsx", ".env"
+_EXTENSION = re.compile(r"\.\w+$")
+
+
+def route_question(question: str):
+    """
+    Returns (route, path) for a question the summary index can answer —
+    `path` is the file or directory asked about for PATH — or None. A bare
+    word only counts as a path when the question calls it a folder, file,
+    module or package, so "what is recursion?" goes to chunk retrieval.
+    """
+    question = re.sub(r"\s+", " ", question.strip()).rstrip("?!. ")
+    for route, pattern in _ROUTES:
+        match = pattern.fullmatch(question)
+        if not match:
+            continue
+        if route != PATH:
+            return route, None
+        path = match.group("path")
+        if "/" in match.group(0) or _EXTENSION.search(path) or match.group("kind"):
+            return route, path
+    return None
+
+
+def summary_answer(route: str, node: dict) -> dict:
+    """
+    Builds the /query answer for a routed question from its summary node
+    (the repo node for OVERVIEW and LAYOUT).
+    """
+    if route != LAYOUT:
+        return {"answer": node["summary"], "citations": node["citations"]}
+    sections = "\n".join(f"- `{section['path']}/`: {section['summary']}" for section in node.get("sections", []))
+    answer = f"```\n{node['tree']}\n```"
+    if sections:
+        answer += f"\n\n{sections}"
+    return {"answer": answer, "citations": node["citations"]}
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import mongomock
+import pytest
+
+# Backend modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# The Gemini client is created at import; tests never call it
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["unrepo"]
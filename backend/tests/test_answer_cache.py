@@ -0,0 +1,33 @@
+from answer_cache import AnswerCache
+
+
+def test_asking_again_replaces_the_semantic_row():
+    cache = AnswerCache(threshold=0.9)
+    cache.put("o/r", "v1", "How is login handled?", [1.0, 0.0], "old answer")
+    cache.put("o/r", "v1", "how is  login handled", [1.0, 0.05], "new answer")
+    bucket = cache.semantic["o/r"]
+    assert bucket.questions == ["how is login handled"]
+    assert bucket.vectors.shape == (1, 2)
+    assert cache.get_similar("o/r", "v1", [1.0, 0.0]) == "new answer"
+    assert cache.get_exact("o/r", "v1", "How is login handled") == "new answer"
+
+
+def test_replaced_question_moves_to_the_most_recent_row():
+    cache = AnswerCache(semantic_per_repo=2)
+    cache.put("o/r", "v1", "a", [1.0, 0.0], "A")
+    cache.put("o/r", "v1", "b", [0.0, 1.0], "B")
+    cache.put("o/r", "v1", "a", [1.0, 0.0], "A2")
+    cache.put("o/r", "v1", "c", [0.7, 0.7], "C")
+    # "b" is now the oldest and the first to go
+    bucket = cache.semantic["o/r"]
+    assert bucket.questions == ["a", "c"]
+    assert [answer for answer, _ in bucket.entries] == ["A2", "C"]
+    assert cache.get_similar("o/r", "v1", [1.0, 0.0]) == "A2"
+
+
+def test_a_new_version_starts_an_empty_bucket():
+    cache = AnswerCache()
+    cache.put("o/r", "v1", "a", [1.0, 0.0], "A")
+    assert cache.get_similar("o/r", "v2", [1.0, 0.0]) is None
+    cache.put("o/r", "v2", "a", [1.0, 0.0], "A2")
+    assert cache.semantic["o/r"].questions == ["a"]
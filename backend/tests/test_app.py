@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from app import repo_status
+from fakes import FakeAsyncCollection
+from jobs import DONE, FAILED, EMBEDDING
+
+
+class Resources:
+    def __init__(self, jobs=(), chunks=(), indexes=()):
+        self.index_jobs = FakeAsyncCollection(jobs)
+        self.chunks = FakeAsyncCollection(chunks)
+        self.repo_indexes = FakeAsyncCollection(indexes)
+
+
+def status(res):
+    code, body = asyncio.run(repo_status(res, "o/r"))
+    return code, body["status"]
+
+
+def job(state):
+    return {"_id": "o/r", "status": state, "repo_url": "https://github.com/o/r"}
+
+
+def test_unknown_repo_is_reported_as_indexing():
+    # What pollers got before index jobs were tracked
+    assert asyncio.run(repo_status(Resources(), "o/r")) == (202, {"status": "indexing"})
+
+
+def test_repo_indexed_without_a_job_is_indexed():
+    assert status(Resources(chunks=[{"_id": 1, "repo_id": "o/r"}])) == (200, "indexed")
+
+
+@pytest.mark.parametrize("state, expected", [(EMBEDDING, (202, "indexing")), (DONE, (200, "indexed")), (FAILED, (500, "failed"))])
+def test_job_state_is_reported(state, expected):
+    assert status(Resources(jobs=[job(state)])) == expected
+
+
+def test_refresh_of_an_indexed_repo_is_indexed():
+    assert status(Resources(jobs=[job(EMBEDDING)], indexes=[{"_id": "o/r"}])) == (200, "indexed")
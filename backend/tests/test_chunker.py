@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+import chunker
+from chunker import chunk_document
+
+
+def unit(header, budget_share=0.6, indent="    "):
+    """
+    Lines of a unit starting with `header` and padded to about
+    `budget_share` of the segment budget, so two never fit in one chunk.
+    """
+    lines = list(header)
+    i = 0
+    while chunker._length("\n".join(lines)) < budget_share * chunker._max_segment:
+        lines.append(f"{indent}value_{i} = compute({i})")
+        i += 1
+    return lines
+
+
+def check_line_ranges(text, chunks):
+    lines = text.split("\n")
+    for chunk in chunks:
+        assert 1 <= chunk["start_line"] <= chunk["end_line"] <= len(lines)
+        assert chunk["content"] in "\n".join(lines[chunk["start_line"] - 1:chunk["end_line"]])
+        assert lines[chunk["start_line"] - 1].strip() and lines[chunk["end_line"] - 1].strip()
+
+
+def test_python_chunks_start_at_def_and_class_boundaries():
+    lines = ["import os", ""]
+    lines += unit(["# Runs first", "@cached", "def alpha():"]) + ["", ""]
+    lines += unit(["class Beta:", '    """Attributes only."""']) + ["", ""]
+    lines += unit(["async def gamma():"])
+    text = "\n".join(lines)
+
+    chunks = chunk_document(text, "module.py")
+    check_line_ranges(text, chunks)
+    for chunk in chunks:
+        assert chunk["content"] == "\n".join(lines[chunk["start_line"] - 1:chunk["end_line"]])
+    starts = [lines[chunk["start_line"] - 1] for chunk in chunks]
+    # The leading comment and decorator stay with their function; the imports
+    # are merged into the first unit
+    assert starts == ["import os", "class Beta:", "async def gamma():"]
+    assert [chunk["symbol"] for chunk in chunks] == ["alpha", "Beta", "gamma"]
+    assert chunks[-1]["end_line"] == len(lines)
+
+
+def test_small_python_units_are_merged_and_methods_fold_into_their_class():
+    text = "import os\n\n\nclass Foo:\n    def a(self):\n        pass\n\n    def b(self):\n        pass\n\n\ndef helper():\n    return 1\n"
+    chunks = chunk_document(text, "small.py")
+    assert len(chunks) == 1
+    assert (chunks[0]["symbol"], chunks[0]["start_line"], chunks[0]["end_line"]) == ("Foo, helper", 1, 13)
+
+
+def test_python_with_syntax_errors_falls_back_to_regex_boundaries():
+    lines = ["def broken(:", "    pass", "", "class Fine:", "    pass"]
+    assert chunker._python_boundaries(lines) == [(0, "broken"), (3, "Fine")]
+
+
+def test_oversized_units_are_split_under_the_budget():
+    lines = unit(["def huge():"], budget_share=3.5)
+    text = "\n".join(lines)
+    chunks = chunk_document(text, "huge.py")
+    assert len(chunks) >= 4
+    assert all(chunker._length(chunk["content"]) <= chunker._max_segment for chunk in chunks)
+    assert {chunk["symbol"] for chunk in chunks} == {"huge"}
+    check_line_ranges(text, chunks)
+    assert chunks[0]["start_line"] == 1 and chunks[-1]["end_line"] == len(lines)
+    assert all(a["end_line"] <= b["start_line"] for a, b in zip(chunks, chunks[1:]))
+
+
+def test_typescript_chunks_start_at_top_level_declarations():
+    lines = unit(["export function parse(input: string) {"], indent="  ") + ["}", ""]
+    lines += unit(["export default class Lexer {"], indent="  ") + ["}", ""]
+    lines += unit(["const table = {"], indent="  ") + ["};"]
+    text = "\n".join(lines)
+    chunks = chunk_document(text, "parser.ts")
+    check_line_ranges(text, chunks)
+    assert [lines[chunk["start_line"] - 1].split()[1] for chunk in chunks] == ["function", "default", "table"]
+    if chunker.get_parser is None:
+        assert [chunk["symbol"] for chunk in chunks] == ["parse", "Lexer", "table"]
+
+
+def test_markdown_chunks_follow_headings():
+    lines = unit(["# Install"], indent="") + [""] + unit(["## Usage"], indent="")
+    text = "\n".join(lines)
+    chunks = chunk_document(text, "README.md")
+    usage = lines.index("## Usage") + 1
+    assert [(chunk["symbol"], chunk["start_line"]) for chunk in chunks] == [("Install", 1), ("Usage", usage)]
+
+
+def test_notebook_cells_are_units_and_outputs_are_dropped():
+    notebook = {"cells": [
+        {"cell_type": "markdown", "source": ["# Title\n", "Intro"]},
+        {"cell_type": "code", "source": "import numpy as np", "outputs": [{"data": {"image/png": "iVBORw0KGgo="}}]},
+    ]}
+    chunks = chunk_document(json.dumps(notebook), "analysis.ipynb")
+    assert len(chunks) == 1
+    assert chunks[0]["content"] == "# Title\nIntro\n\nimport numpy as np"
+    assert chunks[0]["symbol"] == "markdown cell 1, code cell 2"
+    assert "iVBORw0KGgo" not in chunks[0]["content"]
+
+
+@pytest.mark.parametrize("filename", ["notes.txt", "data.json"])
+def test_files_without_a_chunker_use_the_generic_splitter(filename):
+    text = "\n".join(f"line {i}: " + "word " * 12 for i in range(400))
+    chunks = chunk_document(text, filename)
+    assert len(chunks) > 1
+    assert {chunk["symbol"] for chunk in chunks} == {None}
+    check_line_ranges(text, chunks)
+    assert chunks[0]["start_line"] == 1 and chunks[-1]["end_line"] == 400
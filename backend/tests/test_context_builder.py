@@ -0,0 +1,26 @@
+import pytest
+
+from context_builder import build_context
+from tokenizer import count_tokens
+
+
+def chunk(name, lines):
+    body = "\n".join(f"    total_{name}_{i} = add(total_{name}_{i - 1}, {i})" for i in range(lines))
+    return {"filepath": f"o__r/src/{name}.py", "content": body, "start_line": 1, "end_line": lines}
+
+
+@pytest.mark.parametrize("budget", [70, 150, 400, 1000])
+def test_cut_context_stays_within_the_budget(budget):
+    chunks = [chunk(name, 60) for name in ("parser", "lexer", "emitter")]
+    context = build_context(chunks, token_budget=budget)
+    assert context["spans"] >= 1
+    assert context["text"].endswith("\n...")
+    assert count_tokens(context["text"]) <= context["tokens"] <= budget
+
+
+def test_context_that_fits_is_not_cut():
+    chunks = [chunk("parser", 3), chunk("lexer", 3)]
+    context = build_context(chunks, token_budget=1000)
+    assert context["citations"] == ["o/r/src/parser.py", "o/r/src/lexer.py"]
+    assert "..." not in context["text"]
+    assert count_tokens(context["text"]) == context["tokens"]
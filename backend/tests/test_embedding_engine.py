@@ -0,0 +1,150 @@
+import time
+
+import httpx
+import pytest
+
+import embedding_engine
+from embedding_engine import EmbeddingEngine, RateLimitError, TokenBucket, is_retryable_error
+from fakes import FakeEmbedder, fake_vector
+
+
+class APIError(Exception):
+    """
+    Shaped like google.genai.errors.APIError: the HTTP status is in `code`.
+    """
+
+    def __init__(self, code):
+        super().__init__(f"{code} error (fake)")
+        self.code = code
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    Sleeps (retry backoff and quota waits), recorded instead of slept.
+    """
+    slept = []
+    monkeypatch.setattr(embedding_engine.time, "sleep", lambda seconds: seconds and slept.append(seconds))
+    return slept
+
+
+def items(n):
+    return [{"text": f"chunk {i}", "tokens": 3} for i in range(n)]
+
+
+def engine(embedder, **options):
+    options = {"batch_size": 8, "min_batch_size": 2, "max_concurrency": 4, "requests_per_minute": 60_000,
+               "tokens_per_minute": 10_000_000, "max_retries": 3, "target_latency": 1.0, **options}
+    return EmbeddingEngine(embedder, **options)
+
+
+def embed_all(engine, n):
+    results = dict((item["text"], vector) for item, vector in engine.embed(items(n)))
+    assert results == {f"chunk {i}": fake_vector(f"chunk {i}", 8) for i in range(n)}
+    return results
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (RateLimitError("429"), True),
+    (APIError(429), True),
+    (APIError(503), True),
+    (APIError(408), True),
+    (httpx.ConnectError("connection reset"), True),
+    (TimeoutError(), True),
+    (APIError(400), False),
+    (APIError(403), False),
+    (ValueError("bad input"), False),
+])
+def test_is_retryable_error(error, retryable):
+    assert is_retryable_error(error) is retryable
+
+
+def test_rate_limits_are_retried_and_cut_concurrency(sleeps):
+    embedder = FakeEmbedder(latency=0, dim=8, failures=[RateLimitError("429"), APIError(429)])
+    embedding = engine(embedder)
+    embed_all(embedding, 1)
+    assert embedder.attempts == 3
+    assert (embedding.stats.retries, embedding.stats.rate_limited) == (2, 2)
+    # Jittered exponential backoff: 0.5s, then 1s, each times 0.5-1.5 (the
+    # rest are short waits for the drained request bucket)
+    backoffs = [seconds for seconds in sleeps if seconds >= 0.25]
+    assert len(backoffs) == 2
+    assert 0.25 <= backoffs[0] <= 0.75 and 0.5 <= backoffs[1] <= 1.5
+    # Halved twice (4 -> 1, 8 -> 2), then one fast batch added one step back
+    assert (embedding.concurrency, embedding.batch_size) == (2, 4)
+
+
+def test_server_and_transport_errors_are_retried_without_cutting_concurrency(sleeps):
+    embedder = FakeEmbedder(latency=0, dim=8, failures=[APIError(503), httpx.ReadTimeout("timed out")])
+    embedding = engine(embedder)
+    embed_all(embedding, 1)
+    assert embedder.attempts == 3
+    assert (embedding.stats.retries, embedding.stats.rate_limited) == (2, 0)
+    assert embedding.concurrency == 4
+
+
+@pytest.mark.parametrize("error", [APIError(400), APIError(401), ValueError("bad input")])
+def test_client_errors_fail_fast(sleeps, error):
+    embedder = FakeEmbedder(latency=0, dim=8, failures=[error])
+    with pytest.raises(type(error)):
+        list(engine(embedder).embed(items(1)))
+    assert embedder.attempts == 1
+    assert sleeps == []
+
+
+def test_retries_give_up_after_max_retries(sleeps):
+    embedder = FakeEmbedder(latency=0, dim=8, failures=[APIError(500)] * 10)
+    with pytest.raises(APIError):
+        list(engine(embedder, max_retries=2).embed(items(1)))
+    assert embedder.attempts == 3
+
+
+def test_concurrency_and_batch_size_recover_after_rate_limits(sleeps):
+    embedding = engine(FakeEmbedder(latency=0, dim=8))
+    embedding._on_rate_limit()
+    embedding._on_rate_limit()
+    assert (embedding.concurrency, embedding.batch_size) == (1, 2)
+    embed_all(embedding, 100)
+    assert (embedding.concurrency, embedding.batch_size) == (4, 8)
+
+
+def test_slow_batches_shrink_the_batch_size(sleeps):
+    embedding = engine(FakeEmbedder(latency=0, dim=8), target_latency=-1)
+    embed_all(embedding, 40)
+    assert (embedding.concurrency, embedding.batch_size) == (4, 2)
+
+
+def test_requests_are_paced_by_the_request_quota():
+    embedder = FakeEmbedder(latency=0, dim=8)
+    # 20 requests/s, one at a time: the bucket holds a single request
+    embedding = engine(embedder, batch_size=1, min_batch_size=1, max_concurrency=1, requests_per_minute=1200)
+    start = time.monotonic()
+    embed_all(embedding, 6)
+    assert time.monotonic() - start >= 5 / 20 * 0.9
+    assert embedder.attempts == 6
+
+
+def test_token_bucket_bursts_to_capacity_then_paces():
+    bucket = TokenBucket(per_minute=1200, capacity=2)
+    start = time.monotonic()
+    bucket.acquire()
+    bucket.acquire()
+    assert time.monotonic() - start < 0.04
+    for _ in range(4):
+        bucket.acquire()
+    assert time.monotonic() - start >= 4 / 20 * 0.9
+
+
+def test_token_bucket_clamps_requests_larger_than_capacity():
+    bucket = TokenBucket(per_minute=60, capacity=10)
+    start = time.monotonic()
+    bucket.acquire(1000)
+    assert time.monotonic() - start < 0.1
+
+
+def test_drained_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=1200, capacity=5)
+    bucket.drain()
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 1 / 20 * 0.9
@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+import pytest
+
+import jobs
+from config import JOB_STALE_SECONDS
+
+
+@pytest.fixture
+def collection(db, monkeypatch):
+    monkeypatch.setattr(jobs, "jobs_collection", db["index_jobs"])
+    return db["index_jobs"]
+
+
+def test_claim_creates_queued_job(collection):
+    job, claimed = jobs._claim("owner/repo", "https://github.com/owner/repo", owner="a")
+    assert claimed
+    assert job["status"] == jobs.QUEUED
+    assert job["owner"] == "a"
+
+
+def test_active_job_is_not_claimed_twice(collection):
+    jobs._claim("owner/repo", "https://github.com/owner/repo", owner="a")
+    job, claimed = jobs._claim("owner/repo", "https://github.com/owner/repo", owner="b")
+    assert not claimed
+    assert job["owner"] == "a"
+
+
+def test_finished_job_is_reclaimed(collection):
+    jobs._claim("owner/repo", "https://github.com/owner/repo", owner="a")
+    collection.update_one({"_id": "owner/repo"}, {"$set": {"status": jobs.DONE}})
+    job, claimed = jobs._claim("owner/repo", "https://github.com/owner/repo", refresh=True, owner="b")
+    assert claimed
+    assert job["owner"] == "b"
+    assert job["status"] == jobs.QUEUED
+    assert job["refresh"]
+
+
+def test_queued_job_with_fresh_heartbeat_is_not_reclaimed(collection):
+    # Waiting for a worker for longer than JOB_STALE_SECONDS without any
+    # progress writes, but the owner is alive
+    jobs._claim("owner/repo", "https://github.com/owner/repo", owner="a")
+    long_ago = jobs._now() - timedelta(seconds=JOB_STALE_SECONDS * 2)
+    collection.update_one({"_id": "owner/repo"}, {"$set": {"updated_at": long_ago}})
+    assert jobs.beat(["owner/repo"], owner="a") == 1
+
+    _, claimed = jobs._claim("owner/repo", "https://github.com/owner/repo", owner="b")
+    assert not claimed
+
+
+def test_job_of_dead_owner_is_reclaimed(collection):
+    jobs._claim("owner/repo", "https://github.com/owner/repo", owner="a")
+    long_ago = jobs._now() - timedelta(seconds=JOB_STALE_SECONDS + 1)
+    collection.update_one({"_id": "owner/repo"}, {"$set": {"heartbeat_at": long_ago}})
+
+    job, claimed = jobs._claim("owner/repo", "https://github.com/owner/repo", owner="b")
+    assert claimed
+    assert job["owner"] == "b"
+
+
+def test_legacy_job_without_heartbeat_goes_stale_on_updated_at(collection):
+    long_ago = jobs._now() - timedelta(seconds=JOB_STALE_SECONDS + 1)
+    collection.insert_one({"_id": "owner/repo", "status": jobs.EMBEDDING, "updated_at": long_ago})
+    _, claimed = jobs._claim("owner/repo", "https://github.com/owner/repo", owner="b")
+    assert claimed
+
+
+def test_previous_owner_stops_updating_a_reclaimed_job(collection):
+    jobs._claim("owner/repo", "https://github.com/owner/repo", owner="a")
+    long_ago = jobs._now() - timedelta(seconds=JOB_STALE_SECONDS + 1)
+    collection.update_one({"_id": "owner/repo"}, {"$set": {"heartbeat_at": long_ago}})
+    jobs._claim("owner/repo", "https://github.com/owner/repo", owner="b")
+
+    assert jobs.beat(["owner/repo"], owner="a") == 0
+    jobs.JobProgress("owner/repo", owner="a")(status=jobs.FAILED)
+    assert collection.find_one({"_id": "owner/repo"})["status"] == jobs.QUEUED
@@ -0,0 +1,64 @@
+import pytest
+
+import index_meta
+from lifecycle import delete_chunks, retire_builds, discard_build
+
+
+class RecordingRetriever:
+    def __init__(self):
+        self.dropped = []
+
+    def drop(self, repo_id, version=None):
+        self.dropped.append((repo_id, version))
+
+
+@pytest.fixture
+def chunks(db):
+    collection = db["code_chunks"]
+    collection.insert_many(
+        [{"repo_id": "o/r", "version": None, "chunk_id": i} for i in range(2)]
+        + [{"repo_id": "o/r", "version": "v1", "chunk_id": i} for i in range(3)]
+        + [{"repo_id": "o/r", "version": "v2", "chunk_id": i} for i in range(4)]
+        + [{"repo_id": "o/other", "version": "v1", "chunk_id": i} for i in range(2)]
+    )
+    return collection
+
+
+def versions(collection, repo_id):
+    return sorted(str(doc["version"]) for doc in collection.find({"repo_id": repo_id}))
+
+
+def test_record_repo_index_swaps_the_live_version(db, monkeypatch):
+    monkeypatch.setattr(index_meta, "meta_collection", db["repo_index"])
+    assert index_meta.record_repo_index("o/r", "https://github.com/o/r", "c1", "full", version="v1", chunks=3) is None
+    previous = index_meta.record_repo_index("o/r", "https://github.com/o/r", "c2", "incremental", version="v2", chunks=4)
+    assert previous["version"] == "v1"
+    live = index_meta.get_repo_index("o/r")
+    assert (live["version"], live["commit"], live["chunks"]) == ("v2", "c2", 4)
+
+
+def test_retire_builds_keeps_only_the_live_build(chunks):
+    retriever = RecordingRetriever()
+    removed = retire_builds("o/r", "v2", retriever, previous={"version": "v1"}, collection=chunks, grace=0)
+    assert removed == 5
+    assert versions(chunks, "o/r") == ["v2"] * 4
+    assert versions(chunks, "o/other") == ["v1"] * 2
+    assert retriever.dropped == [("o/r", "v1")]
+
+
+def test_retire_builds_of_a_first_build_drops_no_index(chunks):
+    retriever = RecordingRetriever()
+    retire_builds("o/r", "v2", retriever, previous=None, collection=chunks, grace=0)
+    assert retriever.dropped == []
+
+
+def test_discard_build_deletes_only_that_build(chunks):
+    retriever = RecordingRetriever()
+    discard_build("o/r", "v2", retriever, collection=chunks)
+    assert versions(chunks, "o/r") == ["None"] * 2 + ["v1"] * 3
+    assert retriever.dropped == [("o/r", "v2")]
+
+
+def test_delete_chunks_deletes_in_batches(chunks):
+    assert delete_chunks(chunks, {"repo_id": "o/r"}, batch=2) == 9
+    assert chunks.count_documents({"repo_id": "o/r"}) == 0
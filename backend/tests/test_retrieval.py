@@ -0,0 +1,212 @@
+import json
+import asyncio
+import threading
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from lexical_index import LexicalIndex
+from retrieval import AtlasRetriever, LexicalStore, HybridRetriever, fuse, dedupe
+
+
+def chunk(filepath, chunk_id, start=None, end=None, content=None):
+    return {
+        "filepath": filepath,
+        "chunk_id": chunk_id,
+        "content": content or f"def handler_{chunk_id}(): pass",
+        "start_line": start,
+        "end_line": end,
+    }
+
+
+def test_fuse_ranks_docs_found_by_both_lists_first():
+    a, b, c = chunk("r/a.py", 0), chunk("r/b.py", 0), chunk("r/c.py", 0)
+    fused = fuse([[a, b], [c, b]], k=60)
+    assert [doc["filepath"] for doc in fused] == ["r/b.py", "r/a.py", "r/c.py"]
+    assert fused[0]["score"] == 1 / 62 + 1 / 62
+
+
+def test_dedupe_drops_overlapping_lower_ranked_chunks():
+    docs = [chunk("r/a.py", 1, 10, 20), chunk("r/a.py", 0, 1, 12), chunk("r/a.py", 2, 21, 30), chunk("r/b.py", 0, 1, 12)]
+    assert [(doc["filepath"], doc["chunk_id"]) for doc in dedupe(docs)] == [("r/a.py", 1), ("r/a.py", 2), ("r/b.py", 0)]
+
+
+def test_lexical_store_builds_from_source_once(tmp_path):
+    calls = []
+
+    def source(repo_id, version=None):
+        calls.append(repo_id)
+        return [chunk(f"{repo_id}/parser.py", 0, content="def parse_tokens(): pass")]
+
+    store = LexicalStore(root=str(tmp_path), source=source)
+    assert store.index("o/r").search("parse tokens")[0]["filepath"] == "o/r/parser.py"
+    store.index("o/r")
+    assert calls == ["o/r"]
+
+
+def test_lexical_store_evicts_least_recently_used_clean_indexes(tmp_path):
+    store = LexicalStore(root=str(tmp_path), source=lambda repo_id, version=None: [chunk(f"{repo_id}/a.py", 0)], max_indexes=2)
+    store.index("o/a")
+    store.index("o/b")
+    store.index("o/a")
+    store.index("o/c")
+    assert list(store.indexes) == ["o__a", "o__c"]
+
+    # Unsaved changes (a build in progress) are kept over the bound
+    store.index("o/d").add([chunk("o/d/b.py", 1)])
+    store.index("o/e")
+    assert "o__d" in store.indexes
+    assert len(store.indexes) == 2
+
+    store.drop("o/d")
+    assert "o__d" not in store.indexes
+
+
+def test_lexical_store_loads_other_repos_while_one_builds(tmp_path):
+    release = threading.Event()
+    building = threading.Event()
+
+    def source(repo_id, version=None):
+        if repo_id == "o/slow":
+            building.set()
+            release.wait(5)
+        return [chunk(f"{repo_id}/a.py", 0)]
+
+    store = LexicalStore(root=str(tmp_path), source=source)
+    slow = threading.Thread(target=store.index, args=("o/slow",))
+    slow.start()
+    assert building.wait(5)
+    # Doesn't wait for the slow build
+    assert len(store.index("o/fast")) == 1
+    release.set()
+    slow.join(5)
+    assert len(store.index("o/slow")) == 1
+
+
+def test_lexical_index_keeps_ids_not_content(tmp_path):
+    index = LexicalIndex(str(tmp_path / "r.json"))
+    # Any iterable, e.g. a Mongo cursor, is consumed once
+    index.add(chunk(f"r/{name}.py", 0, content=f"def {name}_tokens(): pass") for name in ("parse", "render", "lex"))
+    hits = index.search("parse tokens")
+    assert hits[0].keys() == {"filepath", "chunk_id", "score"}
+    assert hits[0]["filepath"] == "r/parse.py"
+    index.save()
+    assert "def parse_tokens(): pass" not in (tmp_path / "r.json").read_text()
+
+
+def test_lexical_index_deletes_survive_save_and_load(tmp_path):
+    index = LexicalIndex(str(tmp_path / "r.json"))
+    index.add([chunk("r/a.py", 0, content="def alpha(): pass"), chunk("r/b.py", 0, content="def alpha_beta(): pass")])
+    assert index.delete(filepaths=["r/a.py"]) == 1
+    assert [hit["filepath"] for hit in index.search("alpha")] == ["r/b.py"]
+    index.save()
+    loaded = LexicalIndex(str(tmp_path / "r.json"))
+    assert len(loaded) == 1
+    assert [hit["filepath"] for hit in loaded.search("alpha")] == ["r/b.py"]
+    assert all(set(rows) == {0} for rows in loaded.postings.values())
+
+
+def test_lexical_index_loads_files_with_chunk_docs(tmp_path):
+    path = tmp_path / "r.json"
+    path.write_text(json.dumps({
+        "docs": [chunk("r/a.py", 0, content="def alpha(): pass"), None],
+        "lengths": [4, 3],
+        "postings": {"alpha": {"0": 4}, "beta": {"1": 3}},
+    }))
+    index = LexicalIndex(str(path))
+    assert len(index) == 1
+    assert [(hit["filepath"], hit["chunk_id"]) for hit in index.search("alpha beta")] == [("r/a.py", 0)]
+
+
+class StubVectors:
+    def __init__(self, found, stored):
+        self.found = found
+        self.stored = stored
+        self.fetched = []
+
+    def search_many(self, repo_id, vectors, limit, num_candidates, version=None):
+        return [list(self.found) for _ in vectors]
+
+    async def asearch_many(self, repo_id, vectors, limit, num_candidates, version=None):
+        return self.search_many(repo_id, vectors, limit, num_candidates, version)
+
+    def fetch(self, repo_id, ids, version=None):
+        self.fetched.append(list(ids))
+        return [doc for doc in self.stored if (doc["filepath"], doc["chunk_id"]) in ids]
+
+    async def afetch(self, repo_id, ids, version=None):
+        return self.fetch(repo_id, ids, version)
+
+
+def test_hybrid_fetches_only_bm25_hits_the_vector_search_missed(tmp_path):
+    docs = [chunk(f"o/r/{name}.py", 0, content=f"def {name}_handler(): pass") for name in ("auth", "login", "cache")]
+    store = LexicalStore(root=str(tmp_path), source=lambda repo_id, version=None: iter(docs))
+    vectors = StubVectors(found=[{**docs[0], "score": 0.9}], stored=docs)
+    retriever = HybridRetriever(vectors, store, candidates=5)
+
+    results = retriever.search_many("o/r", [[0.0], [0.0]], limit=5, texts=["auth handler", "login handler"])
+    # One round trip for both queries, without the chunk the vector search returned
+    assert vectors.fetched == [[("o/r/cache.py", 0), ("o/r/login.py", 0)]]
+    assert [doc["filepath"] for doc in results[1]][:2] == ["o/r/auth.py", "o/r/login.py"]
+    assert all(doc["content"] for result in results for doc in result)
+
+    vectors.fetched.clear()
+    result = asyncio.run(retriever.asearch("o/r", [0.0], limit=5, text="auth"))
+    assert vectors.fetched == [[]]
+    assert [doc["filepath"] for doc in result] == ["o/r/auth.py"]
+
+
+class SearchIndexes:
+    """
+    Answers list_search_indexes like Atlas, sync and async.
+    """
+
+    name = "code_chunks"
+
+    def __init__(self, definitions=(), error=None):
+        self.definitions = list(definitions)
+        self.error = error
+
+    def list_search_indexes(self, name=None):
+        if self.error:
+            raise self.error
+        return [d for d in self.definitions if name is None or d["name"] == name]
+
+
+class AsyncSearchIndexes(SearchIndexes):
+    class Cursor(list):
+        async def to_list(self):
+            return list(self)
+
+    async def list_search_indexes(self, name=None):
+        return self.Cursor(SearchIndexes.list_search_indexes(self, name))
+
+
+def vector_index(*filters, name="default"):
+    fields = [{"type": "vector", "path": "embedding", "numDimensions": 768, "similarity": "cosine"}]
+    fields += [{"type": "filter", "path": path} for path in filters]
+    return {"name": name, "type": "vectorSearch", "latestDefinition": {"fields": fields}}
+
+
+def test_atlas_index_with_every_filter_field_passes_the_check():
+    AtlasRetriever(SearchIndexes([vector_index("repo_id", "version")])).check_index()
+    asyncio.run(AtlasRetriever(AsyncSearchIndexes([vector_index("version", "repo_id")])).acheck_index())
+
+
+def test_atlas_index_without_the_version_filter_fails_the_check_by_name(tmp_path):
+    # An index created before builds were versioned
+    collection = SearchIndexes([vector_index("repo_id"), vector_index("repo_id", "version", name="other")])
+    with pytest.raises(RuntimeError, match=r"missing filter field\(s\) version;"):
+        AtlasRetriever(collection).check_index()
+    retriever = HybridRetriever(AtlasRetriever(AsyncSearchIndexes([vector_index()])), LexicalStore(root=str(tmp_path), source=None))
+    with pytest.raises(RuntimeError, match=r"missing filter field\(s\) repo_id, version;"):
+        asyncio.run(retriever.acheck_index())
+
+
+def test_missing_atlas_index_fails_the_check():
+    with pytest.raises(RuntimeError, match="'default' not found"):
+        AtlasRetriever(SearchIndexes([vector_index("repo_id", "version", name="old")])).check_index()
+
+
+def test_atlas_check_is_skipped_where_search_indexes_cannot_be_listed():
+    AtlasRetriever(SearchIndexes(error=OperationFailure("not supported"))).check_index()
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import index_meta
+import snapshot
+from fakes import BulkWriteCollection, fake_vector
+from retrieval import LocalRetriever
+from snapshot import Snapshot, export_repo, load_snapshot
+
+
+def chunk(i, version="v1"):
+    content = f"def handler_{i}():\n    return {i}  # é\n"
+    return {
+        "repo_id": "o/r",
+        "version": version,
+        "filepath": f"o/r/src/mod_{i % 3}.py",
+        "language": "python",
+        "symbol": f"handler_{i}" if i % 2 else None,
+        "commit": "c1",
+        "chunk_id": i,
+        "start_line": i * 3 + 1,
+        "end_line": i * 3 + 2,
+        "token_count": 12,
+        "content": content,
+        "content_hash": f"{i + 1:064x}",
+        "embedding": fake_vector(content, dim=16),
+    }
+
+
+@pytest.fixture
+def source(db, monkeypatch):
+    monkeypatch.setattr(index_meta, "meta_collection", db["repo_index"])
+    monkeypatch.setattr(snapshot, "jobs_collection", db["index_jobs"])
+    collection = db["code_chunks"]
+    collection.insert_many([chunk(i) for i in range(5)] + [chunk(9, version="old")])
+    index_meta.record_repo_index("o/r", "https://github.com/o/r", "c1", "full", version="v1", chunks=5)
+    return collection
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("float32", 1e-6), ("float16", 1e-3)])
+def test_export_then_load_round_trips_the_live_build(db, source, tmp_path, dtype, tolerance):
+    manifest = export_repo(source, "o/r", tmp_path / "snap", dtype)
+    assert (manifest["rows"], manifest["dim"], manifest["source_version"]) == (5, 16, "v1")
+
+    docs = Snapshot(tmp_path / "snap")
+    assert len(docs) == 5
+
+    target = BulkWriteCollection(db["copied_chunks"])
+    retriever = LocalRetriever(root=str(tmp_path / "index"))
+    result = load_snapshot(tmp_path / "snap", target, retriever, repo_id="o/copy")
+    assert result["chunks"] == 5
+    assert index_meta.get_repo_index("o/copy")["version"] == result["version"]
+
+    fields = [field for field in chunk(0) if field not in ("repo_id", "version", "embedding")]
+    for original in source.find({"version": "v1"}):
+        loaded = target.find_one({"repo_id": "o/copy", "chunk_id": original["chunk_id"]})
+        expected = {field: original[field] for field in fields}
+        expected["filepath"] = "o/copy/" + original["filepath"].removeprefix("o/r/")
+        assert {field: loaded.get(field) for field in fields} == expected
+        assert loaded["version"] == result["version"]
+        assert np.allclose(loaded["embedding"], original["embedding"], atol=tolerance)
+
+    hits = retriever.search("o/copy", chunk(3)["embedding"], limit=1, version=result["version"])
+    assert (hits[0]["filepath"], hits[0]["chunk_id"]) == ("o/copy/src/mod_0.py", 3)
+
+
+def test_load_refuses_a_snapshot_from_another_embedding_model(db, source, tmp_path, monkeypatch):
+    export_repo(source, "o/r", tmp_path / "snap")
+    monkeypatch.setattr(snapshot, "EMBED_MODEL", "other-model")
+    with pytest.raises(ValueError, match="pass force"):
+        load_snapshot(tmp_path / "snap", BulkWriteCollection(db["copied_chunks"]), LocalRetriever(root=str(tmp_path)))
@@ -0,0 +1,145 @@
+import pytest
+
+from fakes import BulkWriteCollection
+from summaries import route_question, build_summary_index, input_hash, OVERVIEW, LAYOUT, PATH
+
+
+@pytest.mark.parametrize("question", [
+    "What does this repo do?",
+    "what is the project about",
+    "Give me an overview",
+    "Summarize this codebase.",
+])
+def test_routes_overview_questions(question):
+    assert route_question(question) == (OVERVIEW, None)
+
+
+@pytest.mark.parametrize("question", [
+    "Show me the folder structure",
+    "How is this repository organized?",
+])
+def test_routes_layout_questions(question):
+    assert route_question(question) == (LAYOUT, None)
+
+
+@pytest.mark.parametrize("question, path", [
+    ("What does src/App.tsx do?", "src/App.tsx"),
+    ("What is README.md?", "README.md"),
+    ("explain `backend/Models/`", "backend/Models"),
+    ("What is  the   Utils folder?", "Utils"),
+    ("describe .env", ".env"),
+])
+def test_routes_path_questions_with_the_path_as_written(question, path):
+    assert route_question(question) == (PATH, path)
+
+
+@pytest.mark.parametrize("question", [
+    "what is recursion?",
+    "What does Django do?",
+    "How is auth handled?",
+])
+def test_leaves_other_questions_to_retrieval(question):
+    assert route_question(question) is None
+
+
+class RecordingGenerator:
+    """
+    Answers each prompt with a summary derived from it and records the
+    file or directory each call was for.
+    """
+
+    def __init__(self, fail=()):
+        self.fail = fail
+        self.calls = []
+
+    def __call__(self, prompt):
+        if "File: " in prompt:
+            subject = prompt.split("File: ", 1)[1].split("\n", 1)[0]
+        elif "`" in prompt:
+            subject = prompt.split("`", 2)[1]
+        else:
+            subject = "repo"
+        self.calls.append(subject)
+        if subject in self.fail:
+            raise RuntimeError("429 RESOURCE_EXHAUSTED (fake)")
+        return f"About {subject} ({input_hash(prompt)[:8]})"
+
+
+@pytest.fixture
+def checkout(tmp_path):
+    files = {
+        "README.md": "# Demo\nA demo app.\n",
+        "src/app.py": "def main():\n    return 1\n",
+        "src/util/helpers.py": "def helper():\n    return 2\n",
+        "docs/guide.md": "How to use the demo.\n",
+    }
+    for path, content in files.items():
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(content)
+    return tmp_path
+
+
+def paths(checkout):
+    return [str(checkout / path) for path in ("README.md", "src/app.py", "src/util/helpers.py", "docs/guide.md")]
+
+
+def test_build_summary_index_stores_files_directories_and_the_repo(db, checkout):
+    collection = BulkWriteCollection(db["repo_summaries"])
+    generate = RecordingGenerator()
+    stats = build_summary_index(checkout, paths(checkout), "o/r", "c1", collection=collection, generate=generate)
+
+    assert (stats["files"], stats["dirs"], stats["generated"], stats["cached"]) == (4, 3, 8, 0)
+    # Children are summarized before the directories that roll them up
+    assert generate.calls.index("src/util/helpers.py") < generate.calls.index("src/util/") < generate.calls.index("src/")
+    assert generate.calls[-1] == "repo"
+
+    node = collection.find_one({"_id": "o/r/src/app.py"})
+    assert (node["kind"], node["parent"], node["citations"], node["commit"]) == ("file", "src", ["o/r/src/app.py"], "c1")
+    assert node["summary"].startswith("About src/app.py")
+    assert collection.find_one({"_id": "o/r/src/util"})["kind"] == "dir"
+    repo = collection.find_one({"_id": "o/r"})
+    assert repo["citations"] == ["o/r/README.md"]
+    assert [section["path"] for section in repo["sections"]] == ["docs", "src"]
+    assert "helpers.py" in repo["tree"]
+
+
+def test_unchanged_rebuild_reuses_every_summary(db, checkout):
+    collection = BulkWriteCollection(db["repo_summaries"])
+    build_summary_index(checkout, paths(checkout), "o/r", "c1", collection=collection, generate=RecordingGenerator())
+    generate = RecordingGenerator()
+    stats = build_summary_index(checkout, paths(checkout), "o/r", "c2", collection=collection, generate=generate)
+    assert generate.calls == []
+    assert stats["cached"] == 8
+    assert {node["commit"] for node in collection.find()} == {"c2"}
+
+
+def test_refresh_only_reads_changed_files_and_their_ancestors(db, checkout):
+    collection = BulkWriteCollection(db["repo_summaries"])
+    build_summary_index(checkout, paths(checkout), "o/r", "c1", collection=collection, generate=RecordingGenerator())
+    guide = collection.find_one({"_id": "o/r/docs/guide.md"})["summary"]
+
+    (checkout / "src/app.py").write_text("def main():\n    return 3\n")
+    # Not in the refresh diff, so not read again
+    (checkout / "docs/guide.md").write_text("Something else entirely.\n")
+    generate = RecordingGenerator()
+    build_summary_index(
+        checkout, paths(checkout), "o/r", "c2", collection=collection, generate=generate,
+        changed=[str(checkout / "src/app.py")],
+    )
+    assert generate.calls == ["src/app.py", "src/", "repo"]
+    assert collection.find_one({"_id": "o/r/docs/guide.md"})["summary"] == guide
+
+
+def test_nodes_of_removed_or_failed_paths_are_dropped(db, checkout):
+    collection = BulkWriteCollection(db["repo_summaries"])
+    build_summary_index(checkout, paths(checkout), "o/r", "c1", collection=collection, generate=RecordingGenerator())
+    remaining = [path for path in paths(checkout) if "guide" not in path]
+    (checkout / "src/app.py").write_text("def main():\n    return 3\n")
+    stats = build_summary_index(
+        checkout, remaining, "o/r", "c2", collection=collection, generate=RecordingGenerator(fail={"src/app.py"}),
+    )
+    assert stats["failed"] == 1
+    ids = {node["_id"] for node in collection.find()}
+    assert "o/r/docs/guide.md" not in ids and "o/r/docs" not in ids
+    assert "o/r/src/app.py" not in ids
+    assert {"o/r", "o/r/src", "o/r/src/util/helpers.py"} <= ids
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+
+from local_index import LocalVectorIndex
+from retrieval import rescore
+from vector_codec import quantize_int8, dequantize_int8, embedding_fields, decode_embedding, query_vector
+
+
+def random_vectors(n, dim=32, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def cosine_top_k(vectors, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    order = np.argsort(-scores)[:k]
+    return list(order), scores[order]
+
+
+def docs_for(vectors, prefix="r/a.py"):
+    return [{"filepath": prefix, "chunk_id": i, "content": f"chunk {i}", "embedding": vector}
+            for i, vector in enumerate(vectors)]
+
+
+def test_int8_round_trip_is_within_half_a_step():
+    vectors = random_vectors(50)
+    vectors[3] = 0
+    codes, scales = quantize_int8(vectors)
+    assert codes.dtype == np.int8 and scales.shape == (50,)
+    restored = dequantize_int8(codes, scales)
+    assert np.all(np.abs(restored - vectors) <= scales[:, None] / 2 + 1e-6)
+    # No component flips sign (tiny ones may round to 0), and the largest
+    # component maps to +-127
+    assert np.all(np.sign(restored) * np.sign(vectors) >= 0)
+    assert np.sign(restored).any(axis=1).sum() == 49
+    assert np.all(np.abs(codes[np.arange(50) != 3]).max(axis=1) == 127)
+    assert np.all(restored[3] == 0)
+
+
+@pytest.mark.parametrize("storage", ["array", "float32", "int8"])
+def test_stored_embeddings_decode_to_the_original_vector(storage):
+    vector = random_vectors(1)[0]
+    doc = embedding_fields(vector, storage)
+    assert np.allclose(decode_embedding(doc), vector, atol=1e-6)
+
+
+def test_int8_codes_alone_decode_close_to_the_original():
+    vector = random_vectors(1)[0]
+    doc = embedding_fields(vector, "int8")
+    del doc["embedding_full"]
+    decoded = decode_embedding(doc)
+    assert np.abs(decoded - vector).max() <= doc["embedding_scale"] / 2 + 1e-6
+    assert np.dot(decoded, vector) / (np.linalg.norm(decoded) * np.linalg.norm(vector)) > 0.999
+
+
+def test_int8_query_vector_matches_the_indexed_codes():
+    vector = random_vectors(1)[0]
+    assert bytes(query_vector(vector, "int8")) == bytes(embedding_fields(vector, "int8")["embedding"])
+
+
+def test_rescore_ranks_candidates_by_exact_cosine():
+    vectors = random_vectors(20, seed=1)
+    query = vectors[7] + 0.01
+    docs = [{"filepath": "r/a.py", "chunk_id": i, **embedding_fields(vector, "int8")} for i, vector in enumerate(vectors)]
+    ranked = rescore(docs, query, 5)
+    expected, scores = cosine_top_k(vectors, query, 5)
+    assert [doc["chunk_id"] for doc in ranked] == expected
+    assert np.allclose([doc["score"] for doc in ranked], scores, atol=1e-5)
+    assert not any(field.startswith("embedding") for doc in ranked for field in doc)
+
+
+def test_local_index_search_matches_brute_force(tmp_path):
+    vectors = random_vectors(300)
+    index = LocalVectorIndex(str(tmp_path / "index"))
+    index.add(docs_for(vectors))
+    query = random_vectors(1, seed=9)[0]
+    expected, scores = cosine_top_k(vectors, query, 10)
+    found = index.search(query, 10)
+    assert [doc["chunk_id"] for doc in found] == expected
+    assert np.allclose([doc["score"] for doc in found], scores, atol=1e-5)
+    assert "embedding" not in found[0]
+
+
+def test_local_index_replaces_and_deletes(tmp_path):
+    vectors = random_vectors(10)
+    index = LocalVectorIndex(str(tmp_path / "index"))
+    index.add(docs_for(vectors) + docs_for(vectors[:2], prefix="r/b.py"))
+    # Same (filepath, chunk_id): the new vector replaces the old one
+    index.add([{"filepath": "r/a.py", "chunk_id": 0, "content": "new", "embedding": vectors[5]}])
+    assert len(index) == 12
+    assert [doc["content"] for doc in index.search(vectors[5], 2)] == ["new", "chunk 5"]
+    assert index.delete(filepaths=["r/b.py"]) == 2
+    assert len(index) == 10
+    assert all(doc["filepath"] == "r/a.py" for doc in index.search(vectors[0], 10))
+    assert [doc["content"] for doc in index.get([("r/a.py", 0), ("r/b.py", 1)])] == ["new"]
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_local_index_save_and_load_round_trip(tmp_path, dtype):
+    vectors = random_vectors(200)
+    index = LocalVectorIndex(str(tmp_path / "index"), dtype=dtype)
+    index.add(docs_for(vectors))
+    index.delete(filepaths=[])
+    index.add([{"filepath": "r/a.py", "chunk_id": 199, "content": "replaced", "embedding": vectors[0]}])
+    index.save()
+
+    loaded = LocalVectorIndex(str(tmp_path / "index"), dtype=dtype)
+    assert len(loaded) == 200
+    vectors[199] = vectors[0]
+    query = random_vectors(1, seed=4)[0]
+    expected, scores = cosine_top_k(vectors, query, 5)
+    found = loaded.search(query, 5)
+    assert [doc["chunk_id"] for doc in found] == expected
+    # float16 and int8 candidates are rescored against the float32 vectors
+    assert np.allclose([doc["score"] for doc in found], scores, atol=1e-5)
+    assert loaded.get([("r/a.py", 199)])[0]["content"] == "replaced"
+
+    # Rows added after a save are searched alongside the saved ones
+    loaded.add([{"filepath": "r/c.py", "chunk_id": 0, "content": "late", "embedding": query}])
+    assert loaded.search(query, 1)[0]["content"] == "late"
+
+
+def test_local_index_ivf_with_every_list_probed_is_exact(tmp_path):
+    vectors = random_vectors(400, seed=2)
+    index = LocalVectorIndex(str(tmp_path / "index"), ivf_threshold=100, nprobe=4096)
+    index.add(docs_for(vectors))
+    index.save()
+    assert index.ivf is not None
+    queries = random_vectors(3, seed=5)
+    for query, found in zip(queries, index.search_batch(queries, 8)):
+        assert [doc["chunk_id"] for doc in found] == cosine_top_k(vectors, query, 8)[0]
@@ -0,0 +1,50 @@
+import threading
+import tiktoken
+
+from config import TOKEN_ENCODING, TOKENIZER_THREADS
+
+# Shared tokenization: the encoder is loaded once per process, and callers
+# carry token counts alongside text instead of re-encoding it.
+
+_encoding = None
+_lock = threading.Lock()
+
+
+def get_encoding():
+    global _encoding
+    if _encoding is None:
+        with _lock:
+            if _encoding is None:
+                _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+    return _encoding
+
+
+def encode(text: str) -> list[int]:
+    # Source code may legitimately contain strings like "<|endoftext|>"
+    return get_encoding().encode(text, disallowed_special=())
+
+
+def count_tokens(text: str) -> int:
+    return len(encode(text))
+
+
+def count_tokens_batch(texts: list[str], num_threads: int = TOKENIZER_THREADS) -> list[int]:
+    """
+    Token counts for many texts in one call; tiktoken encodes them on a thread
+    pool with the GIL released.
+    """
+    if len(texts) < 4 * num_threads:
+        # Not worth spinning up tiktoken's per-call thread pool
+        return [count_tokens(text) for text in texts]
+    tokens = get_encoding().encode_batch(texts, num_threads=num_threads, disallowed_special=())
+    return [len(t) for t in tokens]
+
+
+def truncate(text: str, max_tokens: int) -> tuple[str, int]:
+    """
+    Returns (text cut to at most `max_tokens`, its token count), encoding once.
+    """
+    tokens = encode(text)
+    if len(tokens) <= max_tokens:
+        return text, len(tokens)
+    return get_encoding().decode(tokens[:max_tokens]), max_tokens
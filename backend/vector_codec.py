@@ -0,0 +1,87 @@
+import numpy as np
+from bson.binary import Binary, BinaryVectorDtype
+
+from config import EMBED_STORAGE
+
+# How embeddings are stored in chunk documents (EMBED_STORAGE):
+#   "array"    BSON array of doubles: ~13 bytes per dimension (legacy)
+#   "float32"  BSON binary vector: 4 bytes per dimension, lossless
+#   "int8"     BSON binary int8 vector in `embedding` (what $vectorSearch
+#              indexes, 1 byte per dimension) plus its per-vector scale in
+#              `embedding_scale`, and the float32 vector in `embedding_full`
+#              for rescoring candidates (not indexed)
+# Cosine similarity ignores per-vector scale, so the int8 codes can be
+# searched directly; the scale is only needed to dequantize.
+
+STORAGE_MODES = ("array", "float32", "int8")
+
+_HEADER = 2  # binary vector header: dtype byte, padding byte
+
+
+def quantize_int8(vectors):
+    """
+    Symmetric per-row scalar quantization. Returns (codes, scales) with
+    vectors ~= codes * scales[:, None].
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes, scales):
+    return codes.astype(np.float32) * np.asarray(scales, dtype=np.float32)[:, None]
+
+
+def _binary(vector, dtype):
+    vector = np.asarray(vector)
+    header = (BinaryVectorDtype.INT8 if dtype == np.int8 else BinaryVectorDtype.FLOAT32).value + b"\x00"
+    return Binary(header + vector.astype(dtype).tobytes(), subtype=9)
+
+
+def _from_binary(value, dtype):
+    return np.frombuffer(bytes(value)[_HEADER:], dtype=dtype)
+
+
+def embedding_fields(embedding, storage: str = EMBED_STORAGE) -> dict:
+    """
+    The embedding fields of a chunk document for the given storage mode.
+    """
+    if storage == "float32":
+        return {"embedding": _binary(embedding, np.float32)}
+    if storage == "int8":
+        codes, scales = quantize_int8(embedding)
+        return {
+            "embedding": _binary(codes[0], np.int8),
+            "embedding_scale": float(scales[0]),
+            "embedding_full": _binary(embedding, np.float32),
+        }
+    return {"embedding": [float(v) for v in embedding]}
+
+
+def decode_embedding(doc):
+    """
+    The best float32 vector a stored document has, whatever its storage mode.
+    """
+    if isinstance(doc.get("embedding_full"), bytes):
+        return _from_binary(doc["embedding_full"], np.float32)
+    embedding = doc["embedding"]
+    if not isinstance(embedding, bytes):
+        return np.asarray(embedding, dtype=np.float32)
+    if bytes(embedding[:1]) == BinaryVectorDtype.INT8.value:
+        return dequantize_int8(_from_binary(embedding, np.int8)[None, :], [doc.get("embedding_scale", 1.0)])[0]
+    return _from_binary(embedding, np.float32)
+
+
+def query_vector(vector, storage: str = EMBED_STORAGE):
+    """
+    The `queryVector` for $vectorSearch, in the same representation as the
+    indexed field.
+    """
+    if storage == "float32":
+        return _binary(vector, np.float32)
+    if storage == "int8":
+        codes, _ = quantize_int8(vector)
+        return _binary(codes[0], np.int8)
+    return [float(v) for v in vector]
@@ -1,32 +1,23 @@
-from pymongo import MongoClient
-import os
+import sys
 from dotenv import load_dotenv
-import certifi
-from embedding import get_embedding
+from embedding import get_question_embedding
+from retrieval import get_retriever
+from resources import get_db
+from index_meta import get_repo_index
 
 load_dotenv()
-client = MongoClient(os.getenv("MONGODB_URI"), tlsCAFile=certifi.where())
-collection = client["unrepo"]["code_chunks"]
+collection = get_db()["code_chunks"]
+retriever = get_retriever(collection)
 
-def semantic_search(query: str, k: int = 5):
-    embedding = get_embedding(query).values
-    print("")
-    results = collection.aggregate([
-        {
-            "$vectorSearch": {
-                "index": "default",  # Make sure this matches your actual index name
-                "path": "embedding",
-                "queryVector": embedding,
-                "numCandidates": 100,
-                "limit": k
-            }
-        }
-    ])
-    print(list(results))
-    return list(results)
+def semantic_search(query: str, k: int = 5, repo_id: str = None):
+    embedding = get_question_embedding(query)
+    # Only the live build of a repo, not one being written
+    version = (get_repo_index(repo_id) or {}).get("version") if repo_id else None
+    return retriever.search(repo_id, embedding, limit=k, num_candidates=100, version=version)
 
 if __name__ == "__main__":
-    query = "authentication middleware"
-    results = semantic_search(query)
+    query = sys.argv[1] if len(sys.argv) > 1 else "authentication middleware"
+    repo_id = sys.argv[2] if len(sys.argv) > 2 else None
+    results = semantic_search(query, repo_id=repo_id)
     for r in results:
-        print(f"\n📄 {r['filepath']} ({r['language']})\n---\n{r['content'][:500]}\n---")
+        print(f"\n📄 {r['filepath']} ({r['language']}, score {r['score']:.3f})\n---\n{r['content'][:500]}\n---")
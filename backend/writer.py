@@ -0,0 +1,139 @@
+import time
+import queue
+import hashlib
+import logging
+import threading
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config import WRITE_FLUSH_SIZE, WRITE_FLUSH_INTERVAL, WRITE_QUEUE_SIZE
+from metrics import Counter, Histogram
+
+logger = logging.getLogger("uvicorn")
+
+# Fields that identify a chunk document; re-writing the same content within
+# a build upserts onto the same document instead of inserting a duplicate,
+# while a new build (version) never touches the live one's documents.
+CHUNK_KEY = ("repo_id", "version", "filepath", "chunk_id", "content_hash")
+
+_STOP = object()
+
+INSERT_BATCH_SECONDS = Histogram("unrepo_insert_batch_seconds", "Latency of chunk bulk writes to Mongo")
+CHUNK_WRITES = Counter("unrepo_chunk_writes_total", "Chunk documents written to Mongo, by result", ("result",))
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def ensure_chunk_indexes(collection):
+    existing = collection.index_information().get("chunk_key")
+    if existing and [field for field, _ in existing["key"]] != list(CHUNK_KEY):
+        # The key from before versioned builds would reject a new build's copy of a chunk
+        collection.drop_index("chunk_key")
+    # Partial so that legacy documents written without a key don't collide
+    collection.create_index(
+        [(field, 1) for field in CHUNK_KEY],
+        unique=True,
+        name="chunk_key",
+        partialFilterExpression={"content_hash": {"$exists": True}},
+    )
+    collection.create_index([("repo_id", 1), ("version", 1)], name="repo_version")
+
+
+class ChunkWriter:
+    """
+    Background writer stage for chunk documents.
+
+    `add()` hands documents to a bounded queue; a writer thread buffers them and
+    flushes unordered bulk upserts every `flush_size` documents or
+    `flush_interval` seconds, so Mongo writes overlap with embedding. Use as a
+    context manager, or call `close()` to flush the tail and stop the thread.
+    """
+
+    def __init__(self, collection, flush_size=WRITE_FLUSH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL, queue_size=WRITE_QUEUE_SIZE):
+        self.collection = collection
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = {"batches": 0, "written": 0, "upserted": 0, "modified": 0, "failed": 0, "failed_batches": 0}
+        self.errors = []
+        self.thread = threading.Thread(target=self._run, name="chunk-writer", daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add(self, doc: dict):
+        if "content_hash" not in doc:
+            doc["content_hash"] = content_hash(doc["content"])
+        # Blocks when the writer falls behind, applying backpressure upstream
+        self.queue.put(doc)
+
+    def close(self):
+        self.queue.put(_STOP)
+        self.thread.join()
+        logger.info(
+            f"💾 Wrote {self.stats['written']} chunks in {self.stats['batches']} batches "
+            f"({self.stats['upserted']} new, {self.stats['modified']} updated, {self.stats['failed']} failed)"
+        )
+
+    def _run(self):
+        buffer = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                doc = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                doc = None
+
+            if doc is _STOP:
+                self._flush(buffer)
+                return
+            if doc is not None:
+                buffer.append(doc)
+
+            if len(buffer) >= self.flush_size or time.monotonic() >= deadline:
+                self._flush(buffer)
+                buffer = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, docs: list[dict]):
+        if not docs:
+            return
+        ops = [
+            UpdateOne({field: doc[field] for field in CHUNK_KEY}, {"$set": doc}, upsert=True)
+            for doc in docs
+        ]
+        self.stats["batches"] += 1
+        written, failed = self.stats["written"], self.stats["failed"]
+        start = time.perf_counter()
+        try:
+            result = self.collection.bulk_write(ops, ordered=False)
+            self._record(len(docs), result.bulk_api_result)
+        except BulkWriteError as e:
+            # Unordered: everything except the reported writeErrors went through
+            details = e.details
+            failed = len(details.get("writeErrors", []))
+            self._record(len(docs) - failed, details)
+            self.stats["failed"] += failed
+            self.stats["failed_batches"] += 1
+            self.errors.extend(err.get("errmsg", "") for err in details.get("writeErrors", [])[:5])
+            logger.warning(f"❌ {failed}/{len(docs)} chunk writes failed in batch {self.stats['batches']}")
+        except Exception as e:
+            self.stats["failed"] += len(docs)
+            self.stats["failed_batches"] += 1
+            self.errors.append(str(e))
+            logger.warning(f"❌ Failed to write batch {self.stats['batches']} ({len(docs)} chunks): {e}")
+        finally:
+            INSERT_BATCH_SECONDS.observe(time.perf_counter() - start)
+            CHUNK_WRITES.inc(self.stats["written"] - written, result="written")
+            CHUNK_WRITES.inc(self.stats["failed"] - failed, result="failed")
+
+    def _record(self, written: int, result: dict):
+        self.stats["written"] += written
+        self.stats["upserted"] += result.get("nUpserted", 0)
+        self.stats["modified"] += result.get("nModified", 0)